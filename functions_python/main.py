@@ -1,19 +1,28 @@
 from firebase_admin import firestore, initialize_app, auth, storage
-from firebase_functions import https_fn, options
+from firebase_functions import firestore_fn, https_fn, options
 import sendgrid
 from sendgrid.helpers.mail import Mail
 from mailersend import MailerSendClient, EmailBuilder, EmailContact
 import os
+import hashlib
 import json
+import operator
 import random
-from datetime import datetime, timedelta
+import time
+import warnings
+from datetime import datetime, timedelta, timezone
 from google.oauth2 import id_token as google_id_token
 from google.auth.transport import requests as google_requests
+from google.api_core.exceptions import AlreadyExists, NotFound
 from PIL import Image
 import piexif
 import io
 import base64
-from statistics import mean, median
+import csv
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
 # Sentry error monitoring
 import sentry_sdk
@@ -680,6 +689,298 @@ def _is_admin(decoded_token):
     return custom_claims == "team-member"
 
 
+# The achievements collection is a small, rarely changing catalog (see
+# scripts/init_achievements.py), so warm instances keep it in memory. Once the
+# TTL lapses we only read config/achievements_catalog; the collection itself is
+# re-streamed when its "version" field has changed (or when no version
+# document exists).
+ACHIEVEMENT_CATALOG_TTL_SECONDS = 300
+_achievement_catalog_cache = {"achievements": None, "version": None, "checkedAt": 0.0}
+
+
+def _get_achievement_catalog(db, force_refresh=False):
+    """Return (catalog, reads) where catalog maps achievement id -> details.
+
+    The returned dicts are shared with the cache; copy before mutating.
+    """
+    cache = _achievement_catalog_cache
+    now = time.monotonic()
+    if (
+        not force_refresh
+        and cache["achievements"] is not None
+        and now - cache["checkedAt"] < ACHIEVEMENT_CATALOG_TTL_SECONDS
+    ):
+        return cache["achievements"], 0
+
+    reads = 1
+    version_doc = db.collection("config").document("achievements_catalog").get()
+    version = (version_doc.to_dict() or {}).get("version") if version_doc.exists else None
+    if (
+        not force_refresh
+        and cache["achievements"] is not None
+        and version is not None
+        and version == cache["version"]
+    ):
+        cache["checkedAt"] = now
+        return cache["achievements"], reads
+
+    achievements = {}
+    for doc in db.collection("achievements").stream():
+        achievement_data = doc.to_dict()
+        achievement_data["id"] = doc.id
+        achievements[doc.id] = achievement_data
+    reads += max(len(achievements), 1)
+
+    cache["achievements"] = achievements
+    cache["version"] = version
+    cache["checkedAt"] = now
+    return achievements, reads
+
+
+# The leaderboard is materialized rather than computed per request:
+#   leaderboard_entries/{userId} - running point total plus denormalized
+#                                  profile fields for every user with an award
+#   leaderboards/global          - the top LEADERBOARD_SNAPSHOT_SIZE entries,
+#                                  so a page view is a single document read
+# Both are updated when an award is written; handleRebuildLeaderboard
+# recomputes them from user_achievements.
+LEADERBOARD_SNAPSHOT_SIZE = 100
+LEADERBOARD_DEFAULT_LIMIT = 50
+
+# Firestore allows at most 500 writes per batch
+FIRESTORE_BATCH_LIMIT = 500
+
+
+def _leaderboard_profile_fields(profile_data):
+    """Pick the profile fields shown on the leaderboard."""
+    profile_data = profile_data or {}
+    return {
+        "displayName": profile_data.get("displayName", "Anonymous User"),
+        "username": profile_data.get("username", ""),
+        "avatarUrl": profile_data.get("avatarUrl", ""),
+    }
+
+
+def _leaderboard_sort_key(entry):
+    """Order by points descending, breaking ties by userId."""
+    return (-entry.get("totalPoints", 0), entry.get("userId", ""))
+
+
+def _leaderboard_public_entry(data):
+    """Shape a stored leaderboard entry for API responses."""
+    return {
+        "userId": data.get("userId"),
+        "displayName": data.get("displayName", "Anonymous User"),
+        "username": data.get("username", ""),
+        "avatarUrl": data.get("avatarUrl", ""),
+        "totalPoints": data.get("totalPoints", 0),
+        "achievementCount": data.get("achievementCount", 0),
+    }
+
+
+def _refresh_leaderboard_snapshot(db, *user_ids):
+    """Merge users' current leaderboard entries into leaderboards/global.
+
+    Best-effort: the per-user entries are the source of truth and the snapshot
+    can always be rebuilt, so failures are reported but not raised.
+    """
+    if not user_ids:
+        return
+    entry_refs = [db.collection("leaderboard_entries").document(uid) for uid in user_ids]
+    snapshot_ref = db.collection("leaderboards").document("global")
+
+    @firestore.transactional
+    def _merge(transaction):
+        entry_docs = [d for d in transaction.get_all(entry_refs) if d.exists]
+        snapshot_doc = snapshot_ref.get(transaction=transaction)
+        if not entry_docs:
+            return
+        entries = (snapshot_doc.to_dict() or {}).get("entries", []) if snapshot_doc.exists else []
+        entries = [e for e in entries if e.get("userId") not in user_ids]
+        entries.extend(_leaderboard_public_entry(d.to_dict()) for d in entry_docs)
+        entries.sort(key=_leaderboard_sort_key)
+        transaction.set(
+            snapshot_ref,
+            {
+                "entries": entries[:LEADERBOARD_SNAPSHOT_SIZE],
+                "updatedAt": firestore.SERVER_TIMESTAMP,
+            },
+        )
+
+    try:
+        _merge(db.transaction())
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+
+
+def _leaderboard_entry_increment(user_id, profile_data, points, count):
+    """Merge payload crediting points and awards to a leaderboard entry."""
+    return {
+        "userId": user_id,
+        **_leaderboard_profile_fields(profile_data),
+        "totalPoints": firestore.Increment(points),
+        "achievementCount": firestore.Increment(count),
+        "updatedAt": firestore.SERVER_TIMESTAMP,
+    }
+
+
+def _award_doc_id(user_id, achievement_id):
+    """Deterministic user_achievements document ID for one award."""
+    return f"{user_id}_{achievement_id}"
+
+
+def _held_awards(db, pairs):
+    """Return the (userId, achievementId) pairs that are already awarded.
+
+    Only the candidate award documents are fetched, in batched reads.
+    """
+    pairs = list(dict.fromkeys(pairs))
+    held = set()
+    for i in range(0, len(pairs), 100):
+        refs = [
+            db.collection("user_achievements").document(_award_doc_id(user_id, achievement_id))
+            for user_id, achievement_id in pairs[i:i + 100]
+        ]
+        for award_doc in db.get_all(refs):
+            if award_doc.exists:
+                award = award_doc.to_dict() or {}
+                held.add((award.get("userId"), award.get("achievementId")))
+    return held
+
+
+def _held_achievement_ids(db, user_id, achievement_ids):
+    """Return which of the given achievements one user already holds."""
+    held = _held_awards(db, [(user_id, a) for a in achievement_ids])
+    return {achievement_id for _, achievement_id in held}
+
+
+def _get_profile_data(db, user_id):
+    """The user's profile document data, or {} when there is none."""
+    profile_doc = db.collection("users").document(user_id).get()
+    return (profile_doc.to_dict() or {}) if profile_doc.exists else {}
+
+
+def _record_award(db, user_id, achievement, award_data, profile_data=None):
+    """Write a user_achievements record and credit the user's leaderboard entry.
+
+    The award is created under its deterministic ID, so the write itself is
+    the duplicate check: if the user already holds the achievement the whole
+    batch, including the point increment, is rejected and False is returned.
+    Pass profile_data when the caller already has it to skip the profile read.
+    """
+    if profile_data is None:
+        profile_data = _get_profile_data(db, user_id)
+
+    batch = db.batch()
+    batch.create(
+        db.collection("user_achievements").document(
+            _award_doc_id(user_id, award_data["achievementId"])
+        ),
+        award_data,
+    )
+    batch.set(
+        db.collection("leaderboard_entries").document(user_id),
+        _leaderboard_entry_increment(user_id, profile_data, achievement.get("points", 0), 1),
+        merge=True,
+    )
+    try:
+        batch.commit()
+    except AlreadyExists:
+        return False
+
+    _refresh_leaderboard_snapshot(db, user_id)
+    return True
+
+
+def _commit_awards(db, awards):
+    """Record many new awards with batched writes.
+
+    awards is a list of (userId, achievement, award_data). Each user's awards
+    and their single leaderboard increment share a batch. If a batch loses a
+    race with another writer it is retried award by award through
+    _record_award. Returns the (userId, achievementId) pairs written.
+    """
+    by_user = {}
+    for user_id, achievement, award_data in awards:
+        by_user.setdefault(user_id, []).append((achievement, award_data))
+    user_ids = list(by_user)
+
+    profiles = {}
+    for i in range(0, len(user_ids), 100):
+        refs = [db.collection("users").document(uid) for uid in user_ids[i:i + 100]]
+        for profile_doc in db.get_all(refs):
+            if profile_doc.exists:
+                profiles[profile_doc.id] = profile_doc.to_dict()
+
+    written = set()
+    batched_users = set()
+
+    def _flush(chunk):
+        batch = db.batch()
+        for uid in chunk:
+            points = 0
+            for achievement, award_data in by_user[uid]:
+                batch.create(
+                    db.collection("user_achievements").document(
+                        _award_doc_id(uid, award_data["achievementId"])
+                    ),
+                    award_data,
+                )
+                points += achievement.get("points", 0)
+            batch.set(
+                db.collection("leaderboard_entries").document(uid),
+                _leaderboard_entry_increment(uid, profiles.get(uid), points, len(by_user[uid])),
+                merge=True,
+            )
+        try:
+            batch.commit()
+        except AlreadyExists:
+            for uid in chunk:
+                for achievement, award_data in by_user[uid]:
+                    if _record_award(db, uid, achievement, award_data, profiles.get(uid) or {}):
+                        written.add((uid, award_data["achievementId"]))
+            return
+        for uid in chunk:
+            batched_users.add(uid)
+            for _, award_data in by_user[uid]:
+                written.add((uid, award_data["achievementId"]))
+
+    chunk, chunk_writes = [], 0
+    for uid in user_ids:
+        # One create per award plus the leaderboard increment
+        writes = len(by_user[uid]) + 1
+        if chunk and chunk_writes + writes > FIRESTORE_BATCH_LIMIT:
+            _flush(chunk)
+            chunk, chunk_writes = [], 0
+        chunk.append(uid)
+        chunk_writes += writes
+    if chunk:
+        _flush(chunk)
+
+    _refresh_leaderboard_snapshot(db, *batched_users)
+    return written
+
+
+def _sync_leaderboard_profile(db, user_id, profile_data):
+    """Copy changed display fields onto an existing leaderboard entry."""
+    fields = {
+        key: profile_data[key]
+        for key in ("displayName", "username", "avatarUrl")
+        if key in profile_data
+    }
+    if not fields:
+        return
+    try:
+        db.collection("leaderboard_entries").document(user_id).update(fields)
+    except NotFound:
+        # User has no awards yet, so they are not on the leaderboard
+        return
+    _refresh_leaderboard_snapshot(db, user_id)
+
+
 @https_fn.on_request(cors=CORS_OPTIONS)
 def handleGetProfile(req: https_fn.Request) -> https_fn.Response:
     """Retrieve a user's profile and achievements."""
@@ -706,31 +1007,59 @@ def handleGetProfile(req: https_fn.Request) -> https_fn.Response:
             return https_fn.Response("Profile not found", status=404)
 
         profile_data = profile_doc.to_dict()
+        firestore_reads = 1
 
         # Get user achievements
         achievements_query = (
             db.collection("user_achievements").where("userId", "==", user_id).stream()
         )
-        user_achievements = []
+        earned = [ach_doc.to_dict() for ach_doc in achievements_query]
+        # An empty query result is still billed as one read
+        firestore_reads += max(len(earned), 1)
+
+        # Resolve achievement details from the cached catalog; anything added
+        # since the catalog was loaded is picked up with a single batched fetch
+        # instead of one round trip per badge
+        achievement_ids = list(dict.fromkeys(a["achievementId"] for a in earned))
+        achievement_details_by_id = {}
+        if achievement_ids:
+            catalog, catalog_reads = _get_achievement_catalog(db)
+            firestore_reads += catalog_reads
+            achievement_details_by_id = {
+                achievement_id: catalog[achievement_id]
+                for achievement_id in achievement_ids
+                if achievement_id in catalog
+            }
+        missing_ids = [a for a in achievement_ids if a not in achievement_details_by_id]
+        if missing_ids:
+            achievement_refs = [
+                db.collection("achievements").document(achievement_id)
+                for achievement_id in missing_ids
+            ]
+            for achievement_doc in db.get_all(achievement_refs):
+                if achievement_doc.exists:
+                    achievement_details_by_id[achievement_doc.id] = achievement_doc.to_dict()
+            firestore_reads += len(achievement_refs)
 
-        for ach_doc in achievements_query:
-            ach_data = ach_doc.to_dict()
-            # Get achievement details
-            achievement_ref = db.collection("achievements").document(
-                ach_data["achievementId"]
+        user_achievements = []
+        for ach_data in earned:
+            if ach_data["achievementId"] not in achievement_details_by_id:
+                continue
+            achievement_details = dict(achievement_details_by_id[ach_data["achievementId"]])
+            achievement_details.pop("id", None)
+            # Convert dateEarned to Firestore-like format if it's a datetime
+            date_earned = ach_data.get("dateEarned")
+            achievement_details["dateEarned"] = (
+                ts_to_dict(date_earned) if date_earned else None
             )
-            achievement_doc = achievement_ref.get()
-            if achievement_doc.exists:
-                achievement_details = achievement_doc.to_dict()
-                # Convert dateEarned to Firestore-like format if it's a datetime
-                date_earned = ach_data.get("dateEarned")
-                achievement_details["dateEarned"] = (
-                    ts_to_dict(date_earned) if date_earned else None
-                )
-                user_achievements.append(achievement_details)
+            user_achievements.append(achievement_details)
 
         # Combine profile with achievements
-        result = {**profile_data, "achievements": user_achievements}
+        result = {
+            **profile_data,
+            "achievements": user_achievements,
+            "firestoreReads": firestore_reads,
+        }
 
         return https_fn.Response(
             json.dumps(result, default=ts_to_dict),
@@ -923,6 +1252,15 @@ def handleUpdateProfile(req: https_fn.Request) -> https_fn.Response:
         # Add/update timestamp
         profile_data["lastUpdated"] = firestore.SERVER_TIMESTAMP
 
+        # Keep the denormalized leaderboard display fields in step
+        try:
+            _sync_leaderboard_profile(db, user_id, profile_data)
+        except Exception as e:
+            try:
+                sentry_sdk.capture_exception(e)
+            except Exception:
+                pass
+
         # Update profile document
         profile_ref = db.collection("users").document(user_id)
         profile_ref.set(profile_data, merge=True)
@@ -948,14 +1286,8 @@ def handleGetAchievements(req: https_fn.Request) -> https_fn.Response:
     try:
         db = firestore.client()
 
-        # Get all achievements
-        achievements_query = db.collection("achievements").stream()
-        achievements = []
-
-        for doc in achievements_query:
-            achievement_data = doc.to_dict()
-            achievement_data["id"] = doc.id
-            achievements.append(achievement_data)
+        catalog, _ = _get_achievement_catalog(db)
+        achievements = [dict(achievement) for achievement in catalog.values()]
 
         return https_fn.Response(
             json.dumps(achievements, default=str),
@@ -999,21 +1331,10 @@ def handleAssignAchievement(req: https_fn.Request) -> https_fn.Response:
         db = firestore.client()
 
         # Verify achievement exists
-        achievement_doc = db.collection("achievements").document(achievement_id).get()
-        if not achievement_doc.exists:
+        catalog, _ = _get_achievement_catalog(db)
+        if achievement_id not in catalog:
             return https_fn.Response("Achievement not found", status=404)
 
-        # Check if user already has this achievement
-        existing_query = (
-            db.collection("user_achievements")
-            .where("userId", "==", user_id)
-            .where("achievementId", "==", achievement_id)
-            .limit(1)
-            .stream()
-        )
-        if any(existing_query):
-            return https_fn.Response("User already has this achievement", status=400)
-
         # Create user achievement record
         user_achievement_data = {
             "userId": user_id,
@@ -1022,7 +1343,8 @@ def handleAssignAchievement(req: https_fn.Request) -> https_fn.Response:
             "assignedBy": decoded_token["uid"],
         }
 
-        db.collection("user_achievements").add(user_achievement_data)
+        if not _record_award(db, user_id, catalog[achievement_id], user_achievement_data):
+            return https_fn.Response("User already has this achievement", status=400)
 
         return https_fn.Response("Achievement assigned successfully", status=200)
 
@@ -1030,30 +1352,329 @@ def handleAssignAchievement(req: https_fn.Request) -> https_fn.Response:
         return https_fn.Response(f"An error occurred: {e}", status=500)
 
 
+MAX_BULK_ASSIGNMENT_ROWS = 2000
+
+
+def _parse_bulk_assignments(req):
+    """Return a list of (userId, achievementId) rows from a bulk request.
+
+    Accepts a JSON body with "assignments" ([{"userId", "achievementId"}]),
+    "userIds" x "achievementIds", or "csv"; or a raw text/csv body. CSV needs
+    userId and achievementId columns. Raises ValueError on a malformed body.
+    """
+    data = req.get_json(silent=True)
+    csv_text = None
+    if isinstance(data, dict):
+        if isinstance(data.get("assignments"), list):
+            return [
+                (
+                    str(row.get("userId") or "").strip() if isinstance(row, dict) else "",
+                    str(row.get("achievementId") or "").strip() if isinstance(row, dict) else "",
+                )
+                for row in data["assignments"]
+            ]
+        if isinstance(data.get("userIds"), list) and isinstance(data.get("achievementIds"), list):
+            return [
+                (str(user_id).strip(), str(achievement_id).strip())
+                for user_id in data["userIds"]
+                for achievement_id in data["achievementIds"]
+            ]
+        csv_text = data.get("csv")
+    elif data is None:
+        csv_text = req.get_data(as_text=True)
+
+    if not isinstance(csv_text, str) or not csv_text.strip():
+        raise ValueError("Provide assignments, userIds and achievementIds, or CSV rows")
+    reader = csv.DictReader(io.StringIO(csv_text.strip()))
+    if not reader.fieldnames or not {"userId", "achievementId"} <= set(reader.fieldnames):
+        raise ValueError("CSV must have userId and achievementId columns")
+    return [
+        ((row.get("userId") or "").strip(), (row.get("achievementId") or "").strip())
+        for row in reader
+    ]
+
+
+def _is_document_id(value):
+    """True when value can be used as a single Firestore document ID."""
+    return (
+        "/" not in value
+        and value not in (".", "..")
+        and not (value.startswith("__") and value.endswith("__"))
+    )
+
+
+@https_fn.on_request(cors=CORS_OPTIONS)
+def handleBulkAssignAchievements(req: https_fn.Request) -> https_fn.Response:
+    """Assign many achievements in one request (admins only).
+
+    Rows are validated against the cached catalog and deduplicated, existing
+    awards are checked with batched reads, and new awards are committed in
+    WriteBatch chunks. The response has one result per input row.
+    """
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "POST":
+        return https_fn.Response("Method not allowed", status=405)
+
+    # Verify authentication and admin role
+    decoded_token, auth_error = _get_user_from_token(req)
+    if auth_error:
+        return auth_error
+
+    if not _is_admin(decoded_token):
+        return https_fn.Response("Forbidden: Admin role required", status=403)
+
+    try:
+        rows = _parse_bulk_assignments(req)
+    except ValueError as ve:
+        return https_fn.Response(str(ve), status=400)
+    if not rows:
+        return https_fn.Response("No assignments provided", status=400)
+    if len(rows) > MAX_BULK_ASSIGNMENT_ROWS:
+        return https_fn.Response(
+            f"At most {MAX_BULK_ASSIGNMENT_ROWS} assignments per request", status=400
+        )
+
+    try:
+        db = firestore.client()
+        catalog, _ = _get_achievement_catalog(db)
+
+        results = []
+        first_row = {}
+        for index, (user_id, achievement_id) in enumerate(rows):
+            result = {"row": index + 1, "userId": user_id, "achievementId": achievement_id}
+            if not user_id or not achievement_id:
+                result["status"] = "invalid"
+            elif not _is_document_id(user_id) or not _is_document_id(achievement_id):
+                result["status"] = "invalid_id"
+            elif achievement_id not in catalog:
+                result["status"] = "unknown_achievement"
+            elif (user_id, achievement_id) in first_row:
+                result["status"] = "duplicate"
+            else:
+                first_row[(user_id, achievement_id)] = index
+            results.append(result)
+
+        held = _held_awards(db, list(first_row))
+        awards = []
+        for (user_id, achievement_id), index in first_row.items():
+            if (user_id, achievement_id) in held:
+                results[index]["status"] = "already_held"
+                continue
+            awards.append(
+                (
+                    user_id,
+                    catalog[achievement_id],
+                    {
+                        "userId": user_id,
+                        "achievementId": achievement_id,
+                        "dateEarned": firestore.SERVER_TIMESTAMP,
+                        "assignedBy": decoded_token["uid"],
+                    },
+                )
+            )
+
+        written = _commit_awards(db, awards) if awards else set()
+        for user_id, _, award_data in awards:
+            index = first_row[(user_id, award_data["achievementId"])]
+            results[index]["status"] = (
+                "assigned" if (user_id, award_data["achievementId"]) in written else "already_held"
+            )
+
+        summary = {}
+        for result in results:
+            summary[result["status"]] = summary.get(result["status"], 0) + 1
+
+        return https_fn.Response(
+            json.dumps({"summary": summary, "results": results}, default=str),
+            status=200,
+            headers={"Content-Type": "application/json"},
+        )
+
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+
+def _leaderboard_query(db):
+    """Query over leaderboard_entries in leaderboard order."""
+    return (
+        db.collection("leaderboard_entries")
+        .order_by("totalPoints", direction=firestore.Query.DESCENDING)
+        .order_by("userId")
+    )
+
+
+def _encode_leaderboard_cursor(entry, rank):
+    """Opaque page cursor: the last entry's sort key plus its rank."""
+    payload = json.dumps([entry.get("totalPoints", 0), entry.get("userId"), rank])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def _decode_leaderboard_cursor(cursor):
+    """Return (totalPoints, userId, rank) or raise ValueError."""
+    try:
+        points, user_id, rank = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(user_id, str) or not isinstance(rank, int):
+        raise ValueError("Invalid cursor")
+    return points, user_id, rank
+
+
+def _count_query(query, transaction=None):
+    """Run a Firestore count aggregation and return the integer result."""
+    return int(query.count().get(transaction=transaction)[0][0].value)
+
+
+def _leaderboard_rank(db, user_id, snapshot_entries):
+    """Return (entry, rank) for one user without sorting the population.
+
+    Users in the snapshot are ranked from it directly; anyone else is ranked
+    by counting the entries ahead of them on the ordered points index.
+    """
+    for i, entry in enumerate(snapshot_entries):
+        if entry.get("userId") == user_id:
+            return entry, i + 1
+
+    entry_doc = db.collection("leaderboard_entries").document(user_id).get()
+    if not entry_doc.exists:
+        return None, None
+    entry = entry_doc.to_dict()
+    points = entry.get("totalPoints", 0)
+    entries = db.collection("leaderboard_entries")
+    ahead = _count_query(entries.where("totalPoints", ">", points))
+    tied_ahead = _count_query(
+        entries.where("totalPoints", "==", points).where("userId", "<", user_id)
+    )
+    return entry, ahead + tied_ahead + 1
+
+
 @https_fn.on_request(cors=CORS_OPTIONS)
 def handleGetLeaderboard(req: https_fn.Request) -> https_fn.Response:
-    """Get user leaderboard sorted by achievement points."""
+    """Get user leaderboard sorted by achievement points.
+
+    Without parameters this returns the top 50 as a plain list. Query params:
+      - limit, cursor: return {"entries": [...], "nextCursor": ...} pages
+      - userId: return that user's entry and rank
+    """
     if req.method == "OPTIONS":
         return https_fn.Response("", status=204)
     if req.method != "GET":
         return https_fn.Response("Method not allowed", status=405)
 
+    limit_param = req.args.get("limit")
+    cursor = req.args.get("cursor")
+    rank_user_id = req.args.get("userId")
+    paged = limit_param is not None or cursor is not None
+
+    limit = LEADERBOARD_DEFAULT_LIMIT
+    if limit_param is not None:
+        try:
+            limit = int(limit_param)
+        except ValueError:
+            return https_fn.Response("limit must be an integer", status=400)
+        if limit < 1 or limit > LEADERBOARD_SNAPSHOT_SIZE:
+            return https_fn.Response(
+                f"limit must be between 1 and {LEADERBOARD_SNAPSHOT_SIZE}", status=400
+            )
+
+    after = None
+    if cursor:
+        try:
+            after = _decode_leaderboard_cursor(cursor)
+        except ValueError as ve:
+            return https_fn.Response(str(ve), status=400)
+
     try:
         db = firestore.client()
 
-        # Get all user achievements and calculate total points
-        user_achievements = db.collection("user_achievements").stream()
-        achievements_data = {}
+        snapshot_doc = db.collection("leaderboards").document("global").get()
+        snapshot_entries = (
+            (snapshot_doc.to_dict() or {}).get("entries", []) if snapshot_doc.exists else None
+        )
+
+        if rank_user_id:
+            entry, rank = _leaderboard_rank(db, rank_user_id, snapshot_entries or [])
+            if entry is None:
+                return https_fn.Response("User not found on leaderboard", status=404)
+            return https_fn.Response(
+                json.dumps({**_leaderboard_public_entry(entry), "rank": rank}, default=str),
+                status=200,
+                headers={"Content-Type": "application/json"},
+            )
+
+        if after is None and snapshot_entries is not None:
+            page = snapshot_entries[:limit]
+            # The snapshot may be truncated, so a full page always gets a cursor
+            has_more = len(snapshot_entries) > limit or len(snapshot_entries) >= LEADERBOARD_SNAPSHOT_SIZE
+            first_rank = 1
+        else:
+            query = _leaderboard_query(db)
+            first_rank = 1
+            if after is not None:
+                points, last_user_id, last_rank = after
+                query = query.start_after({"totalPoints": points, "userId": last_user_id})
+                first_rank = last_rank + 1
+            docs = [doc.to_dict() for doc in query.limit(limit + 1).stream()]
+            page = docs[:limit]
+            has_more = len(docs) > limit
+
+        leaderboard = [_leaderboard_public_entry(entry) for entry in page]
+
+        # Add rank numbers
+        for i, user in enumerate(leaderboard):
+            user["rank"] = first_rank + i
+
+        if not paged:
+            return https_fn.Response(
+                json.dumps(leaderboard, default=str),
+                status=200,
+                headers={"Content-Type": "application/json"},
+            )
+
+        next_cursor = (
+            _encode_leaderboard_cursor(leaderboard[-1], leaderboard[-1]["rank"])
+            if has_more and leaderboard
+            else None
+        )
+        return https_fn.Response(
+            json.dumps({"entries": leaderboard, "nextCursor": next_cursor}, default=str),
+            status=200,
+            headers={"Content-Type": "application/json"},
+        )
+
+    except Exception as e:
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+
+@https_fn.on_request(cors=CORS_OPTIONS)
+def handleRebuildLeaderboard(req: https_fn.Request) -> https_fn.Response:
+    """Recompute the materialized leaderboard from user_achievements (admins only)."""
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "POST":
+        return https_fn.Response("Method not allowed", status=405)
+
+    decoded_token, auth_error = _get_user_from_token(req)
+    if auth_error:
+        return auth_error
+
+    if not _is_admin(decoded_token):
+        return https_fn.Response("Forbidden: Admin role required", status=403)
 
-        # First get all achievements to know their point values
-        for doc in db.collection("achievements").stream():
-            achievements_data[doc.id] = doc.to_dict()
+    try:
+        db = firestore.client()
+        achievements_data, _ = _get_achievement_catalog(db, force_refresh=True)
 
         # Calculate total points per user
         user_points = {}
         user_achievement_counts = {}
 
-        for doc in user_achievements:
+        for doc in db.collection("user_achievements").stream():
             data = doc.to_dict()
             user_id = data["userId"]
             achievement_id = data["achievementId"]
@@ -1068,52 +1689,235 @@ def handleGetLeaderboard(req: https_fn.Request) -> https_fn.Response:
                 )
                 user_achievement_counts[user_id] += 1
 
-        # Get user profile data for leaderboard display
-        leaderboard = []
-        for user_id, total_points in user_points.items():
-            try:
-                profile_doc = db.collection("users").document(user_id).get()
+        # Denormalize profile fields with batched reads
+        user_ids = list(user_points)
+        profiles = {}
+        for i in range(0, len(user_ids), 100):
+            refs = [db.collection("users").document(uid) for uid in user_ids[i:i + 100]]
+            for profile_doc in db.get_all(refs):
                 if profile_doc.exists:
-                    profile_data = profile_doc.to_dict()
-                    leaderboard.append(
-                        {
-                            "userId": user_id,
-                            "displayName": profile_data.get(
-                                "displayName", "Anonymous User"
-                            ),
-                            "username": profile_data.get("username", ""),
-                            "avatarUrl": profile_data.get("avatarUrl", ""),
-                            "totalPoints": total_points,
-                            "achievementCount": user_achievement_counts[user_id],
-                        }
-                    )
-            except Exception as e:
-                # Skip users with missing profiles
-                print(
-                    f"Warning: Skipping user {user_id} due to missing profile data: {str(e)}"
-                )
-                continue
+                    profiles[profile_doc.id] = profile_doc.to_dict()
 
-        # Sort by total points descending
-        leaderboard.sort(key=lambda x: x["totalPoints"], reverse=True)
-
-        # Limit to top 50 users
-        leaderboard = leaderboard[:50]
+        entries = []
+        for user_id, total_points in user_points.items():
+            entries.append(
+                {
+                    "userId": user_id,
+                    **_leaderboard_profile_fields(profiles.get(user_id)),
+                    "totalPoints": total_points,
+                    "achievementCount": user_achievement_counts[user_id],
+                }
+            )
 
-        # Add rank numbers
-        for i, user in enumerate(leaderboard):
-            user["rank"] = i + 1
+        for i in range(0, len(entries), FIRESTORE_BATCH_LIMIT):
+            batch = db.batch()
+            for entry in entries[i:i + FIRESTORE_BATCH_LIMIT]:
+                batch.set(
+                    db.collection("leaderboard_entries").document(entry["userId"]),
+                    {**entry, "updatedAt": firestore.SERVER_TIMESTAMP},
+                )
+            batch.commit()
+
+        # Drop entries for users who no longer hold any awards
+        stale_refs = [
+            doc.reference
+            for doc in db.collection("leaderboard_entries").stream()
+            if doc.id not in user_points
+        ]
+        for i in range(0, len(stale_refs), FIRESTORE_BATCH_LIMIT):
+            batch = db.batch()
+            for ref in stale_refs[i:i + FIRESTORE_BATCH_LIMIT]:
+                batch.delete(ref)
+            batch.commit()
+
+        entries.sort(key=_leaderboard_sort_key)
+        db.collection("leaderboards").document("global").set(
+            {
+                "entries": entries[:LEADERBOARD_SNAPSHOT_SIZE],
+                "updatedAt": firestore.SERVER_TIMESTAMP,
+            }
+        )
 
         return https_fn.Response(
-            json.dumps(leaderboard, default=str),
+            json.dumps({"message": "Leaderboard rebuilt", "users": len(entries)}),
             status=200,
             headers={"Content-Type": "application/json"},
         )
 
     except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
         return https_fn.Response(f"An error occurred: {e}", status=500)
 
 
+# Auto-award rules. Each rule names an achievement, the action types that can
+# earn it and conditions over the event's actionData; all conditions must hold.
+# A condition whose field is missing fails unless it supplies a "default".
+# config/achievement_rules {"rules": [...]} overrides these defaults.
+DEFAULT_ACHIEVEMENT_RULES = [
+    {"achievementId": "community_member", "actions": ["first_login", "profile_created"]},
+    {
+        "achievementId": "photographer",
+        "actions": ["photo_upload"],
+        "conditions": [{"field": "totalPhotos", "op": ">=", "value": 5, "default": 1}],
+    },
+    {
+        "achievementId": "fan_favorite",
+        "actions": ["photo_liked"],
+        "conditions": [{"field": "totalLikes", "op": ">=", "value": 10, "default": 1}],
+    },
+    {"achievementId": "first_race", "actions": ["race_completed"]},
+    {
+        "achievementId": "podium_finish",
+        "actions": ["race_completed"],
+        "conditions": [{"field": "finishPosition", "op": "<=", "value": 3}],
+    },
+    {
+        "achievementId": "speed_demon",
+        "actions": ["race_completed"],
+        # Lap times are stored in seconds
+        "conditions": [{"field": "fastestLap", "op": "<", "value": 120}],
+    },
+    {
+        "achievementId": "consistent_racer",
+        "actions": ["race_completed"],
+        "conditions": [{"field": "seasonRaces", "op": ">=", "value": 5}],
+    },
+    {
+        "achievementId": "clean_racer",
+        "actions": ["race_completed"],
+        "conditions": [{"field": "penalties", "op": "==", "value": 0}],
+    },
+    {
+        "achievementId": "track_master",
+        "actions": ["race_completed"],
+        "conditions": [
+            {"field": "finishPosition", "op": "==", "value": 1},
+            {"field": "isHomeTrack", "op": "==", "value": True},
+        ],
+    },
+    {
+        "achievementId": "season_veteran",
+        "actions": ["season_completed"],
+        "conditions": [{"field": "racesMissed", "op": "==", "value": 0}],
+    },
+]
+
+_RULE_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+_missing = object()
+_compiled_achievement_rules = {"byAction": None}
+
+
+def _compile_condition(condition):
+    """Turn one condition dict into a predicate over actionData."""
+    field = condition["field"]
+    compare = _RULE_OPERATORS.get(condition.get("op"))
+    if compare is None:
+        raise ValueError(f"Unknown rule operator: {condition.get('op')!r}")
+    target = condition["value"]
+    default = condition.get("default", _missing)
+
+    def predicate(action_data):
+        value = action_data.get(field, default)
+        if value is _missing or value is None:
+            return False
+        try:
+            return compare(value, target)
+        except TypeError:
+            return False
+
+    return predicate
+
+
+def _compile_achievement_rules(rules):
+    """Compile rule definitions into {actionType: [(achievementId, predicates)]}."""
+    by_action = {}
+    for rule in rules:
+        achievement_id = rule["achievementId"]
+        predicates = [_compile_condition(c) for c in rule.get("conditions", [])]
+        for action_type in rule["actions"]:
+            by_action.setdefault(action_type, []).append((achievement_id, predicates))
+    return by_action
+
+
+def _get_achievement_rules(db):
+    """Return the compiled rule dispatch table, loading it once per instance."""
+    if _compiled_achievement_rules["byAction"] is None:
+        rules = DEFAULT_ACHIEVEMENT_RULES
+        try:
+            rules_doc = db.collection("config").document("achievement_rules").get()
+            if rules_doc.exists:
+                custom_rules = (rules_doc.to_dict() or {}).get("rules")
+                if isinstance(custom_rules, list) and custom_rules:
+                    _compile_achievement_rules(custom_rules)
+                    rules = custom_rules
+        except Exception as e:
+            # Bad or unreadable overrides fall back to the built-in rules
+            try:
+                sentry_sdk.capture_exception(e)
+            except Exception:
+                pass
+        _compiled_achievement_rules["byAction"] = _compile_achievement_rules(rules)
+    return _compiled_achievement_rules["byAction"]
+
+
+def _evaluate_achievement_rules(rules_by_action, action_type, action_data):
+    """Return the achievement IDs an event satisfies, in rule order."""
+    earned = []
+    for achievement_id, predicates in rules_by_action.get(action_type, ()):
+        if achievement_id not in earned and all(p(action_data) for p in predicates):
+            earned.append(achievement_id)
+    return earned
+
+
+def _auto_award_data(user_id, achievement_id, action_type):
+    """user_achievements record for a system-awarded achievement."""
+    return {
+        "userId": user_id,
+        "achievementId": achievement_id,
+        "dateEarned": firestore.SERVER_TIMESTAMP,
+        "assignedBy": "system",
+        "autoAwarded": True,
+        "actionType": action_type,
+    }
+
+
+def _award_new_candidates(db, achievements, candidates):
+    """Award every candidate the user does not already hold.
+
+    candidates maps (userId, achievementId) -> actionType. Existing awards are
+    filtered with batched reads and the rest committed with batched writes.
+    Returns the (userId, achievementId) pairs written.
+    """
+    held = _held_awards(db, list(candidates))
+    awards = [
+        (user_id, achievements[achievement_id], _auto_award_data(user_id, achievement_id, action_type))
+        for (user_id, achievement_id), action_type in candidates.items()
+        if (user_id, achievement_id) not in held
+    ]
+    return _commit_awards(db, awards) if awards else set()
+
+
+def _awarded_achievement_summary(achievement):
+    """Shape a newly awarded achievement for API responses."""
+    return {
+        "id": achievement["id"],
+        "name": achievement["name"],
+        "description": achievement["description"],
+        "points": achievement["points"],
+    }
+
+
 @https_fn.on_request(cors=CORS_OPTIONS)
 def handleAutoAwardAchievement(req: https_fn.Request) -> https_fn.Response:
     """Automatically award achievements based on user actions."""
@@ -1140,68 +1944,35 @@ def handleAutoAwardAchievement(req: https_fn.Request) -> https_fn.Response:
         db = firestore.client()
 
         # Get all achievements to check which ones to award
-        achievements_query = db.collection("achievements").stream()
-        achievements = {}
-
-        for doc in achievements_query:
-            achievement_data = doc.to_dict()
-            achievement_data["id"] = doc.id
-            achievements[doc.id] = achievement_data
+        achievements, _ = _get_achievement_catalog(db)
 
-        # Get user's current achievements
-        user_achievements_query = (
-            db.collection("user_achievements").where("userId", "==", user_id).stream()
+        # Determine which achievements to award based on action type
+        rules_by_action = _get_achievement_rules(db)
+        if not isinstance(action_data, dict):
+            action_data = {}
+        achievements_to_award = _evaluate_achievement_rules(
+            rules_by_action, action_type, action_data
         )
-        user_achievement_ids = {
-            doc.to_dict()["achievementId"] for doc in user_achievements_query
-        }
 
-        # Determine which achievements to award based on action type
-        achievements_to_award = []
-
-        if action_type == "first_login":
-            if "community_member" not in user_achievement_ids:
-                achievements_to_award.append("community_member")
-
-        elif action_type == "photo_upload":
-            # Check for photographer achievement (5 photos)
-            if "photographer" not in user_achievement_ids:
-                photo_count = action_data.get("totalPhotos", 1)
-                if photo_count >= 5:
-                    achievements_to_award.append("photographer")
-
-        elif action_type == "photo_liked":
-            # Check for fan favorite achievement (10 total likes across all photos)
-            if "fan_favorite" not in user_achievement_ids:
-                total_likes = action_data.get("totalLikes", 1)
-                if total_likes >= 10:
-                    achievements_to_award.append("fan_favorite")
-
-        elif action_type == "profile_created":
-            if "community_member" not in user_achievement_ids:
-                achievements_to_award.append("community_member")
-
-        # Award the achievements
+        # Skip candidates the user already holds
+        achievements_to_award = [a for a in achievements_to_award if a in achievements]
+        held = _held_achievement_ids(db, user_id, achievements_to_award)
+        achievements_to_award = [a for a in achievements_to_award if a not in held]
+
+        # Award the achievements, reading the profile once for all of them
         awarded_achievements = []
+        profile_data = _get_profile_data(db, user_id) if achievements_to_award else {}
         for achievement_id in achievements_to_award:
             if achievement_id in achievements:
-                user_achievement_data = {
-                    "userId": user_id,
-                    "achievementId": achievement_id,
-                    "dateEarned": firestore.SERVER_TIMESTAMP,
-                    "assignedBy": "system",
-                    "autoAwarded": True,
-                    "actionType": action_type,
-                }
+                user_achievement_data = _auto_award_data(user_id, achievement_id, action_type)
 
-                db.collection("user_achievements").add(user_achievement_data)
+                if not _record_award(
+                    db, user_id, achievements[achievement_id], user_achievement_data, profile_data
+                ):
+                    # Awarded concurrently by another request
+                    continue
                 awarded_achievements.append(
-                    {
-                        "id": achievement_id,
-                        "name": achievements[achievement_id]["name"],
-                        "description": achievements[achievement_id]["description"],
-                        "points": achievements[achievement_id]["points"],
-                    }
+                    _awarded_achievement_summary(achievements[achievement_id])
                 )
 
         return https_fn.Response(
@@ -1220,113 +1991,3887 @@ def handleAutoAwardAchievement(req: https_fn.Request) -> https_fn.Response:
         return https_fn.Response(f"An error occurred: {e}", status=500)
 
 
+MAX_AWARD_EVENTS_PER_BATCH = 500
+
+
 @https_fn.on_request(cors=CORS_OPTIONS)
-def handleGetAchievementProgress(req: https_fn.Request) -> https_fn.Response:
-    """Get achievement progress for a user."""
+def handleAutoAwardAchievementsBatch(req: https_fn.Request) -> https_fn.Response:
+    """Evaluate many achievement events at once.
+
+    Body: {"events": [{"userId", "actionType", "actionData"}, ...]}. Events are
+    grouped by user, checked against the user's existing awards in batched
+    reads and committed with batched writes. The response lists the awards
+    made for each event, in request order.
+    """
     if req.method == "OPTIONS":
         return https_fn.Response("", status=204)
-    if req.method != "GET":
+    if req.method != "POST":
         return https_fn.Response("Method not allowed", status=405)
 
-    # Extract user_id from URL path
-    path_parts = req.path.strip("/").split("/")
-    if len(path_parts) < 2 or path_parts[0] != "achievement_progress":
+    data = req.get_json(silent=True)
+    events = data.get("events") if isinstance(data, dict) else None
+    if not isinstance(events, list) or not events:
+        return https_fn.Response("Request body must include a non-empty events list", status=400)
+    if len(events) > MAX_AWARD_EVENTS_PER_BATCH:
         return https_fn.Response(
-            "Invalid URL format. Use /achievement_progress/<user_id>", status=400
+            f"At most {MAX_AWARD_EVENTS_PER_BATCH} events per request", status=400
         )
 
-    user_id = path_parts[1]
-
     try:
         db = firestore.client()
-
-        # Get user's current achievements
-        user_achievements_query = (
-            db.collection("user_achievements").where("userId", "==", user_id).stream()
+        achievements, _ = _get_achievement_catalog(db)
+        rules_by_action = _get_achievement_rules(db)
+
+        results = []
+        # (userId, achievementId) -> index of the first event that earned it
+        candidates = {}
+        for index, event in enumerate(events):
+            if not isinstance(event, dict) or not event.get("userId") or not event.get("actionType"):
+                results.append({"index": index, "error": "Missing required fields: userId, actionType"})
+                continue
+            user_id = event["userId"]
+            action_type = event["actionType"]
+            action_data = event.get("actionData")
+            if not isinstance(action_data, dict):
+                action_data = {}
+            results.append({"index": index, "userId": user_id, "awardedAchievements": []})
+            for achievement_id in _evaluate_achievement_rules(rules_by_action, action_type, action_data):
+                if achievement_id in achievements:
+                    candidates.setdefault((user_id, achievement_id), (index, action_type))
+
+        written = _award_new_candidates(
+            db,
+            achievements,
+            {pair: action_type for pair, (_, action_type) in candidates.items()},
         )
-        user_achievement_ids = {
-            doc.to_dict()["achievementId"] for doc in user_achievements_query
-        }
+        total_awarded = 0
+        for (user_id, achievement_id), (index, _) in candidates.items():
+            if (user_id, achievement_id) in written:
+                results[index]["awardedAchievements"].append(
+                    _awarded_achievement_summary(achievements[achievement_id])
+                )
+                total_awarded += 1
+
+        return https_fn.Response(
+            json.dumps(
+                {
+                    "results": results,
+                    "message": f"Awarded {total_awarded} achievement(s) across {len(events)} event(s)",
+                },
+                default=str,
+            ),
+            status=200,
+            headers={"Content-Type": "application/json"},
+        )
+
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+
+def _seeded_after(view, as_of):
+    """True when a derived document was seeded from a scan at or after `as_of`.
+
+    Such a scan already counted a write made at `as_of`, so applying that
+    write's delta again would count it twice.
+    """
+    seeded_at = (view or {}).get("seededAt")
+    return as_of is not None and seeded_at is not None and seeded_at >= as_of
+
+
+# Trigger deliveries are at-least-once. processed_events/{eventId} records
+# which derived views an event has been applied to; expireAt drives a
+# Firestore TTL policy that clears the markers after a week.
+PROCESSED_EVENT_TTL_DAYS = 7
+
+
+def _claim_event(transaction, db, event_id, view):
+    """Mark a trigger event as applied to one derived view, in its transaction.
+
+    Returns False when the event was already applied to the view (a
+    redelivery), in which case the caller must not apply it again. Must be
+    called after the transaction's other reads and before its writes.
+    """
+    if not event_id:
+        return True
+    ref = db.collection("processed_events").document(event_id)
+    doc = ref.get(transaction=transaction)
+    if doc.exists and (doc.to_dict() or {}).get(view):
+        return False
+    transaction.set(
+        ref,
+        {
+            view: True,
+            "expireAt": datetime.utcnow() + timedelta(days=PROCESSED_EVENT_TTL_DAYS),
+        },
+        merge=True,
+    )
+    return True
+
+
+# Per-user activity counters in user_stats/{userId} back achievement progress.
+# They are maintained incrementally (gallery trigger, race result writes) once
+# seeded; the first progress read for a user seeds them from aggregation
+# queries, so updates for unseeded users are simply skipped.
+USER_COUNTER_FIELDS = ("photosUploaded", "likesReceived", "racesEntered")
+
+
+def _increment_user_counters(db, user_id, as_of=None, event_id=None, view="counters", **deltas):
+    """Apply counter deltas to a user's seeded user_stats document.
+
+    When ``as_of`` (the source write's time) is given, the delta is skipped
+    if the counters were seeded after it, since the seeding aggregation
+    already counted that write. With ``event_id``, a redelivered trigger
+    event is applied only once per ``view`` (see _claim_event).
+    """
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not user_id or not deltas:
+        return
+    stats_ref = db.collection("user_stats").document(user_id)
+    payload = {
+        **{field: firestore.Increment(delta) for field, delta in deltas.items()},
+        "updatedAt": firestore.SERVER_TIMESTAMP,
+    }
+    if as_of is None and event_id is None:
+        try:
+            stats_ref.update(payload)
+        except NotFound:
+            # Not seeded yet; the seeding aggregation will include this change
+            pass
+        return
+
+    @firestore.transactional
+    def _apply(transaction):
+        stats_doc = stats_ref.get(transaction=transaction)
+        if not stats_doc.exists or _seeded_after(stats_doc.to_dict(), as_of):
+            return
+        if not _claim_event(transaction, db, event_id, view):
+            return
+        transaction.update(stats_ref, payload)
+
+    _apply(db.transaction())
+
+
+def _sum_query(query, field, transaction=None):
+    """Run a Firestore sum aggregation and return the numeric result."""
+    return query.sum(field).get(transaction=transaction)[0][0].value or 0
+
+
+def _stream_user_counters(db, user_id):
+    """Compute a user's counters by streaming their documents.
+
+    Fallback for when aggregation queries are unavailable; nothing is seeded.
+    """
+    photos = 0
+    likes = 0
+    for doc in db.collection("gallery_images").where("uploaderUid", "==", user_id).stream():
+        photos += 1
+        likes += int((doc.to_dict() or {}).get("likeCount") or 0)
+    races = sum(
+        1
+        for _ in db.collection("race_results")
+        .where("driverId", "==", user_id)
+        .select([])
+        .stream()
+    )
+    return {"photosUploaded": photos, "likesReceived": likes, "racesEntered": races}
+
+
+def _get_user_counters(db, user_id):
+    """Return (counters, reads) for a user, seeding missing counters.
+
+    A seeded user costs a single document read. Otherwise the counters are
+    computed with count/sum aggregation queries and written back in a
+    transaction that re-reads the document; if that fails the counters are
+    streamed instead and left unseeded.
+    """
+    stats_ref = db.collection("user_stats").document(user_id)
+    stats_doc = stats_ref.get()
+    counters = (stats_doc.to_dict() or {}) if stats_doc.exists else {}
+    if all(field in counters for field in USER_COUNTER_FIELDS):
+        return counters, 1
+
+    photos = db.collection("gallery_images").where("uploaderUid", "==", user_id)
+    aggregated = {
+        "photosUploaded": lambda t: _count_query(photos, transaction=t),
+        "likesReceived": lambda t: int(_sum_query(photos, "likeCount", transaction=t)),
+        "racesEntered": lambda t: _count_query(
+            db.collection("race_results").where("driverId", "==", user_id), transaction=t
+        ),
+    }
+
+    @firestore.transactional
+    def _seed(transaction):
+        # Aggregating inside the transaction keeps writes that land mid-seed
+        # from being counted twice or missed by both paths
+        current_doc = stats_ref.get(transaction=transaction)
+        current = (current_doc.to_dict() or {}) if current_doc.exists else {}
+        missing = [field for field in USER_COUNTER_FIELDS if field not in current]
+        if not missing:
+            return current, 1
+        seeded = {field: aggregated[field](transaction) for field in missing}
+        transaction.set(
+            stats_ref,
+            {
+                **seeded,
+                "seededAt": firestore.SERVER_TIMESTAMP,
+                "updatedAt": firestore.SERVER_TIMESTAMP,
+            },
+            merge=True,
+        )
+        return {**current, **seeded}, 1 + len(missing)
+
+    try:
+        seeded, reads = _seed(db.transaction())
+        return seeded, 1 + reads
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+    streamed = _stream_user_counters(db, user_id)
+    return {**streamed, **counters}, 1 + streamed["photosUploaded"] + streamed["racesEntered"]
+
+
+def _gallery_counter_deltas(data, sign):
+    """Counter deltas contributed by one gallery_images document."""
+    if not data or not data.get("uploaderUid"):
+        return None, {}
+    return data["uploaderUid"], {
+        "photosUploaded": sign,
+        "likesReceived": sign * int(data.get("likeCount") or 0),
+    }
+
+
+@firestore_fn.on_document_written(document="gallery_images/{imageId}")
+def handleGalleryImageWritten(
+    event: firestore_fn.Event[firestore_fn.Change[firestore_fn.DocumentSnapshot | None]],
+) -> None:
+    """Keep uploaders' photo and like counters in step with gallery_images."""
+    before = event.data.before
+    after = event.data.after
+    before_data = before.to_dict() if before is not None and before.exists else None
+    after_data = after.to_dict() if after is not None and after.exists else None
+
+    deltas_by_user = {}
+    for data, sign in ((before_data, -1), (after_data, 1)):
+        user_id, deltas = _gallery_counter_deltas(data, sign)
+        if user_id:
+            user_deltas = deltas_by_user.setdefault(user_id, {})
+            for field, delta in deltas.items():
+                user_deltas[field] = user_deltas.get(field, 0) + delta
+
+    try:
+        db = firestore.client()
+        # Redelivered events are deduplicated per user on event.id
+        for index, user_id in enumerate(sorted(deltas_by_user)):
+            _increment_user_counters(
+                db, user_id, as_of=event.time, event_id=event.id, view=f"counters_{index}", **deltas_by_user[user_id]
+            )
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+
+
+# Progress-tracked achievements: (achievementId, counter, target, description)
+ACHIEVEMENT_PROGRESS_TARGETS = [
+    ("photographer", "photosUploaded", 5, "Upload {current}/{target} photos to the gallery"),
+    ("fan_favorite", "likesReceived", 10, "Receive {current}/{target} total likes on your photos"),
+]
+
+
+@https_fn.on_request(cors=CORS_OPTIONS)
+def handleGetAchievementProgress(req: https_fn.Request) -> https_fn.Response:
+    """Get achievement progress for a user."""
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "GET":
+        return https_fn.Response("Method not allowed", status=405)
+
+    # Extract user_id from URL path
+    path_parts = req.path.strip("/").split("/")
+    if len(path_parts) < 2 or path_parts[0] != "achievement_progress":
+        return https_fn.Response(
+            "Invalid URL format. Use /achievement_progress/<user_id>", status=400
+        )
+
+    user_id = path_parts[1]
+
+    try:
+        db = firestore.client()
+
+        # Only the tracked awards are looked up, in one batched read
+        tracked_ids = [target[0] for target in ACHIEVEMENT_PROGRESS_TARGETS] + ["community_member"]
+        user_achievement_ids = _held_achievement_ids(db, user_id, tracked_ids)
 
         # Define progress tracking for specific achievements
         progress_data = {}
 
-        # Photographer achievement progress (upload 5 photos)
-        if "photographer" not in user_achievement_ids:
-            try:
-                photos_query = (
-                    db.collection("gallery_images")
-                    .where("uploaderUid", "==", user_id)
-                    .stream()
+        pending = [t for t in ACHIEVEMENT_PROGRESS_TARGETS if t[0] not in user_achievement_ids]
+        if pending:
+            try:
+                counters, _ = _get_user_counters(db, user_id)
+            except Exception as e:
+                try:
+                    sentry_sdk.capture_exception(e)
+                except Exception:
+                    pass
+                pending = []
+            for achievement_id, counter, target, description in pending:
+                current = counters.get(counter, 0)
+                progress_data[achievement_id] = {
+                    "current": current,
+                    "target": target,
+                    "percentage": min((current / target) * 100, 100),
+                    "completed": current >= target,
+                    "description": description.format(current=current, target=target),
+                }
+
+        # Community Member achievement (already earned or not)
+        if "community_member" not in user_achievement_ids:
+            progress_data["community_member"] = {
+                "current": 0,
+                "target": 1,
+                "percentage": 0,
+                "completed": False,
+                "description": "Join the RedsRacing community (automatic on login)",
+            }
+
+        return https_fn.Response(
+            json.dumps(progress_data, default=str),
+            status=200,
+            headers={"Content-Type": "application/json"},
+        )
+
+    except Exception as e:
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+
+def _race_completed_action_data(race, season_races):
+    """actionData for a race_completed event built from a race_results record."""
+    action_data = {"seasonRaces": season_races}
+    for field in ("finishPosition", "startPosition", "fastestLap", "isHomeTrack"):
+        if race.get(field) is not None:
+            action_data[field] = race[field]
+    incidents = race.get("incidents")
+    if isinstance(incidents, list):
+        action_data["penalties"] = len(incidents)
+    return action_data
+
+
+RACE_ACHIEVEMENT_BACKFILL_PAGE_SIZE = 200
+# Leave headroom under the function timeout for the final checkpoint
+RACE_ACHIEVEMENT_BACKFILL_BUDGET_SECONDS = 480
+
+
+@https_fn.on_request(cors=CORS_OPTIONS, timeout_sec=540)
+def handleBackfillRaceAchievements(req: https_fn.Request) -> https_fn.Response:
+    """Award racing achievements from race_results history (admins only).
+
+    Streams race_results in document-ID order, a page at a time, evaluating
+    the race_completed rules per driver (driverId is the awarded user) and
+    committing awards in batches. After each page the per-driver season
+    tallies are checkpointed to backfill_jobs/race_achievements/drivers (race
+    dates per season to .../seasons) and the cursor to the job document, so a
+    run that hits the time budget is resumed by calling again. Once the
+    stream is exhausted, season_veteran is evaluated for completed seasons.
+    Awards use deterministic IDs, so re-running is safe.
+
+    Body (optional): {"reset": bool, "pageSize": int, "completedSeasons": [...]}.
+    completedSeasons defaults to every season except the latest one seen.
+    """
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "POST":
+        return https_fn.Response("Method not allowed", status=405)
+
+    decoded_token, auth_error = _get_user_from_token(req)
+    if auth_error:
+        return auth_error
+
+    if not _is_admin(decoded_token):
+        return https_fn.Response("Forbidden: Admin role required", status=403)
+
+    data = req.get_json(silent=True) or {}
+    try:
+        page_size = int(data.get("pageSize", RACE_ACHIEVEMENT_BACKFILL_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return https_fn.Response("pageSize must be an integer", status=400)
+    page_size = max(1, min(page_size, 500))
+
+    try:
+        db = firestore.client()
+        job_ref = db.collection("backfill_jobs").document("race_achievements")
+        # Per-driver tallies and per-season race dates live in subcollections
+        # so the job document stays small however many drivers there are
+        drivers_ref = job_ref.collection("drivers")
+        seasons_ref = job_ref.collection("seasons")
+        job_doc = job_ref.get()
+        job = (job_doc.to_dict() or {}) if job_doc.exists and not data.get("reset") else {}
+
+        if job.get("status") == "done":
+            return https_fn.Response(
+                json.dumps({**job, "message": "Backfill already complete; pass reset to re-run"}, default=str),
+                status=200,
+                headers={"Content-Type": "application/json"},
+            )
+
+        pending = []
+
+        def _queue(action, ref, payload=None):
+            pending.append((action, ref, payload))
+            if len(pending) >= FIRESTORE_BATCH_LIMIT:
+                _flush()
+
+        def _flush():
+            if not pending:
+                return
+            batch = db.batch()
+            for action, ref, payload in pending:
+                if action == "set":
+                    batch.set(ref, payload, merge=True)
+                else:
+                    batch.delete(ref)
+            batch.commit()
+            pending.clear()
+
+        if not job:
+            for progress_ref in (drivers_ref, seasons_ref):
+                for doc in progress_ref.select([]).stream():
+                    _queue("delete", doc.reference)
+            _flush()
+
+        achievements, _ = _get_achievement_catalog(db)
+        rules_by_action = _get_achievement_rules(db)
+
+        cursor = job.get("cursor")
+        processed = job.get("processed", 0)
+        awarded = job.get("awarded", 0)
+
+        def _checkpoint(status):
+            _flush()
+            job_ref.set(
+                {
+                    "status": status,
+                    "cursor": cursor,
+                    "processed": processed,
+                    "awarded": awarded,
+                    "updatedAt": firestore.SERVER_TIMESTAMP,
+                }
+            )
+
+        started = time.monotonic()
+        finished = False
+        while time.monotonic() - started < RACE_ACHIEVEMENT_BACKFILL_BUDGET_SECONDS:
+            query = db.collection("race_results").order_by("__name__").limit(page_size)
+            if cursor:
+                query = query.start_after({"__name__": cursor})
+            docs = list(query.stream())
+
+            page_driver_ids = sorted(
+                {(doc.to_dict() or {}).get("driverId") for doc in docs} - {None, ""}
+            )
+            driver_progress = {driver_id: {} for driver_id in page_driver_ids}
+            if page_driver_ids:
+                for doc in db.get_all([drivers_ref.document(d) for d in page_driver_ids]):
+                    if doc.exists:
+                        driver_progress[doc.id] = doc.to_dict() or {}
+
+            candidates = {}
+            page_season_dates = {}
+            for doc in docs:
+                race = doc.to_dict() or {}
+                driver_id = race.get("driverId")
+                if not driver_id:
+                    continue
+                progress = driver_progress[driver_id]
+                # A retried page must not count a result twice
+                if progress.get("lastResultId") and doc.id <= progress["lastResultId"]:
+                    continue
+                progress["lastResultId"] = doc.id
+                season = str(race.get("season", ""))
+                tally = progress.setdefault("seasons", {}).setdefault(season, {"races": 0, "dates": []})
+                tally["races"] += 1
+                race_date = race.get("raceDate")
+                if race_date:
+                    race_date = str(race_date)
+                    if race_date not in tally["dates"]:
+                        tally["dates"].append(race_date)
+                    page_season_dates.setdefault(season, set()).add(race_date)
+                action_data = _race_completed_action_data(race, tally["races"])
+                for achievement_id in _evaluate_achievement_rules(
+                    rules_by_action, "race_completed", action_data
+                ):
+                    if achievement_id in achievements:
+                        candidates.setdefault((driver_id, achievement_id), "race_completed")
+
+            if candidates:
+                awarded += len(_award_new_candidates(db, achievements, candidates))
+            for driver_id, progress in driver_progress.items():
+                if progress:
+                    _queue("set", drivers_ref.document(driver_id), progress)
+            for season, dates in page_season_dates.items():
+                _queue(
+                    "set",
+                    seasons_ref.document(season or "_"),
+                    {"season": season, "dates": firestore.ArrayUnion(sorted(dates))},
+                )
+            if docs:
+                cursor = docs[-1].id
+                processed += len(docs)
+            if len(docs) < page_size:
+                finished = True
+                break
+            _checkpoint("running")
+
+        if finished:
+            _flush()
+            season_dates = {}
+            for doc in seasons_ref.stream():
+                season_data = doc.to_dict() or {}
+                season_dates[str(season_data.get("season", doc.id))] = set(season_data.get("dates") or [])
+
+            completed_seasons = data.get("completedSeasons")
+            if completed_seasons is None:
+                known = sorted(season_dates)
+                completed_seasons = known[:-1]
+            completed_seasons = {str(season) for season in completed_seasons}
+
+            candidates = {}
+            for doc in drivers_ref.stream():
+                for season, tally in ((doc.to_dict() or {}).get("seasons") or {}).items():
+                    if season not in completed_seasons:
+                        continue
+                    action_data = {
+                        "racesMissed": len(season_dates.get(season, set()) - set(tally.get("dates") or [])),
+                        "seasonRaces": tally.get("races", 0),
+                    }
+                    for achievement_id in _evaluate_achievement_rules(
+                        rules_by_action, "season_completed", action_data
+                    ):
+                        if achievement_id in achievements:
+                            candidates.setdefault((doc.id, achievement_id), "season_completed")
+            if candidates:
+                awarded += len(_award_new_candidates(db, achievements, candidates))
+
+        _checkpoint("done" if finished else "running")
+
+        return https_fn.Response(
+            json.dumps(
+                {
+                    "status": "done" if finished else "running",
+                    "processed": processed,
+                    "awarded": awarded,
+                    "cursor": cursor,
+                },
+                default=str,
+            ),
+            status=200,
+            headers={"Content-Type": "application/json"},
+        )
+
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+
+# ============================================================================
+# RACE ANALYTICS SYSTEM
+# ============================================================================
+
+
+def _as_position(value):
+    """Coerce a start/finish position to a positive int, or None."""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        position = int(float(value))
+    except (TypeError, ValueError):
+        return None
+    return position if position > 0 else None
+
+
+def _as_lap_time(value):
+    """Coerce a lap time in seconds to a positive float, or None."""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        lap_time = float(value)
+    except (TypeError, ValueError):
+        return None
+    return lap_time if lap_time > 0 else None
+
+
+def _as_points(value):
+    """Coerce a points value, treating anything invalid as zero."""
+    if value is None or isinstance(value, bool):
+        return 0
+    try:
+        points = float(value)
+    except (TypeError, ValueError):
+        return 0
+    return int(points) if points.is_integer() else points
+
+
+# Per-driver rollups (driver_rollups/{id}) hold running sums, counts and a
+# finish-position histogram for four scopes: all races, one season, one track
+# and one season at one track. handleRaceResultWritten applies each result's
+# (before, after) delta, so analytics can be answered from a single document
+# read. The histogram gives exact medians and best/worst finishes.
+ROLLUP_COUNTER_FIELDS = (
+    "races",
+    "pointsTotal",
+    "finishCount",
+    "finishSum",
+    "startCount",
+    "startSum",
+    "gainedCount",
+    "gainedSum",
+    "lapCount",
+    "lapSum",
+    "raceLapCount",
+    "raceLapSum",
+    "greenLapCount",
+    "greenLapSum",
+)
+
+
+def _rollup_key_part(value):
+    """Make a value safe for use inside a Firestore document ID."""
+    return "".join(c if c.isalnum() or c in "-_" else "-" for c in str(value).strip().lower())
+
+
+def _driver_rollup_id(driver_id, season=None, track_name=None):
+    """Document ID of a driver rollup for the given scope."""
+    parts = [_rollup_key_part(driver_id)]
+    if season is None and track_name is None:
+        parts.append("all")
+    if season is not None:
+        parts.append(f"season_{_rollup_key_part(season)}")
+    if track_name is not None:
+        parts.append(f"track_{_rollup_key_part(track_name)}")
+    return "__".join(parts)
+
+
+def _driver_rollup_scopes(race):
+    """(docId, identity fields) for every rollup a race result feeds."""
+    driver_id = race["driverId"]
+    season = str(race.get("season", ""))
+    track_name = race.get("trackName") or ""
+    scopes = []
+    for scope_season, scope_track in (
+        (None, None),
+        (season, None),
+        (None, track_name),
+        (season, track_name),
+    ):
+        scopes.append(
+            (
+                _driver_rollup_id(driver_id, scope_season, scope_track),
+                {"driverId": driver_id, "season": scope_season, "trackName": scope_track},
+            )
+        )
+    return scopes
+
+
+def _race_rollup_contribution(race):
+    """Return (counter deltas, finish position, fastest lap) for one race."""
+    finish = _as_position(race.get("finishPosition"))
+    start = _as_position(race.get("startPosition"))
+    fastest = _as_lap_time(race.get("fastestLap"))
+    deltas = {"races": 1, "pointsTotal": _as_points(race.get("points"))}
+    if finish:
+        deltas["finishCount"] = 1
+        deltas["finishSum"] = finish
+    if start:
+        deltas["startCount"] = 1
+        deltas["startSum"] = start
+    if finish and start:
+        deltas["gainedCount"] = 1
+        deltas["gainedSum"] = start - finish
+    if fastest:
+        deltas["lapCount"] = 1
+        deltas["lapSum"] = fastest
+    lap_pace = _race_lap_pace(race)
+    if lap_pace:
+        deltas["raceLapCount"] = lap_pace["lapCount"]
+        deltas["raceLapSum"] = lap_pace["lapSum"]
+        deltas["greenLapCount"] = lap_pace["greenLapCount"]
+        deltas["greenLapSum"] = lap_pace["greenLapSum"]
+    return deltas, finish, fastest
+
+
+def _fold_race_into_rollup(rollup, race):
+    """Add a race result to an in-memory rollup dict."""
+    deltas, finish, fastest = _race_rollup_contribution(race)
+    for field in ROLLUP_COUNTER_FIELDS:
+        rollup[field] = rollup.get(field, 0) + deltas.get(field, 0)
+    if finish:
+        finish_counts = rollup.setdefault("finishCounts", {})
+        finish_counts[str(finish)] = finish_counts.get(str(finish), 0) + 1
+    if fastest and (rollup.get("lapMin") is None or fastest < rollup["lapMin"]):
+        rollup["lapMin"] = fastest
+    rollup.setdefault("driverName", race.get("driverName", "Unknown"))
+    return rollup
+
+
+def _unfold_race_from_rollup(rollup, race):
+    """Subtract a race result from an in-memory rollup dict.
+
+    Returns the result's fastest lap when it may have been the rollup's
+    lapMin, which a subtraction cannot restore; otherwise None.
+    """
+    deltas, finish, fastest = _race_rollup_contribution(race)
+    for field in ROLLUP_COUNTER_FIELDS:
+        rollup[field] = rollup.get(field, 0) - deltas.get(field, 0)
+    if finish:
+        finish_counts = rollup.setdefault("finishCounts", {})
+        remaining = finish_counts.get(str(finish), 0) - 1
+        if remaining > 0:
+            finish_counts[str(finish)] = remaining
+        else:
+            finish_counts.pop(str(finish), None)
+    if fastest and rollup.get("lapMin") is not None and fastest <= rollup["lapMin"]:
+        return fastest
+    return None
+
+
+def _seed_driver_rollup(db, identity, replace=False):
+    """Build one driver rollup from a scan of its race results and store it.
+
+    The scan runs inside a transaction that re-reads the rollup, so results
+    written while seeding are either counted here or applied afterwards by
+    handleRaceResultWritten (seededAt tells it which). Unless `replace` is
+    set, an existing rollup is returned as is. Returns the rollup, or None
+    when the scope has no results.
+    """
+    ref = db.collection("driver_rollups").document(
+        _driver_rollup_id(identity["driverId"], identity["season"], identity["trackName"])
+    )
+    query = db.collection("race_results").where("driverId", "==", identity["driverId"])
+    if identity["season"] is not None:
+        query = query.where("season", "==", identity["season"])
+    if identity["trackName"] is not None:
+        query = query.where("trackName", "==", identity["trackName"])
+    query = query.select(ROLLUP_SOURCE_FIELDS)
+
+    @firestore.transactional
+    def _seed(transaction):
+        doc = ref.get(transaction=transaction)
+        if doc.exists and not replace:
+            return doc.to_dict() or {}
+        rollup = dict(identity)
+        for race_doc in transaction.get(query):
+            _fold_race_into_rollup(rollup, race_doc.to_dict() or {})
+        if not rollup.get("races"):
+            if doc.exists:
+                transaction.delete(ref)
+            return None
+        transaction.set(
+            ref,
+            {**rollup, "seededAt": firestore.SERVER_TIMESTAMP, "updatedAt": firestore.SERVER_TIMESTAMP},
+        )
+        return rollup
+
+    return _seed(db.transaction())
+
+
+# Rollup documents read per transaction (four scopes per result side)
+ROLLUP_CHANGES_PER_TRANSACTION = FIRESTORE_BATCH_LIMIT // 8
+
+
+def _apply_rollup_changes(db, changes, as_of=None, event_id=None):
+    """Apply (before, after) race_results changes to the driver rollups.
+
+    Rollups that do not exist yet are left alone: the analytics endpoint
+    seeds them from a scan on first read, so an increment never creates a
+    partial rollup. `as_of` is when the changes were written; rollups seeded
+    after it already include them. A removed result that held a rollup's
+    lapMin triggers a rescan of just that rollup. With `event_id`, a
+    redelivered trigger event is applied only once. Best-effort: rollups can
+    always be rebuilt with /api/rebuild-driver-rollups, so failures are
+    reported and False returned.
+    """
+    applied = True
+    for i in range(0, len(changes), ROLLUP_CHANGES_PER_TRANSACTION):
+        chunk = changes[i:i + ROLLUP_CHANGES_PER_TRANSACTION]
+        scopes = {}
+        for before_data, after_data in chunk:
+            for data in (before_data, after_data):
+                if data and data.get("driverId"):
+                    scopes.update(_driver_rollup_scopes(data))
+        if not scopes:
+            continue
+        refs = {doc_id: db.collection("driver_rollups").document(doc_id) for doc_id in scopes}
+
+        @firestore.transactional
+        def _apply(transaction):
+            rollups = {}
+            for doc in transaction.get_all(list(refs.values())):
+                rollup = doc.to_dict() if doc.exists else None
+                if rollup is not None and not _seeded_after(rollup, as_of):
+                    rollups[doc.id] = rollup
+            # Each chunk is its own transaction, so each is marked separately
+            if not _claim_event(transaction, db, event_id, f"rollups_{i}" if i else "rollups"):
+                return set()
+            removed_laps = {}
+            added_laps = {}
+            for before_data, after_data in chunk:
+                for data, sign in ((before_data, -1), (after_data, 1)):
+                    if not data or not data.get("driverId"):
+                        continue
+                    for doc_id, _ in _driver_rollup_scopes(data):
+                        rollup = rollups.get(doc_id)
+                        if rollup is None:
+                            continue
+                        if sign > 0:
+                            _fold_race_into_rollup(rollup, data)
+                            rollup["driverName"] = data.get("driverName", rollup.get("driverName"))
+                            fastest = _as_lap_time(data.get("fastestLap"))
+                            if fastest:
+                                added_laps[doc_id] = min(fastest, added_laps.get(doc_id, fastest))
+                        else:
+                            lost = _unfold_race_from_rollup(rollup, data)
+                            if lost:
+                                removed_laps[doc_id] = min(lost, removed_laps.get(doc_id, lost))
+            # A re-added lap at least as fast keeps lapMin exact
+            rebuild = {
+                doc_id
+                for doc_id, lost in removed_laps.items()
+                if added_laps.get(doc_id) is None or added_laps[doc_id] > lost
+            }
+            for doc_id, rollup in rollups.items():
+                if doc_id in rebuild:
+                    continue
+                if rollup.get("races", 0) <= 0:
+                    transaction.delete(refs[doc_id])
+                else:
+                    transaction.set(refs[doc_id], {**rollup, "updatedAt": firestore.SERVER_TIMESTAMP})
+            return rebuild
+
+        try:
+            for doc_id in _apply(db.transaction()):
+                _seed_driver_rollup(db, scopes[doc_id], replace=True)
+        except Exception as e:
+            try:
+                sentry_sdk.capture_exception(e)
+            except Exception:
+                pass
+            applied = False
+    return applied
+
+
+def _commit_time(write_results):
+    """Latest update_time among a batch commit's WriteResults, or None."""
+    return max((result.update_time for result in write_results or []), default=None)
+
+
+def _histogram_median(counts):
+    """Median of a {value: count} histogram (matches statistics.median)."""
+    items = sorted((int(value), n) for value, n in (counts or {}).items() if n > 0)
+    total = sum(n for _, n in items)
+    if not total:
+        return None
+
+    def _nth(index):
+        seen = 0
+        for value, n in items:
+            seen += n
+            if index < seen:
+                return value
+
+    if total % 2:
+        return _nth(total // 2)
+    return (_nth(total // 2 - 1) + _nth(total // 2)) / 2
+
+
+def _rollup_analytics(rollup):
+    """Summary statistics for a driver rollup."""
+    finish_values = [int(v) for v, n in (rollup.get("finishCounts") or {}).items() if n > 0]
+
+    def _avg(sum_field, count_field):
+        count = rollup.get(count_field, 0)
+        return round(rollup.get(sum_field, 0) / count, 2) if count else None
+
+    return {
+        "totalRaces": rollup.get("races", 0),
+        "totalPoints": rollup.get("pointsTotal", 0),
+        "avgFinishPosition": _avg("finishSum", "finishCount"),
+        "medianFinishPosition": _histogram_median(rollup.get("finishCounts")),
+        "bestFinish": min(finish_values) if finish_values else None,
+        "worstFinish": max(finish_values) if finish_values else None,
+        "avgStartPosition": _avg("startSum", "startCount"),
+        "avgPositionsGained": _avg("gainedSum", "gainedCount"),
+        "fastestLapTime": rollup.get("lapMin"),
+        "avgLapTime": _avg("lapSum", "lapCount"),
+        # Over every lap in lapTimes, and over green-flag laps only
+        "avgRaceLap": _avg("raceLapSum", "raceLapCount"),
+        "avgGreenFlagLap": _avg("greenLapSum", "greenLapCount"),
+    }
+
+
+def _build_race_result(data, created_by, schemes=None):
+    """The race_results document for one submitted result.
+
+    When a points scheme applies (see _points_scheme_for), its points replace
+    the submitted ones unless the result sets pointsOverride.
+    """
+    race_result = {
+        "driverId": data["driverId"],
+        "driverName": data["driverName"],
+        "carNumber": data.get("carNumber", ""),
+        "raceDate": data["raceDate"],
+        "trackName": data["trackName"],
+        "trackLocation": data.get("trackLocation", ""),
+        "season": data["season"],
+        "raceType": data.get("raceType", "Feature"),  # Heat, Feature, etc.
+        "startPosition": data.get("startPosition"),
+        "finishPosition": data.get("finishPosition"),
+        "lapTimes": data.get("lapTimes", []),
+        "fastestLap": data.get("fastestLap"),
+        "points": data.get("points", 0),
+        "incidents": data.get("incidents", []),
+        "weather": data.get("weather", ""),
+        "notes": data.get("notes", ""),
+        "createdAt": firestore.SERVER_TIMESTAMP,
+        "createdBy": created_by,
+    }
+    if data.get("pointsScheme"):
+        race_result["pointsScheme"] = data["pointsScheme"]
+    if data.get("pointsOverride"):
+        race_result["pointsOverride"] = True
+    if schemes:
+        _apply_points_scheme(race_result, schemes)
+    race_result["lapPace"] = _race_lap_pace(race_result)
+    return race_result
+
+
+@https_fn.on_request(cors=CORS_OPTIONS)
+def handleAddRaceResult(req: https_fn.Request) -> https_fn.Response:
+    """Add a new race result to Firestore (Admin only)."""
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "POST":
+        return https_fn.Response("Method not allowed", status=405)
+
+    # Verify authentication and admin role
+    decoded_token, auth_error = _get_user_from_token(req)
+    if auth_error:
+        return auth_error
+
+    if not _is_admin(decoded_token):
+        return https_fn.Response("Forbidden: Admin role required", status=403)
+
+    data = req.get_json(silent=True)
+    if not data:
+        return https_fn.Response("Invalid request body", status=400)
+
+    # Required fields
+    required_fields = ["driverId", "driverName", "raceDate", "trackName", "season"]
+    if not all(field in data for field in required_fields):
+        return https_fn.Response(f"Missing required fields: {required_fields}", status=400)
+
+    try:
+        db = firestore.client()
+
+        schemes = _get_points_schemes(db)
+        if data.get("pointsScheme") and data["pointsScheme"] not in schemes:
+            return https_fn.Response(f"Unknown points scheme: {data['pointsScheme']}", status=400)
+        race_result = _build_race_result(data, decoded_token["uid"], schemes)
+
+        # Driver rollups follow from handleRaceResultWritten
+        doc_ref = db.collection("race_results").document()
+        write_result = doc_ref.set(race_result)
+        # Counters seeded after the write already include this result
+        _increment_user_counters(db, data["driverId"], as_of=write_result.update_time, racesEntered=1)
+
+        return https_fn.Response(
+            json.dumps({"message": "Race result added successfully", "id": doc_ref.id}),
+            status=200,
+            headers={"Content-Type": "application/json"},
+        )
+
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+
+# Bulk event import: one results sheet (JSON rows or CSV) per request.
+MAX_IMPORT_ROWS = 200
+RACE_EVENT_FIELDS = ("raceDate", "trackName", "trackLocation", "season", "weather")
+
+
+def _parse_race_event(req):
+    """Return (event fields, result rows) from an import request.
+
+    Accepts a JSON body {"event": {...}, "results": [...]} or
+    {"event": {...}, "csv": "..."}, or a raw text/csv body with the event
+    fields as query parameters. Event fields may also be CSV columns or row
+    keys. Raises ValueError on a malformed body.
+    """
+    data = req.get_json(silent=True)
+    csv_text = None
+    if isinstance(data, dict):
+        event = data.get("event") or {}
+        if not isinstance(event, dict):
+            raise ValueError("event must be an object")
+        if isinstance(data.get("results"), list):
+            return event, data["results"]
+        csv_text = data.get("csv")
+    elif data is None:
+        event = {field: req.args[field] for field in RACE_EVENT_FIELDS if req.args.get(field)}
+        csv_text = req.get_data(as_text=True)
+    else:
+        raise ValueError("Request body must be a JSON object or CSV")
+
+    if not isinstance(csv_text, str) or not csv_text.strip():
+        raise ValueError("Provide results rows or CSV")
+    reader = csv.DictReader(io.StringIO(csv_text.strip()))
+    if not reader.fieldnames or not {"driverId", "driverName"} <= set(reader.fieldnames):
+        raise ValueError("CSV must have driverId and driverName columns")
+    rows = [
+        {key.strip(): (value or "").strip() for key, value in row.items() if key and value not in (None, "")}
+        for row in reader
+    ]
+    return event, rows
+
+
+def _parse_import_number(value, integer=False):
+    """Parse a CSV/JSON number; raises ValueError when it is not one."""
+    if isinstance(value, bool):
+        raise ValueError
+    number = float(value)
+    if integer:
+        if not number.is_integer():
+            raise ValueError
+        return int(number)
+    return int(number) if number.is_integer() else number
+
+
+def _split_import_list(value):
+    """Lists arrive as JSON arrays or ';'-separated CSV cells."""
+    if isinstance(value, list):
+        return value
+    return [part.strip() for part in str(value).split(";") if part.strip()]
+
+
+def _validate_import_row(row, event):
+    """Return (result data for _build_race_result, list of errors)."""
+    if not isinstance(row, dict):
+        return None, ["row must be an object"]
+    data = {**event, **row}
+    errors = []
+
+    for field in ("driverId", "driverName", "raceDate", "trackName", "season"):
+        if data.get(field) in (None, ""):
+            errors.append(f"{field} is required")
+
+    for field in ("startPosition", "finishPosition"):
+        if data.get(field) not in (None, ""):
+            try:
+                data[field] = _parse_import_number(data[field], integer=True)
+                if data[field] < 1:
+                    raise ValueError
+            except (TypeError, ValueError):
+                errors.append(f"{field} must be a positive integer")
+        else:
+            data[field] = None
+
+    for field in ("fastestLap", "points"):
+        if data.get(field) not in (None, ""):
+            try:
+                data[field] = _parse_import_number(data[field])
+                if data[field] < 0 or (field == "fastestLap" and data[field] == 0):
+                    raise ValueError
+            except (TypeError, ValueError):
+                errors.append(f"{field} must be a positive number")
+        else:
+            data.pop(field, None)
+
+    if data.get("lapTimes") not in (None, ""):
+        try:
+            lap_times = [_parse_import_number(lap) for lap in _split_import_list(data["lapTimes"])]
+            if any(lap <= 0 for lap in lap_times):
+                raise ValueError
+            data["lapTimes"] = lap_times
+        except (TypeError, ValueError):
+            errors.append("lapTimes must be positive numbers")
+    else:
+        data["lapTimes"] = []
+    if "fastestLap" not in data and data["lapTimes"] and not errors:
+        data["fastestLap"] = min(data["lapTimes"])
+
+    if data.get("incidents") not in (None, ""):
+        data["incidents"] = [str(i) for i in _split_import_list(data["incidents"])]
+
+    if isinstance(data.get("pointsOverride"), str):
+        # CSV cells arrive as text
+        data["pointsOverride"] = data["pointsOverride"].strip().lower() in ("1", "true", "yes")
+
+    for field in ("driverId", "driverName", "raceDate", "trackName", "season", "raceType", "carNumber"):
+        value = data.get(field)
+        if value in (None, ""):
+            continue
+        if isinstance(value, int) and not isinstance(value, bool):
+            # Readers query these as strings, e.g. season "2024", not 2024
+            data[field] = str(value)
+        elif not isinstance(value, str):
+            errors.append(f"{field} must be a string")
+    return data, errors
+
+
+def _apply_race_import(db, import_ref, import_data, race_results=None):
+    """Update the derived views for an imported sheet, then mark it applied.
+
+    Imported creates are skipped by handleRaceResultWritten, so this is the
+    only place their standings, rollups, records, ratings and counters are
+    updated. The views dedupe on the import's ID through processed_events,
+    so a failed run is resumed by calling this again with the stored
+    race_imports document. Returns True once the import is applied.
+    """
+    if race_results is None:
+        refs = [
+            db.collection("race_results").document(result_id)
+            for result_id in import_data.get("resultIds") or []
+        ]
+        race_results = [(doc.reference, doc.to_dict() or {}) for doc in db.get_all(refs) if doc.exists]
+    as_of = import_data.get("committedAt")
+    event_id = f"import-{import_ref.id}"
+    changes = [(None, race) for _, race in race_results]
+
+    _apply_standings_changes(db, changes, as_of=as_of, event_id=event_id)
+    applied = _apply_rollup_changes(db, changes, as_of=as_of, event_id=event_id)
+    applied = _update_track_records(
+        db, [(ref.id, None, race) for ref, race in race_results], as_of=as_of, event_id=event_id
+    ) and applied
+    rated_events = {}
+    for _, race_result in race_results:
+        rated_events.setdefault(_rating_event_key(race_result), race_result)
+    for race_result in rated_events.values():
+        applied = _rate_event(db, race_result) and applied
+    _bump_career_versions(db, [race["driverId"] for _, race in race_results])
+    if not applied:
+        return False
+
+    if not import_data.get("countersApplied"):
+        races_by_driver = {}
+        for _, race_result in race_results:
+            races_by_driver[race_result["driverId"]] = races_by_driver.get(race_result["driverId"], 0) + 1
+        for driver_id, count in races_by_driver.items():
+            _increment_user_counters(db, driver_id, as_of=as_of, racesEntered=count)
+    import_ref.update(
+        {"status": "applied", "countersApplied": True, "appliedAt": firestore.SERVER_TIMESTAMP}
+    )
+    return True
+
+
+@https_fn.on_request(cors=CORS_OPTIONS, timeout_sec=300)
+def handleImportRaceEvent(req: https_fn.Request) -> https_fn.Response:
+    """Import a whole event's results sheet in one request (Admin only).
+
+    Every row is validated before anything is written; a sheet with any
+    invalid row, or with a driver/race type already recorded for the event,
+    is rejected as a whole. Results are committed in WriteBatch chunks, then
+    driver rollups, standings and track records are updated once for the
+    event instead of once per row.
+
+    race_imports/{importId} is written as "pending" before the results and
+    marked "applied" once the derived views are updated. Re-sending a sheet
+    whose import is still pending resumes it instead of conflicting.
+    """
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "POST":
+        return https_fn.Response("Method not allowed", status=405)
+
+    decoded_token, auth_error = _get_user_from_token(req)
+    if auth_error:
+        return auth_error
+
+    if not _is_admin(decoded_token):
+        return https_fn.Response("Forbidden: Admin role required", status=403)
+
+    try:
+        event, rows = _parse_race_event(req)
+    except ValueError as ve:
+        return https_fn.Response(str(ve), status=400)
+    if not rows:
+        return https_fn.Response("No results provided", status=400)
+    if len(rows) > MAX_IMPORT_ROWS:
+        return https_fn.Response(f"At most {MAX_IMPORT_ROWS} results per import", status=400)
+
+    row_errors = []
+    results = []
+    seen = {}
+    for index, row in enumerate(rows):
+        data, errors = _validate_import_row(row, event)
+        if not errors:
+            key = (data["raceDate"], data["trackName"], data.get("raceType", "Feature"), data["driverId"])
+            if key in seen:
+                errors.append(f"duplicate of row {seen[key] + 1}")
+            seen.setdefault(key, index)
+        if errors:
+            row_errors.append({"row": index + 1, "errors": errors})
+        results.append(data)
+    if row_errors:
+        return https_fn.Response(
+            json.dumps({"message": "Validation failed", "errors": row_errors}),
+            status=400,
+            headers={"Content-Type": "application/json"},
+        )
+
+    try:
+        db = firestore.client()
+
+        # Reject results already recorded for this event (e.g. a re-import)
+        existing = {}
+        for race_date, track_name in {(r["raceDate"], r["trackName"]) for r in results}:
+            query = (
+                db.collection("race_results")
+                .where("raceDate", "==", race_date)
+                .where("trackName", "==", track_name)
+                .select(["driverId", "raceType", "importId"])
+            )
+            for doc in query.stream():
+                recorded = doc.to_dict() or {}
+                key = (race_date, track_name, recorded.get("raceType", "Feature"), recorded.get("driverId"))
+                existing[key] = recorded.get("importId")
+        conflicts = [
+            {"row": index + 1, "driverId": key[3], "raceType": key[2]}
+            for key, index in seen.items()
+            if key in existing
+        ]
+        conflicting_imports = {existing[key] for key in seen if key in existing}
+        if len(conflicts) == len(seen) and len(conflicting_imports) == 1 and None not in conflicting_imports:
+            # The same sheet again: resume its import if it never finished
+            import_ref = db.collection("race_imports").document(conflicting_imports.pop())
+            import_doc = import_ref.get()
+            import_data = (import_doc.to_dict() or {}) if import_doc.exists else {}
+            if import_data.get("status") == "pending":
+                if not _apply_race_import(db, import_ref, import_data):
+                    return https_fn.Response(
+                        "Import resumed but derived views are still pending; retry the request",
+                        status=503,
+                    )
+                return https_fn.Response(
+                    json.dumps(
+                        {
+                            "message": "Race event import resumed",
+                            "importId": import_ref.id,
+                            "imported": len(import_data.get("resultIds") or []),
+                            "ids": import_data.get("resultIds") or [],
+                        }
+                    ),
+                    status=200,
+                    headers={"Content-Type": "application/json"},
+                )
+        if conflicts:
+            return https_fn.Response(
+                json.dumps({"message": "Results already recorded", "conflicts": conflicts}),
+                status=409,
+                headers={"Content-Type": "application/json"},
+            )
+
+        schemes = _get_points_schemes(db)
+        unknown_schemes = [
+            {"row": index + 1, "errors": [f"Unknown points scheme: {data['pointsScheme']}"]}
+            for index, data in enumerate(results)
+            if data.get("pointsScheme") and data["pointsScheme"] not in schemes
+        ]
+        if unknown_schemes:
+            return https_fn.Response(
+                json.dumps({"message": "Validation failed", "errors": unknown_schemes}),
+                status=400,
+                headers={"Content-Type": "application/json"},
+            )
+
+        import_ref = db.collection("race_imports").document()
+        import_id = import_ref.id
+        race_results = []
+        for data in results:
+            race_result = _build_race_result(data, decoded_token["uid"], schemes)
+            race_result["importId"] = import_id
+            race_results.append((db.collection("race_results").document(), race_result))
+
+        # Logged before the results so a failure after the commit can resume
+        import_data = {
+            "event": event,
+            "resultIds": [ref.id for ref, _ in race_results],
+            "importedBy": decoded_token["uid"],
+            "importedAt": firestore.SERVER_TIMESTAMP,
+            "status": "pending",
+        }
+        import_ref.set(import_data)
+
+        committed_at = None
+        try:
+            for i in range(0, len(race_results), FIRESTORE_BATCH_LIMIT):
+                batch = db.batch()
+                for ref, race_result in race_results[i:i + FIRESTORE_BATCH_LIMIT]:
+                    batch.set(ref, race_result)
+                committed_at = _commit_time(batch.commit()) or committed_at
+        except Exception:
+            import_ref.update({"status": "failed"})
+            raise
+        import_data["committedAt"] = committed_at
+        import_ref.update({"committedAt": committed_at})
+
+        if not _apply_race_import(db, import_ref, import_data, race_results):
+            return https_fn.Response(
+                json.dumps(
+                    {
+                        "message": "Results imported but derived views are still pending; retry the request",
+                        "importId": import_id,
+                        "ids": [ref.id for ref, _ in race_results],
+                    }
+                ),
+                status=503,
+                headers={"Content-Type": "application/json"},
+            )
+
+        return https_fn.Response(
+            json.dumps(
+                {
+                    "message": "Race event imported",
+                    "importId": import_id,
+                    "imported": len(race_results),
+                    "ids": [ref.id for ref, _ in race_results],
+                }
+            ),
+            status=200,
+            headers={"Content-Type": "application/json"},
+        )
+
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+
+# Fields a client may request with fields= (see handleAddRaceResult)
+RACE_RESULT_FIELDS = frozenset(
+    (
+        "driverId", "driverName", "carNumber", "raceDate", "trackName",
+        "trackLocation", "season", "raceType", "startPosition", "finishPosition",
+        "lapTimes", "fastestLap", "points", "incidents", "weather", "notes",
+        "createdAt", "createdBy", "lapPace",
+    )
+)
+# Fields _race_rollup_contribution reads
+ROLLUP_SOURCE_FIELDS = [
+    "driverName", "startPosition", "finishPosition", "fastestLap", "points", "lapTimes", "lapPace",
+]
+RACE_ANALYTICS_SECTIONS = frozenset(("summary", "races"))
+
+
+@https_fn.on_request(cors=CORS_OPTIONS)
+def handleGetRaceAnalytics(req: https_fn.Request) -> https_fn.Response:
+    """Get comprehensive race analytics for a driver."""
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "GET":
+        return https_fn.Response("Method not allowed", status=405)
+
+    driver_id = req.args.get("driverId")
+    season = req.args.get("season")
+    track_name = req.args.get("trackName")
+
+    if not driver_id:
+        return https_fn.Response("driverId parameter is required", status=400)
+
+    # include= picks the response sections; includeRaces=false is the older
+    # spelling of include=summary. Only the race list needs a scan.
+    include = {part.strip() for part in req.args.get("include", "summary,races").split(",")}
+    if req.args.get("includeRaces", "true").lower() in ("false", "0", "no"):
+        include.discard("races")
+    if not include or not include <= RACE_ANALYTICS_SECTIONS:
+        return https_fn.Response(
+            f"include must be a comma-separated subset of {sorted(RACE_ANALYTICS_SECTIONS)}",
+            status=400,
+        )
+    fields = None
+    if req.args.get("fields"):
+        fields = list(dict.fromkeys(f.strip() for f in req.args["fields"].split(",") if f.strip()))
+        unknown = [f for f in fields if f not in RACE_RESULT_FIELDS]
+        if unknown:
+            return https_fn.Response(f"Unknown fields: {unknown}", status=400)
+
+    try:
+        db = firestore.client()
+
+        rollup = None
+        if "summary" in include:
+            rollup_doc = (
+                db.collection("driver_rollups")
+                .document(_driver_rollup_id(driver_id, season, track_name))
+                .get()
+            )
+            rollup = rollup_doc.to_dict() if rollup_doc.exists else None
+            if rollup is None:
+                # First read of this scope: build the rollup from a scan
+                try:
+                    rollup = _seed_driver_rollup(
+                        db, {"driverId": driver_id, "season": season, "trackName": track_name}
+                    ) or {}
+                except Exception as e:
+                    try:
+                        sentry_sdk.capture_exception(e)
+                    except Exception:
+                        pass
+        # Rollup could not be seeded: fold the scanned races instead
+        fold_races = "summary" in include and rollup is None
+
+        races_data = []
+        if "races" in include or fold_races:
+            query = db.collection("race_results").where("driverId", "==", driver_id)
+            if season:
+                query = query.where("season", "==", season)
+            if track_name:
+                query = query.where("trackName", "==", track_name)
+            if fields is not None or "races" not in include:
+                # Push the projection into the query; a fold also needs its inputs
+                selected = list(fields or [])
+                if fold_races:
+                    selected += [f for f in ROLLUP_SOURCE_FIELDS if f not in selected]
+                query = query.select(selected)
+
+            races_data = [{"id": race_doc.id, **race_doc.to_dict()} for race_doc in query.stream()]
+
+            if fold_races and races_data:
+                rollup = {}
+                for race_data in races_data:
+                    _fold_race_into_rollup(rollup, race_data)
+            if fields is not None:
+                races_data = [
+                    {"id": race["id"], **{f: race[f] for f in fields if f in race}}
+                    for race in races_data
+                ]
+
+        if "summary" in include and (not rollup or not rollup.get("races")):
+            return https_fn.Response(
+                json.dumps({"message": "No race data found", "analytics": {}}),
+                status=200,
+                headers={"Content-Type": "application/json"},
+            )
+
+        analytics = {"driverId": driver_id}
+        if "summary" in include:
+            analytics.update(_rollup_analytics(rollup))
+        if "races" in include:
+            analytics["races"] = races_data
+
+        return https_fn.Response(
+            json.dumps(analytics, default=str),
+            status=200,
+            headers={"Content-Type": "application/json"},
+        )
+
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+
+# Exports stream race_results a page at a time. "results" has one row per
+# result with scalar columns only; "laps" flattens lapTimes into long format
+# (one row per lap), so neither layout needs nested values.
+EXPORT_PAGE_SIZE = 500
+EXPORT_RESULT_COLUMNS = [
+    "id", "driverId", "driverName", "carNumber", "raceDate", "trackName",
+    "trackLocation", "season", "raceType", "startPosition", "finishPosition",
+    "fastestLap", "points", "incidents", "weather", "notes",
+]
+EXPORT_LAP_COLUMNS = [
+    "raceId", "driverId", "season", "raceDate", "trackName", "raceType",
+    "lap", "lapTime", "slowLap",
+]
+
+
+def _export_rows(race_id, race, table):
+    """Flat export rows for one race result."""
+    if table == "results":
+        row = {column: race.get(column) for column in EXPORT_RESULT_COLUMNS}
+        row["id"] = race_id
+        row["incidents"] = ";".join(str(i) for i in race.get("incidents") or [])
+        return [row]
+
+    lap_pace = race.get("lapPace") or {}
+    slow_laps = set(lap_pace.get("slowLaps") or [])
+    return [
+        {
+            "raceId": race_id,
+            "driverId": race.get("driverId"),
+            "season": race.get("season"),
+            "raceDate": race.get("raceDate"),
+            "trackName": race.get("trackName"),
+            "raceType": race.get("raceType"),
+            "lap": index + 1,
+            "lapTime": lap_time,
+            "slowLap": index in slow_laps,
+        }
+        for index, lap_time in enumerate(race.get("lapTimes") or [])
+    ]
+
+
+def _export_pages(db, season, driver_id, fields):
+    """Yield race_results documents page by page in document-ID order."""
+    cursor = None
+    while True:
+        query = db.collection("race_results")
+        if season:
+            query = query.where("season", "==", season)
+        if driver_id:
+            query = query.where("driverId", "==", driver_id)
+        query = query.select(fields).order_by("__name__").limit(EXPORT_PAGE_SIZE)
+        if cursor:
+            query = query.start_after({"__name__": cursor})
+        docs = list(query.stream())
+        yield from docs
+        if len(docs) < EXPORT_PAGE_SIZE:
+            return
+        cursor = docs[-1].id
+
+
+@https_fn.on_request(cors=CORS_OPTIONS, timeout_sec=540)
+def handleExportRaceResults(req: https_fn.Request) -> https_fn.Response:
+    """Stream race_results as NDJSON or CSV (Admin only).
+
+    The body is produced by a generator, one page of documents at a time,
+    so memory use does not grow with the size of the export. A failure
+    mid-stream ends the body with an error record: an {"error": ...} line
+    for NDJSON, a "# error: ..." line for CSV.
+    """
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "GET":
+        return https_fn.Response("Method not allowed", status=405)
+
+    decoded_token, auth_error = _get_user_from_token(req)
+    if auth_error:
+        return auth_error
+
+    if not _is_admin(decoded_token):
+        return https_fn.Response("Forbidden: Admin role required", status=403)
+
+    export_format = req.args.get("format", "ndjson")
+    table = req.args.get("table", "results")
+    season = req.args.get("season")
+    driver_id = req.args.get("driverId")
+    if export_format not in ("ndjson", "csv"):
+        return https_fn.Response("format must be ndjson or csv", status=400)
+    if table not in ("results", "laps"):
+        return https_fn.Response("table must be results or laps", status=400)
+
+    columns = EXPORT_RESULT_COLUMNS if table == "results" else EXPORT_LAP_COLUMNS
+    if table == "results":
+        fields = [column for column in EXPORT_RESULT_COLUMNS if column != "id"]
+    else:
+        fields = ["driverId", "season", "raceDate", "trackName", "raceType", "lapTimes", "lapPace"]
+
+    try:
+        db = firestore.client()
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+    def _generate():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+        if export_format == "csv":
+            writer.writeheader()
+        try:
+            for doc in _export_pages(db, season, driver_id, fields):
+                for row in _export_rows(doc.id, doc.to_dict() or {}, table):
+                    if export_format == "ndjson":
+                        buffer.write(json.dumps(row, default=str) + "\n")
+                    else:
+                        writer.writerow(row)
+                chunk = buffer.getvalue()
+                if chunk:
+                    yield chunk
+                    buffer.seek(0)
+                    buffer.truncate()
+        except Exception as e:
+            # Headers are already sent, so end the stream with an error record
+            # rather than letting a truncated export look complete
+            try:
+                sentry_sdk.capture_exception(e)
+            except Exception:
+                pass
+            if export_format == "ndjson":
+                buffer.write(json.dumps({"error": f"Export failed: {e}"}) + "\n")
+            else:
+                buffer.write(f"# error: Export failed: {e}\n")
+        chunk = buffer.getvalue()
+        if chunk:
+            yield chunk
+
+    extension = "ndjson" if export_format == "ndjson" else "csv"
+    filename = f"race_{table}{'_' + _rollup_key_part(season) if season else ''}.{extension}"
+    return https_fn.Response(
+        _generate(),
+        status=200,
+        headers={
+            "Content-Type": (
+                "application/x-ndjson" if export_format == "ndjson" else "text/csv; charset=utf-8"
+            ),
+            "Content-Disposition": f'attachment; filename="{filename}"',
+        },
+    )
+
+
+# Lap analytics work on a (races x laps) matrix padded with NaN, so every
+# statistic is one vectorized pass over all of a driver's races.
+LAP_ROLLING_WINDOW = 5
+LAP_PERCENTILES = (10, 25, 75, 90)
+
+
+def _lap_matrix(lap_lists):
+    """Stack ragged lapTimes lists into a NaN-padded float matrix."""
+    width = max((len(laps) for laps in lap_lists), default=0)
+    matrix = np.full((len(lap_lists), width), np.nan)
+    for row, laps in enumerate(lap_lists):
+        values = [_as_lap_time(lap) for lap in laps]
+        matrix[row, : len(values)] = [np.nan if v is None else v for v in values]
+    return matrix
+
+
+def _rounded(values, digits=3):
+    """Round a NumPy array to JSON-safe floats, mapping NaN/inf to None."""
+    return [round(float(v), digits) if np.isfinite(v) else None for v in values]
+
+
+def _row_slopes(matrix):
+    """Least-squares slope of each row against its column index, ignoring NaN."""
+    mask = ~np.isnan(matrix)
+    counts = mask.sum(axis=1)
+    x = np.broadcast_to(np.arange(matrix.shape[1], dtype=float), matrix.shape)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_mean = np.where(mask, x, 0).sum(axis=1) / counts
+        y_mean = np.where(mask, matrix, 0).sum(axis=1) / counts
+        dx = np.where(mask, x - x_mean[:, None], 0)
+        dy = np.where(mask, matrix - y_mean[:, None], 0)
+        denominator = (dx * dx).sum(axis=1)
+        return np.where(denominator > 0, (dx * dy).sum(axis=1) / denominator, np.nan)
+
+
+def _best_rolling_average(matrix, window):
+    """Fastest mean over `window` consecutive valid laps for each row."""
+    if matrix.shape[1] < window:
+        return np.full(matrix.shape[0], np.nan)
+    # Windows spanning a missing lap average to NaN and are skipped
+    window_means = sliding_window_view(matrix, window, axis=1).mean(axis=2)
+    best = np.where(np.isnan(window_means), np.inf, window_means).min(axis=1)
+    return np.where(np.isinf(best), np.nan, best)
+
+
+# Caution and incident laps are flagged per race: a lap is "slow" when it is
+# more than LAP_OUTLIER_MAD_K scaled median absolute deviations, and at least
+# LAP_OUTLIER_MIN_RATIO, above the race's median lap. The flags and lap sums
+# are cached on the result as "lapPace" (see _race_lap_pace), with a digest
+# of the lapTimes they were built from; bump LAP_PACE_VERSION when the
+# detector changes so stale caches are recomputed.
+LAP_PACE_VERSION = 1
+LAP_OUTLIER_MAD_K = 3.5
+LAP_OUTLIER_MIN_RATIO = 0.05
+
+
+def _slow_lap_mask(matrix):
+    """Boolean matrix marking slow (non-green-flag) laps in each row."""
+    if not matrix.size:
+        return np.zeros(matrix.shape, bool)
+    with warnings.catch_warnings():
+        # Rows without any valid lap have no median
+        warnings.simplefilter("ignore", RuntimeWarning)
+        medians = np.nanmedian(matrix, axis=1)[:, None]
+        mads = np.nanmedian(np.abs(matrix - medians), axis=1)[:, None]
+    margin = np.maximum(LAP_OUTLIER_MAD_K * 1.4826 * mads, LAP_OUTLIER_MIN_RATIO * medians)
+    with np.errstate(invalid="ignore"):
+        return matrix > medians + margin
+
+
+def _lap_times_digest(lap_times):
+    """Short digest of a lapTimes list, stored with its lapPace cache."""
+    payload = json.dumps(list(lap_times or []), default=str, separators=(",", ":"))
+    return hashlib.blake2b(payload.encode(), digest_size=8).hexdigest()
+
+
+def _lap_pace_current(race):
+    """True when a result's lapPace cache was built from its current lapTimes."""
+    cached = race.get("lapPace")
+    return (
+        isinstance(cached, dict)
+        and cached.get("version") == LAP_PACE_VERSION
+        and cached.get("lapsHash") == _lap_times_digest(race.get("lapTimes"))
+    )
+
+
+def _lap_pace_summaries(lap_lists):
+    """Slow-lap flags and raw/green-flag lap sums for each lapTimes list."""
+    matrix = _lap_matrix(lap_lists)
+    slow = _slow_lap_mask(matrix)
+    valid = ~np.isnan(matrix)
+    green = valid & ~slow
+    lap_counts = valid.sum(axis=1)
+    lap_sums = np.where(valid, matrix, 0).sum(axis=1)
+    green_counts = green.sum(axis=1)
+    green_sums = np.where(green, matrix, 0).sum(axis=1)
+
+    summaries = []
+    for row in range(matrix.shape[0]):
+        if not lap_counts[row]:
+            summaries.append(None)
+            continue
+        summaries.append(
+            {
+                "version": LAP_PACE_VERSION,
+                "lapsHash": _lap_times_digest(lap_lists[row]),
+                "slowLaps": [int(i) for i in np.flatnonzero(slow[row])],
+                "lapCount": int(lap_counts[row]),
+                "lapSum": round(float(lap_sums[row]), 3),
+                "greenLapCount": int(green_counts[row]),
+                "greenLapSum": round(float(green_sums[row]), 3),
+            }
+        )
+    return summaries
+
+
+def _race_lap_pace(race):
+    """A race's cached lapPace, recomputed when missing or out of date.
+
+    A cache whose lapsHash no longer matches lapTimes (lapTimes edited
+    directly) counts as out of date.
+    """
+    if _lap_pace_current(race):
+        return race["lapPace"]
+    return _lap_pace_summaries([race.get("lapTimes") or []])[0]
+
+
+def _lap_summary(laps):
+    """Pooled statistics over a flat array of valid lap times."""
+    if not laps.size:
+        return None
+    percentiles = np.percentile(laps, LAP_PERCENTILES)
+    return {
+        "lapCount": int(laps.size),
+        "meanLap": round(float(laps.mean()), 3),
+        "medianLap": round(float(np.median(laps)), 3),
+        "stdDev": round(float(laps.std()), 3),
+        "bestLap": round(float(laps.min()), 3),
+        "percentiles": {f"p{p}": v for p, v in zip(LAP_PERCENTILES, _rounded(percentiles))},
+    }
+
+
+def _lap_time_analytics(races, window=LAP_ROLLING_WINDOW):
+    """Per-race and pooled lap statistics for races with lapTimes.
+
+    `races` is a list of race dicts carrying an "id"; races without any valid
+    lap time are left out.
+    """
+    matrix = _lap_matrix([race.get("lapTimes") or [] for race in races])
+    has_laps = (~np.isnan(matrix)).any(axis=1) if matrix.size else np.zeros(len(races), bool)
+    races = [race for race, keep in zip(races, has_laps) if keep]
+    matrix = matrix[has_laps]
+    if not races:
+        return {"overall": None, "greenFlagOverall": None, "races": []}
+
+    # Slow-lap flags come from each result's cache; only stale rows are scanned
+    slow = np.zeros(matrix.shape, bool)
+    stale_rows = []
+    for row, race in enumerate(races):
+        if _lap_pace_current(race):
+            indices = [i for i in race["lapPace"].get("slowLaps") or [] if 0 <= i < matrix.shape[1]]
+            slow[row, indices] = True
+        else:
+            stale_rows.append(row)
+    if stale_rows:
+        slow[stale_rows] = _slow_lap_mask(matrix[stale_rows])
+    green_matrix = np.where(slow, np.nan, matrix)
+
+    lap_counts = (~np.isnan(matrix)).sum(axis=1)
+    green_counts = (~np.isnan(green_matrix)).sum(axis=1)
+    means = np.nanmean(matrix, axis=1)
+    medians = np.nanmedian(matrix, axis=1)
+    std_devs = np.nanstd(matrix, axis=1)
+    percentiles = np.nanpercentile(matrix, LAP_PERCENTILES, axis=1)
+    slopes = _row_slopes(matrix)
+    best_rolling = _best_rolling_average(matrix, window)
+
+    columns = {
+        "meanLap": _rounded(means),
+        "medianLap": _rounded(medians),
+        "stdDev": _rounded(std_devs),
+        "degradationPerLap": _rounded(slopes, 4),
+        "bestRollingAvg": _rounded(best_rolling),
+    }
+    percentile_columns = [_rounded(row) for row in percentiles]
+
+    with warnings.catch_warnings():
+        # A race made up only of slow laps has no green-flag pace
+        warnings.simplefilter("ignore", RuntimeWarning)
+        green_columns = {
+            "meanLap": _rounded(np.nanmean(green_matrix, axis=1)),
+            "medianLap": _rounded(np.nanmedian(green_matrix, axis=1)),
+            "stdDev": _rounded(np.nanstd(green_matrix, axis=1)),
+        }
+
+    race_stats = []
+    for i, race in enumerate(races):
+        race_stats.append(
+            {
+                "raceId": race.get("id"),
+                "raceDate": race.get("raceDate"),
+                "trackName": race.get("trackName"),
+                "lapCount": int(lap_counts[i]),
+                **{name: values[i] for name, values in columns.items()},
+                "percentiles": {
+                    f"p{p}": percentile_columns[j][i] for j, p in enumerate(LAP_PERCENTILES)
+                },
+                "slowLaps": [int(lap) for lap in np.flatnonzero(slow[i])],
+                "greenFlag": {
+                    "lapCount": int(green_counts[i]),
+                    **{name: values[i] for name, values in green_columns.items()},
+                },
+            }
+        )
+
+    return {
+        "overall": _lap_summary(matrix[~np.isnan(matrix)]),
+        "greenFlagOverall": _lap_summary(green_matrix[~np.isnan(green_matrix)]),
+        "races": race_stats,
+    }
+
+
+@https_fn.on_request(cors=CORS_OPTIONS)
+def handleGetLapAnalytics(req: https_fn.Request) -> https_fn.Response:
+    """Get lap-time statistics for a driver from their races' lapTimes."""
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "GET":
+        return https_fn.Response("Method not allowed", status=405)
+
+    driver_id = req.args.get("driverId")
+    season = req.args.get("season")
+    track_name = req.args.get("trackName")
+
+    if not driver_id:
+        return https_fn.Response("driverId parameter is required", status=400)
+    try:
+        window = max(2, min(int(req.args.get("window", LAP_ROLLING_WINDOW)), 50))
+    except ValueError:
+        return https_fn.Response("window must be an integer", status=400)
+
+    try:
+        db = firestore.client()
+
+        query = db.collection("race_results").where("driverId", "==", driver_id)
+        if season:
+            query = query.where("season", "==", season)
+        if track_name:
+            query = query.where("trackName", "==", track_name)
+
+        races = [
+            {"id": race_doc.id, **(race_doc.to_dict() or {})}
+            for race_doc in query.select(["lapTimes", "lapPace", "raceDate", "trackName"]).stream()
+        ]
+        races.sort(key=lambda race: str(race.get("raceDate") or ""))
+
+        analytics = _lap_time_analytics(races, window)
+
+        return https_fn.Response(
+            json.dumps(
+                {
+                    "driverId": driver_id,
+                    "season": season,
+                    "trackName": track_name,
+                    "window": window,
+                    "racesAnalyzed": len(analytics["races"]),
+                    **analytics,
+                },
+                default=str,
+            ),
+            status=200,
+            headers={"Content-Type": "application/json"},
+        )
+
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+
+# Lap-delta responses for a finished race only change if a result is
+# corrected, so they are cached in memory per instance and marked cacheable
+# for the Hosting CDN. Races from today or later, whose laps may still be
+# coming in, get a short in-memory TTL and max-age.
+LAP_DELTA_CACHE_SIZE = 128
+LAP_DELTA_CACHE_TTL_SECONDS = 3600
+LAP_DELTA_RECENT_CACHE_TTL_SECONDS = 60
+LAP_DELTA_PAST_CACHE_CONTROL = "public, max-age=3600, s-maxage=86400"
+LAP_DELTA_RECENT_CACHE_CONTROL = "public, max-age=60"
+_lap_delta_cache = OrderedDict()
+
+
+def _lap_deltas(results, reference_id):
+    """Align lapTimes and compute gaps to the reference driver.
+
+    Returns one dict per result with lapTimes, cumulative times, the
+    cumulative gap to the reference (positive = behind) and per-lap deltas
+    (positive = slower). A missing lap leaves the cumulative series None from
+    that point on.
+    """
+    matrix = _lap_matrix([result.get("lapTimes") or [] for result in results])
+    cumulative = np.cumsum(matrix, axis=1)
+    reference = next(i for i, r in enumerate(results) if r.get("driverId") == reference_id)
+    gaps = cumulative - cumulative[reference]
+    deltas = matrix - matrix[reference]
+
+    return [
+        {
+            "driverId": result.get("driverId"),
+            "driverName": result.get("driverName"),
+            "finishPosition": result.get("finishPosition"),
+            "lapTimes": _rounded(matrix[i]),
+            "cumulative": _rounded(cumulative[i]),
+            "gapToReference": _rounded(gaps[i]),
+            "lapDelta": _rounded(deltas[i]),
+        }
+        for i, result in enumerate(results)
+    ]
+
+
+@https_fn.on_request(cors=CORS_OPTIONS)
+def handleGetLapDelta(req: https_fn.Request) -> https_fn.Response:
+    """Lap-by-lap gaps between drivers in one race, ready for charting."""
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "GET":
+        return https_fn.Response("Method not allowed", status=405)
+
+    race_date = req.args.get("raceDate")
+    track_name = req.args.get("trackName")
+    race_type = req.args.get("raceType", "Feature")
+    driver_ids = [d.strip() for d in (req.args.get("driverIds") or "").split(",") if d.strip()]
+    reference_id = req.args.get("reference")
+
+    if not race_date or not track_name:
+        return https_fn.Response("raceDate and trackName are required", status=400)
+    if driver_ids and len(set(driver_ids)) < 2:
+        return https_fn.Response("driverIds must list at least two drivers", status=400)
+
+    cache_key = (race_date, track_name, race_type, tuple(driver_ids), reference_id)
+    finished = str(race_date) < datetime.utcnow().date().isoformat()
+    cache_control = LAP_DELTA_PAST_CACHE_CONTROL if finished else LAP_DELTA_RECENT_CACHE_CONTROL
+    cache_ttl = LAP_DELTA_CACHE_TTL_SECONDS if finished else LAP_DELTA_RECENT_CACHE_TTL_SECONDS
+    cached = _lap_delta_cache.get(cache_key)
+    if cached and cached[0] > time.time():
+        _lap_delta_cache.move_to_end(cache_key)
+        return https_fn.Response(
+            cached[1],
+            status=200,
+            headers={"Content-Type": "application/json", "Cache-Control": cache_control},
+        )
+
+    try:
+        db = firestore.client()
+
+        query = (
+            db.collection("race_results")
+            .where("raceDate", "==", race_date)
+            .where("trackName", "==", track_name)
+            .where("raceType", "==", race_type)
+            .select(["driverId", "driverName", "finishPosition", "lapTimes"])
+        )
+        results = [r for r in (doc.to_dict() or {} for doc in query.stream()) if r.get("lapTimes")]
+        if driver_ids:
+            by_driver = {r.get("driverId"): r for r in results}
+            missing = [d for d in driver_ids if d not in by_driver]
+            if missing:
+                return https_fn.Response(
+                    json.dumps({"message": "No lap times for drivers", "driverIds": missing}),
+                    status=404,
+                    headers={"Content-Type": "application/json"},
+                )
+            results = [by_driver[d] for d in dict.fromkeys(driver_ids)]
+        else:
+            results.sort(key=lambda r: _as_position(r.get("finishPosition")) or float("inf"))
+
+        if len(results) < 2:
+            return https_fn.Response(
+                json.dumps({"message": "At least two results with lap times are required"}),
+                status=404,
+                headers={"Content-Type": "application/json"},
+            )
+
+        if not reference_id:
+            reference_id = results[0].get("driverId")
+        elif reference_id not in {r.get("driverId") for r in results}:
+            return https_fn.Response("reference must be one of the compared drivers", status=400)
+
+        body = json.dumps(
+            {
+                "raceDate": race_date,
+                "trackName": track_name,
+                "raceType": race_type,
+                "reference": reference_id,
+                "laps": max(len(r["lapTimes"]) for r in results),
+                "drivers": _lap_deltas(results, reference_id),
+            },
+            default=str,
+        )
+
+        _lap_delta_cache[cache_key] = (time.time() + cache_ttl, body)
+        _lap_delta_cache.move_to_end(cache_key)
+        while len(_lap_delta_cache) > LAP_DELTA_CACHE_SIZE:
+            _lap_delta_cache.popitem(last=False)
+
+        return https_fn.Response(
+            body,
+            status=200,
+            headers={"Content-Type": "application/json", "Cache-Control": cache_control},
+        )
+
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+
+# Multi-driver comparisons fetch every driver's results with chunked "in"
+# queries run in parallel (Firestore allows 30 values per "in" filter).
+FIRESTORE_IN_LIMIT = 30
+MAX_COMPARISON_DRIVERS = 60
+COMPARISON_RACE_FIELDS = [
+    "driverId",
+    "driverName",
+    "raceDate",
+    "trackName",
+    "raceType",
+    "season",
+    "startPosition",
+    "finishPosition",
+    "fastestLap",
+    "points",
+    "lapPace",
+]
+
+
+def _stream_driver_races(db, driver_ids, season=None, fields=None):
+    """All race results for the given drivers, one parallel query per chunk."""
+    chunks = [
+        driver_ids[i:i + FIRESTORE_IN_LIMIT]
+        for i in range(0, len(driver_ids), FIRESTORE_IN_LIMIT)
+    ]
+
+    def _fetch(chunk):
+        query = db.collection("race_results").where("driverId", "in", chunk)
+        if season:
+            query = query.where("season", "==", season)
+        if fields:
+            query = query.select(fields)
+        return [{"id": doc.id, **(doc.to_dict() or {})} for doc in query.stream()]
+
+    if len(chunks) <= 1:
+        return [race for chunk in chunks for race in _fetch(chunk)]
+    with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+        return [race for races in executor.map(_fetch, chunks) for race in races]
+
+
+def _comparison_stats(driver_id, rollup):
+    stats = _rollup_analytics(rollup)
+    return {
+        "driverId": driver_id,
+        "driverName": rollup.get("driverName", "Unknown"),
+        "totalRaces": stats["totalRaces"],
+        "totalPoints": stats["totalPoints"],
+        "avgFinishPosition": stats["avgFinishPosition"],
+        "bestFinish": stats["bestFinish"],
+        "worstFinish": stats["worstFinish"],
+        "fastestLapTime": stats["fastestLapTime"],
+    }
+
+
+def _head_to_head(races, driver_ids):
+    """Pairwise finishing record for drivers who entered the same race.
+
+    Races are matched on (raceDate, trackName, raceType). Returns
+    {driverA: {driverB: {"races", "ahead", "behind"}}} for every pair.
+    """
+    finishes_by_race = {}
+    for race in races:
+        finish = _as_position(race.get("finishPosition"))
+        if not finish:
+            continue
+        key = (str(race.get("raceDate")), race.get("trackName"), race.get("raceType"))
+        finishes = finishes_by_race.setdefault(key, {})
+        driver_id = race.get("driverId")
+        finishes[driver_id] = min(finish, finishes.get(driver_id, finish))
+
+    matrix = {
+        a: {b: {"races": 0, "ahead": 0, "behind": 0} for b in driver_ids if b != a}
+        for a in driver_ids
+    }
+    for finishes in finishes_by_race.values():
+        entered = [d for d in driver_ids if d in finishes]
+        for i, a in enumerate(entered):
+            for b in entered[i + 1:]:
+                matrix[a][b]["races"] += 1
+                matrix[b][a]["races"] += 1
+                if finishes[a] < finishes[b]:
+                    matrix[a][b]["ahead"] += 1
+                    matrix[b][a]["behind"] += 1
+                elif finishes[b] < finishes[a]:
+                    matrix[b][a]["ahead"] += 1
+                    matrix[a][b]["behind"] += 1
+    return matrix
+
+
+def _driver_comparison_matrix(db, driver_ids, season):
+    """Stats for each driver plus the pairwise head-to-head matrix."""
+    rollup_refs = [
+        db.collection("driver_rollups").document(_driver_rollup_id(driver_id, season))
+        for driver_id in driver_ids
+    ]
+    rating_refs = [db.collection("driver_ratings").document(driver_id) for driver_id in driver_ids]
+    # Rollups and race results are independent reads; fetch them together
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        docs_future = executor.submit(lambda: list(db.get_all(rollup_refs + rating_refs)))
+        races_future = executor.submit(
+            _stream_driver_races, db, driver_ids, season, COMPARISON_RACE_FIELDS
+        )
+        rollups = {}
+        ratings = {}
+        for doc in docs_future.result():
+            if not doc.exists:
+                continue
+            if doc.reference.parent.id == "driver_ratings":
+                ratings[doc.id] = doc.to_dict() or {}
+            else:
+                rollups[doc.id] = doc.to_dict()
+        races = races_future.result()
+
+    drivers = []
+    for driver_id in driver_ids:
+        rollup = rollups.get(_driver_rollup_id(driver_id, season))
+        if rollup is None:
+            # No rollup yet: fold the races fetched for the matrix
+            rollup = {}
+            for race in races:
+                if race.get("driverId") == driver_id:
+                    _fold_race_into_rollup(rollup, race)
+        if rollup.get("races"):
+            stats = _comparison_stats(driver_id, rollup)
+            # Ratings are career-wide and account for the strength of each field
+            rating = ratings.get(driver_id, {}).get("rating")
+            stats["rating"] = round(rating, 1) if rating is not None else None
+            drivers.append(stats)
+
+    def _leader(field, lowest):
+        ranked = [d for d in drivers if d.get(field) is not None]
+        if not ranked:
+            return None
+        pick = min if lowest else max
+        return pick(ranked, key=lambda d: d[field])["driverId"]
+
+    return {
+        "season": season,
+        "drivers": drivers,
+        "headToHead": _head_to_head(races, [d["driverId"] for d in drivers]),
+        "leaders": {
+            "avgFinish": _leader("avgFinishPosition", lowest=True),
+            "totalPoints": _leader("totalPoints", lowest=False),
+            "bestFinish": _leader("bestFinish", lowest=True),
+            "rating": _leader("rating", lowest=False),
+        },
+    }
+
+
+@https_fn.on_request(cors=CORS_OPTIONS)
+def handleDriverComparison(req: https_fn.Request) -> https_fn.Response:
+    """Compare two drivers' performance, or any list of drivers via driverIds."""
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "GET":
+        return https_fn.Response("Method not allowed", status=405)
+
+    driver1_id = req.args.get("driver1Id")
+    driver2_id = req.args.get("driver2Id")
+    season = req.args.get("season")
+
+    if req.args.get("driverIds"):
+        driver_ids = list(
+            dict.fromkeys(d.strip() for d in req.args["driverIds"].split(",") if d.strip())
+        )
+        if len(driver_ids) < 2:
+            return https_fn.Response("driverIds must list at least two drivers", status=400)
+        if len(driver_ids) > MAX_COMPARISON_DRIVERS:
+            return https_fn.Response(
+                f"At most {MAX_COMPARISON_DRIVERS} drivers can be compared", status=400
+            )
+        try:
+            comparison = _driver_comparison_matrix(firestore.client(), driver_ids, season)
+            return https_fn.Response(
+                json.dumps(comparison, default=str),
+                status=200,
+                headers={"Content-Type": "application/json"},
+            )
+        except Exception as e:
+            try:
+                sentry_sdk.capture_exception(e)
+            except Exception:
+                pass
+            return https_fn.Response(f"An error occurred: {e}", status=500)
+
+    if not driver1_id or not driver2_id:
+        return https_fn.Response("Both driver1Id and driver2Id are required", status=400)
+
+    try:
+        db = firestore.client()
+
+        # Both rollups in one round trip
+        rollup_refs = [
+            db.collection("driver_rollups").document(_driver_rollup_id(driver_id, season))
+            for driver_id in (driver1_id, driver2_id)
+        ]
+        rollups = {
+            doc.id: doc.to_dict() for doc in db.get_all(rollup_refs) if doc.exists
+        }
+
+        def get_driver_stats(driver_id):
+            rollup = rollups.get(_driver_rollup_id(driver_id, season))
+            if rollup is None:
+                # Fall back to a scan for drivers without a rollup yet
+                query = db.collection("race_results").where("driverId", "==", driver_id)
+                if season:
+                    query = query.where("season", "==", season)
+                rollup = {}
+                for race_doc in query.stream():
+                    _fold_race_into_rollup(rollup, race_doc.to_dict())
+            if not rollup.get("races"):
+                return None
+
+            return _comparison_stats(driver_id, rollup)
+
+        driver1_stats = get_driver_stats(driver1_id)
+        driver2_stats = get_driver_stats(driver2_id)
+
+        if not driver1_stats or not driver2_stats:
+            return https_fn.Response(
+                json.dumps({"message": "Insufficient data for comparison"}),
+                status=200,
+                headers={"Content-Type": "application/json"},
+            )
+
+        comparison = {
+            "driver1": driver1_stats,
+            "driver2": driver2_stats,
+            "winner": {
+                "avgFinish": driver1_stats["driverId"] if (driver1_stats.get("avgFinishPosition") or 999) < (driver2_stats.get("avgFinishPosition") or 999) else driver2_stats["driverId"],
+                "totalPoints": driver1_stats["driverId"] if driver1_stats["totalPoints"] > driver2_stats["totalPoints"] else driver2_stats["driverId"],
+                "bestFinish": driver1_stats["driverId"] if (driver1_stats.get("bestFinish") or 999) < (driver2_stats.get("bestFinish") or 999) else driver2_stats["driverId"],
+            },
+        }
+
+        return https_fn.Response(
+            json.dumps(comparison, default=str),
+            status=200,
+            headers={"Content-Type": "application/json"},
+        )
+
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+
+@https_fn.on_request(cors=CORS_OPTIONS, timeout_sec=540)
+def handleRebuildDriverRollups(req: https_fn.Request) -> https_fn.Response:
+    """Recompute driver rollups from race_results (Admin only).
+
+    Optional JSON body {"driverId": ...} limits the rebuild to one driver.
+    Rollups with no remaining race results are deleted. Rebuilt rollups are
+    stamped with the scan's start as seededAt, so trigger deltas for
+    earlier writes are not applied on top of the scan (see _seeded_after).
+    """
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "POST":
+        return https_fn.Response("Method not allowed", status=405)
+
+    decoded_token, auth_error = _get_user_from_token(req)
+    if auth_error:
+        return auth_error
+
+    if not _is_admin(decoded_token):
+        return https_fn.Response("Forbidden: Admin role required", status=403)
+
+    data = req.get_json(silent=True) or {}
+    driver_id = data.get("driverId")
+
+    try:
+        db = firestore.client()
+
+        races_query = db.collection("race_results")
+        rollups_query = db.collection("driver_rollups")
+        if driver_id:
+            races_query = races_query.where("driverId", "==", driver_id)
+            rollups_query = rollups_query.where("driverId", "==", driver_id)
+
+        # Trigger deltas written before the scan started are already in it
+        scan_started = datetime.now(timezone.utc)
+        rollups = {}
+        races_scanned = 0
+        for race_doc in races_query.stream():
+            race = race_doc.to_dict() or {}
+            if not race.get("driverId"):
+                continue
+            races_scanned += 1
+            for doc_id, identity in _driver_rollup_scopes(race):
+                rollup = rollups.setdefault(doc_id, dict(identity))
+                _fold_race_into_rollup(rollup, race)
+
+        stale_refs = [
+            doc.reference for doc in rollups_query.stream() if doc.id not in rollups
+        ]
+
+        writes = [("set", doc_id, rollup) for doc_id, rollup in rollups.items()]
+        writes += [("delete", ref, None) for ref in stale_refs]
+        for i in range(0, len(writes), FIRESTORE_BATCH_LIMIT):
+            batch = db.batch()
+            for action, target, rollup in writes[i:i + FIRESTORE_BATCH_LIMIT]:
+                if action == "set":
+                    batch.set(
+                        db.collection("driver_rollups").document(target),
+                        {**rollup, "seededAt": scan_started, "updatedAt": firestore.SERVER_TIMESTAMP},
+                    )
+                else:
+                    batch.delete(target)
+            batch.commit()
+
+        return https_fn.Response(
+            json.dumps(
+                {
+                    "message": "Driver rollups rebuilt",
+                    "racesScanned": races_scanned,
+                    "rollupsWritten": len(rollups),
+                    "rollupsDeleted": len(stale_refs),
+                }
+            ),
+            status=200,
+            headers={"Content-Type": "application/json"},
+        )
+
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+
+# Record books (track_records/{id}) index every combination of track, season
+# and race type, with "all" standing in for an unfiltered dimension. Each holds
+# the top fastest laps, the first and most recent wins (by raceDate) and win
+# counts per driver. handleRaceResultWritten keeps them current; a removal that
+# may expose a record outside the stored top laps triggers a rescan of just
+# that book.
+TRACK_RECORD_LAPS = 10
+
+
+def _record_book_id(track_name=None, season=None, race_type=None):
+    """Document ID of a record book; None means "all" for that dimension."""
+    return "__".join(
+        f"{label}_{'all' if value is None else _rollup_key_part(value)}"
+        for label, value in (("track", track_name), ("season", season), ("type", race_type))
+    )
+
+
+def _record_book_scopes(race):
+    """{docId: identity fields} for every record book a race result feeds."""
+    track_name = race.get("trackName") or ""
+    season = str(race.get("season", ""))
+    race_type = race.get("raceType") or ""
+    scopes = {}
+    for scope_track in (track_name, None):
+        for scope_season in (season, None):
+            for scope_type in (race_type, None):
+                scopes[_record_book_id(scope_track, scope_season, scope_type)] = {
+                    "trackName": scope_track,
+                    "season": scope_season,
+                    "raceType": scope_type,
+                }
+    return scopes
+
+
+def _empty_record_book(identity):
+    return {
+        **identity,
+        "races": 0,
+        "fastestLaps": [],
+        "firstWin": None,
+        "latestWin": None,
+        "winsByDriver": {},
+    }
+
+
+def _record_race_entry(race_id, race):
+    return {
+        "raceId": race_id,
+        "driverId": race.get("driverId"),
+        "driverName": race.get("driverName"),
+        "raceDate": race.get("raceDate"),
+        "season": race.get("season"),
+        "trackName": race.get("trackName"),
+    }
+
+
+def _record_lap_sort_key(entry):
+    return (entry["fastestLap"], str(entry.get("raceDate") or ""), entry["raceId"])
+
+
+def _record_win_sort_key(entry):
+    return (str(entry.get("raceDate") or ""), entry["raceId"])
+
+
+def _add_race_to_record_book(book, race_id, race):
+    """Fold one race result into a record book in place."""
+    book["races"] = book.get("races", 0) + 1
+
+    fastest = _as_lap_time(race.get("fastestLap"))
+    if fastest:
+        laps = book.get("fastestLaps") or []
+        laps.append({**_record_race_entry(race_id, race), "fastestLap": fastest})
+        laps.sort(key=_record_lap_sort_key)
+        book["fastestLaps"] = laps[:TRACK_RECORD_LAPS]
+
+    if _as_position(race.get("finishPosition")) == 1 and race.get("driverId"):
+        wins_by_driver = book.setdefault("winsByDriver", {})
+        driver = wins_by_driver.setdefault(race["driverId"], {"driverId": race["driverId"], "wins": 0})
+        driver["wins"] += 1
+        driver["driverName"] = race.get("driverName")
+
+        win = _record_race_entry(race_id, race)
+        if not book.get("firstWin") or _record_win_sort_key(win) < _record_win_sort_key(book["firstWin"]):
+            book["firstWin"] = win
+        if not book.get("latestWin") or _record_win_sort_key(win) > _record_win_sort_key(book["latestWin"]):
+            book["latestWin"] = win
+    return book
+
+
+def _record_contribution(race_id, race):
+    """(fastest-lap entry, win entry) a race result adds to its record books."""
+    fastest = _as_lap_time(race.get("fastestLap"))
+    lap = {**_record_race_entry(race_id, race), "fastestLap": fastest} if fastest else None
+    won = _as_position(race.get("finishPosition")) == 1 and race.get("driverId")
+    return lap, (_record_race_entry(race_id, race) if won else None)
+
+
+def _remove_race_from_record_book(book, race_id, race, replacement=None):
+    """Take one race result back out of a record book in place.
+
+    `replacement` is the corrected result when it is added straight back to
+    the same book. Returns True when the book can no longer be derived from
+    what it stores (a full top-laps list lost an entry that its replacement
+    does not win back, or the first/latest win moved while other wins
+    remain) and must be rebuilt from race_results.
+    """
+    book["races"] = book.get("races", 0) - 1
+    rebuild = book["races"] < 0
+    new_lap, new_win = _record_contribution(race_id, replacement) if replacement else (None, None)
+
+    laps = book.get("fastestLaps") or []
+    remaining = [e for e in laps if e.get("raceId") != race_id]
+    if len(remaining) != len(laps) and len(laps) >= TRACK_RECORD_LAPS:
+        # Every lap not stored sorts after the stored last one, so a
+        # replacement that sorts no later keeps the list exact
+        if new_lap is None or _record_lap_sort_key(new_lap) > _record_lap_sort_key(laps[-1]):
+            rebuild = True
+    book["fastestLaps"] = remaining
+
+    if _as_position(race.get("finishPosition")) == 1 and race.get("driverId"):
+        wins_by_driver = book.get("winsByDriver") or {}
+        driver = wins_by_driver.get(race["driverId"])
+        if driver:
+            driver["wins"] -= 1
+            if driver["wins"] <= 0:
+                del wins_by_driver[race["driverId"]]
+        else:
+            rebuild = True
+        for field, still_holds in (
+            ("firstWin", lambda old, new: _record_win_sort_key(new) <= _record_win_sort_key(old)),
+            ("latestWin", lambda old, new: _record_win_sort_key(new) >= _record_win_sort_key(old)),
+        ):
+            holder = book.get(field) or {}
+            if holder.get("raceId") == race_id:
+                book[field] = None
+                if wins_by_driver and not (new_win and still_holds(holder, new_win)):
+                    rebuild = True
+    return rebuild
+
+
+def _compute_record_book(db, identity, transaction=None):
+    """Build a record book from the race_results matching its identity."""
+    query = db.collection("race_results")
+    for field in ("trackName", "season", "raceType"):
+        if identity.get(field) is not None:
+            query = query.where(field, "==", identity[field])
+    book = _empty_record_book(identity)
+    race_docs = transaction.get(query) if transaction is not None else query.stream()
+    for race_doc in race_docs:
+        _add_race_to_record_book(book, race_doc.id, race_doc.to_dict() or {})
+    return book
+
+
+def _seed_record_book(db, identity, replace=False):
+    """Build one record book from a scan and store it, like _seed_driver_rollup.
+
+    Unless `replace` is set, an existing book is returned as stored.
+    """
+    ref = db.collection("track_records").document(
+        _record_book_id(identity["trackName"], identity["season"], identity["raceType"])
+    )
+
+    @firestore.transactional
+    def _seed(transaction):
+        doc = ref.get(transaction=transaction)
+        if doc.exists and not replace:
+            return doc.to_dict() or {}
+        book = _compute_record_book(db, identity, transaction=transaction)
+        if book["races"]:
+            transaction.set(
+                ref,
+                {**book, "seededAt": firestore.SERVER_TIMESTAMP, "updatedAt": firestore.SERVER_TIMESTAMP},
+            )
+        elif doc.exists:
+            transaction.delete(ref)
+        return book
+
+    return _seed(db.transaction())
+
+
+def _update_track_records(db, changes, as_of=None, event_id=None):
+    """Apply race_results changes to every affected record book.
+
+    `changes` is a list of (raceId, before, after) with None for a missing
+    side; all of them go through one transaction. Books that do not exist
+    yet are left for handleGetTrackRecords to build from a scan, and books
+    seeded after `as_of` already include the changes. With `event_id`, a
+    redelivered trigger event is applied only once. Best-effort like the
+    leaderboard snapshot: books can always be rebuilt with
+    /api/rebuild-track-records, so failures are reported and False returned,
+    not raised.
+    """
+    # Edits that leave a result's books and entries as they were (notes,
+    # points, lap lists) need no transaction on the shared "all" books
+    changes = [
+        (race_id, before_data, after_data)
+        for race_id, before_data, after_data in changes
+        if not (
+            before_data
+            and after_data
+            and _record_book_scopes(before_data) == _record_book_scopes(after_data)
+            and _record_contribution(race_id, before_data) == _record_contribution(race_id, after_data)
+        )
+    ]
+    scopes = {}
+    for _, before_data, after_data in changes:
+        for data in (before_data, after_data):
+            if data:
+                scopes.update(_record_book_scopes(data))
+    if not scopes:
+        return True
+    refs = {doc_id: db.collection("track_records").document(doc_id) for doc_id in scopes}
+
+    @firestore.transactional
+    def _apply(transaction):
+        books = {}
+        for doc in transaction.get_all(list(refs.values())):
+            book = doc.to_dict() if doc.exists else None
+            if book is not None and not _seeded_after(book, as_of):
+                books[doc.id] = book
+        if not _claim_event(transaction, db, event_id, "records"):
+            return set()
+        rebuild = set()
+        for race_id, before_data, after_data in changes:
+            after_scopes = _record_book_scopes(after_data) if after_data else {}
+            if before_data:
+                for doc_id in _record_book_scopes(before_data):
+                    replacement = after_data if doc_id in after_scopes else None
+                    if doc_id in books and _remove_race_from_record_book(
+                        books[doc_id], race_id, before_data, replacement
+                    ):
+                        rebuild.add(doc_id)
+            if after_data:
+                for doc_id in _record_book_scopes(after_data):
+                    if doc_id in books:
+                        _add_race_to_record_book(books[doc_id], race_id, after_data)
+        for doc_id, book in books.items():
+            if doc_id in rebuild:
+                continue
+            if book["races"] <= 0:
+                transaction.delete(refs[doc_id])
+            else:
+                transaction.set(refs[doc_id], {**book, "updatedAt": firestore.SERVER_TIMESTAMP})
+        return rebuild
+
+    try:
+        for doc_id in _apply(db.transaction()):
+            _seed_record_book(db, scopes[doc_id], replace=True)
+        return True
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return False
+
+
+@https_fn.on_request(cors=CORS_OPTIONS)
+def handleGetTrackRecords(req: https_fn.Request) -> https_fn.Response:
+    """Get track records across all drivers."""
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "GET":
+        return https_fn.Response("Method not allowed", status=405)
+
+    track_name = req.args.get("trackName")
+    season = req.args.get("season")
+    race_type = req.args.get("raceType")
+    try:
+        limit = max(1, min(int(req.args.get("limit", TRACK_RECORD_LAPS)), TRACK_RECORD_LAPS))
+    except ValueError:
+        return https_fn.Response("limit must be an integer", status=400)
+
+    try:
+        db = firestore.client()
+
+        book_doc = (
+            db.collection("track_records")
+            .document(_record_book_id(track_name, season, race_type))
+            .get()
+        )
+        if book_doc.exists:
+            book = book_doc.to_dict() or {}
+        else:
+            # First read of this book: build it from a scan
+            identity = {"trackName": track_name, "season": season, "raceType": race_type}
+            try:
+                book = _seed_record_book(db, identity)
+            except Exception as e:
+                try:
+                    sentry_sdk.capture_exception(e)
+                except Exception:
+                    pass
+                book = _compute_record_book(db, identity)
+
+        if not book.get("races"):
+            return https_fn.Response(
+                json.dumps({"message": "No race data found"}),
+                status=200,
+                headers={"Content-Type": "application/json"},
+            )
+
+        fastest_laps = (book.get("fastestLaps") or [])[:limit]
+        fastest_lap_record = None
+        if fastest_laps:
+            fastest_lap_record = {
+                key: fastest_laps[0].get(key)
+                for key in ("driverName", "fastestLap", "raceDate", "trackName")
+            }
+
+        first_win = book.get("firstWin")
+        records = {
+            "trackName": track_name,
+            "season": season,
+            "raceType": race_type,
+            "fastestLapRecord": fastest_lap_record,
+            # The earliest win by raceDate
+            "bestFinishRecord": (
+                {key: first_win.get(key) for key in ("driverName", "raceDate", "trackName")}
+                if first_win
+                else None
+            ),
+            "totalRaces": book["races"],
+            "fastestLaps": fastest_laps,
+            "firstWin": first_win,
+            "latestWin": book.get("latestWin"),
+            "winCounts": sorted(
+                (book.get("winsByDriver") or {}).values(),
+                key=lambda d: (-d.get("wins", 0), d.get("driverName") or ""),
+            ),
+        }
+
+        return https_fn.Response(
+            json.dumps(records, default=str),
+            status=200,
+            headers={"Content-Type": "application/json"},
+        )
+
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+
+@https_fn.on_request(cors=CORS_OPTIONS, timeout_sec=540)
+def handleRebuildTrackRecords(req: https_fn.Request) -> https_fn.Response:
+    """Recompute every track record book from race_results (Admin only).
+
+    Like the rollup rebuild, books are stamped with the scan's start as
+    seededAt so the trigger skips results the scan already counted.
+    """
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "POST":
+        return https_fn.Response("Method not allowed", status=405)
+
+    decoded_token, auth_error = _get_user_from_token(req)
+    if auth_error:
+        return auth_error
+
+    if not _is_admin(decoded_token):
+        return https_fn.Response("Forbidden: Admin role required", status=403)
+
+    try:
+        db = firestore.client()
+
+        scan_started = datetime.now(timezone.utc)
+        books = {}
+        races_scanned = 0
+        for race_doc in db.collection("race_results").stream():
+            race = race_doc.to_dict() or {}
+            races_scanned += 1
+            for doc_id, identity in _record_book_scopes(race).items():
+                book = books.setdefault(doc_id, _empty_record_book(identity))
+                _add_race_to_record_book(book, race_doc.id, race)
+
+        stale_refs = [
+            doc.reference for doc in db.collection("track_records").stream() if doc.id not in books
+        ]
+
+        writes = [("set", doc_id, book) for doc_id, book in books.items()]
+        writes += [("delete", ref, None) for ref in stale_refs]
+        for i in range(0, len(writes), FIRESTORE_BATCH_LIMIT):
+            batch = db.batch()
+            for action, target, book in writes[i:i + FIRESTORE_BATCH_LIMIT]:
+                if action == "set":
+                    batch.set(
+                        db.collection("track_records").document(target),
+                        {**book, "seededAt": scan_started, "updatedAt": firestore.SERVER_TIMESTAMP},
+                    )
+                else:
+                    batch.delete(target)
+            batch.commit()
+
+        return https_fn.Response(
+            json.dumps(
+                {
+                    "message": "Track records rebuilt",
+                    "racesScanned": races_scanned,
+                    "recordBooksWritten": len(books),
+                    "recordBooksDeleted": len(stale_refs),
+                }
+            ),
+            status=200,
+            headers={"Content-Type": "application/json"},
+        )
+
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+
+# Season standings are materialized in season_standings/{season} as a map of
+# per-driver totals. handleRaceResultWritten applies the difference between the
+# old and new version of every race result, so adds, corrections and deletes all
+# flow through one path. "version" increases with every change and backs the
+# endpoint's ETag.
+STANDINGS_FIELDS = ("totalPoints", "racesEntered", "wins", "top5s")
+
+
+def _standings_doc_id(season):
+    """Document ID of a season's standings (seasons may be stored as ints)."""
+    return _rollup_key_part(season)
+
+
+def _race_standings_contribution(race):
+    """Return (season, driverId, per-driver deltas) for one race result."""
+    if not race or not race.get("driverId") or race.get("season") in (None, ""):
+        return None, None, {}
+    finish = _as_position(race.get("finishPosition"))
+    return str(race["season"]), race["driverId"], {
+        "totalPoints": _as_points(race.get("points")),
+        "racesEntered": 1,
+        "wins": 1 if finish == 1 else 0,
+        "top5s": 1 if finish and finish <= 5 else 0,
+    }
+
+
+def _compute_season_standings(db, season):
+    """Aggregate a season's per-driver totals from race_results."""
+    query = db.collection("race_results").where("season", "==", season)
+    return _fold_season_standings(season, (doc.to_dict() or {} for doc in query.stream()))
+
+
+def _fold_season_standings(season, races):
+    """Per-driver standings totals for an iterable of one season's results."""
+    drivers = {}
+    for race in races:
+        _, driver_id, deltas = _race_standings_contribution({**race, "season": season})
+        if not driver_id:
+            continue
+        entry = drivers.setdefault(
+            driver_id,
+            {
+                "driverId": driver_id,
+                "driverName": race.get("driverName"),
+                "carNumber": race.get("carNumber", ""),
+                **{field: 0 for field in STANDINGS_FIELDS},
+            },
+        )
+        for field, delta in deltas.items():
+            entry[field] += delta
+    return drivers
+
+
+def _standings_list(drivers):
+    """Sorted standings with positions, skipping drivers with no races left."""
+    standings_list = sorted(
+        (dict(d) for d in drivers.values() if d.get("racesEntered", 0) > 0),
+        key=lambda x: x.get("totalPoints", 0),
+        reverse=True,
+    )
+    for i, driver in enumerate(standings_list):
+        driver["position"] = i + 1
+    return standings_list
+
+
+def _standings_etag(season, version):
+    return f'"{_standings_doc_id(season)}-{version}"'
+
+
+def _apply_standings_changes(db, changes, as_of=None, event_id=None):
+    """Apply (before, after) race_results changes to the season standings.
+
+    Changes are netted per season and driver, so each season document gets a
+    single merge write (and a single version bump) however many results
+    changed. Seasons whose standings do not exist yet are left for
+    handleGetSeasonStandings to build from a scan, and standings seeded after
+    `as_of` already include the changes. With `event_id`, a redelivered
+    trigger event is applied only once (see _claim_event).
+    """
+    # {season: {driverId: {field: delta}}}
+    deltas_by_season = {}
+    identities = {}
+    for before_data, after_data in changes:
+        for data, sign in ((before_data, -1), (after_data, 1)):
+            season, driver_id, deltas = _race_standings_contribution(data)
+            if not driver_id:
+                continue
+            driver_deltas = deltas_by_season.setdefault(season, {}).setdefault(driver_id, {})
+            for field, delta in deltas.items():
+                driver_deltas[field] = driver_deltas.get(field, 0) + sign * delta
+            if sign > 0:
+                identities[(season, driver_id)] = {
+                    "driverId": driver_id,
+                    "driverName": data.get("driverName"),
+                    "carNumber": data.get("carNumber", ""),
+                }
+
+    updates = {}
+    for season, drivers in deltas_by_season.items():
+        update = {}
+        for driver_id, deltas in drivers.items():
+            entry = {
+                field: firestore.Increment(delta)
+                for field, delta in deltas.items()
+                if delta
+            }
+            entry.update(identities.get((season, driver_id), {}))
+            if entry:
+                update[driver_id] = entry
+        if update:
+            updates[season] = update
+    if not updates:
+        return
+    refs = {
+        season: db.collection("season_standings").document(_standings_doc_id(season))
+        for season in updates
+    }
+
+    @firestore.transactional
+    def _apply(transaction):
+        docs = {doc.id: doc for doc in transaction.get_all(list(refs.values()))}
+        if not _claim_event(transaction, db, event_id, "standings"):
+            return
+        for season, update in updates.items():
+            doc = docs.get(refs[season].id)
+            if doc is None or not doc.exists or _seeded_after(doc.to_dict(), as_of):
+                continue
+            transaction.set(
+                refs[season],
+                {
+                    "season": season,
+                    "drivers": update,
+                    "version": firestore.Increment(1),
+                    "updatedAt": firestore.SERVER_TIMESTAMP,
+                },
+                merge=True,
+            )
+
+    _apply(db.transaction())
+
+
+def _seed_season_standings(db, season):
+    """Build a season's standings from a scan of its results and store them.
+
+    Like _seed_driver_rollup, the scan runs in a transaction that re-reads
+    the standings, and seededAt lets the trigger skip results it counted.
+    Existing standings are returned as stored. Returns the drivers map.
+    """
+    ref = db.collection("season_standings").document(_standings_doc_id(season))
+    query = db.collection("race_results").where("season", "==", season)
+
+    @firestore.transactional
+    def _seed(transaction):
+        doc = ref.get(transaction=transaction)
+        if doc.exists:
+            return (doc.to_dict() or {}).get("drivers") or {}
+        drivers = _fold_season_standings(
+            season, ((race_doc.to_dict() or {}) for race_doc in transaction.get(query))
+        )
+        transaction.set(
+            ref,
+            {
+                "season": season,
+                "drivers": drivers,
+                "version": 1,
+                "seededAt": firestore.SERVER_TIMESTAMP,
+                "updatedAt": firestore.SERVER_TIMESTAMP,
+            },
+        )
+        return drivers
+
+    return _seed(db.transaction())
+
+
+@firestore_fn.on_document_written(document="race_results/{raceId}")
+def handleRaceResultWritten(
+    event: firestore_fn.Event[firestore_fn.Change[firestore_fn.DocumentSnapshot | None]],
+) -> None:
+    """Keep standings, rollups, track records and ratings in step with race_results."""
+    before = event.data.before
+    after = event.data.after
+    before_data = before.to_dict() if before is not None and before.exists else None
+    after_data = after.to_dict() if after is not None and after.exists else None
+
+    changed = None
+    if before_data is not None and after_data is not None:
+        changed = {
+            field
+            for field in before_data.keys() | after_data.keys()
+            if before_data.get(field) != after_data.get(field)
+        }
+        if changed <= {"lapPace"}:
+            # Only the lapPace cache was rewritten; nothing downstream changes
+            return
+
+    if after_data is not None and before_data is None and after_data.get("importId"):
+        # Bulk imports update standings and records once for the whole event
+        return
+    if (
+        changed is not None
+        and changed <= {*POINTS_RESULT_FIELDS, "pointsRecomputeId"}
+        and after_data.get("pointsRecomputeId") != before_data.get("pointsRecomputeId")
+    ):
+        # Points recomputes update standings and rollups once for the season
+        return
+
+    try:
+        db = firestore.client()
+        _bump_career_versions(db, [(data or {}).get("driverId") for data in (before_data, after_data)])
+        # Redelivered events are deduplicated per view on event.id
+        _apply_standings_changes(db, [(before_data, after_data)], as_of=event.time, event_id=event.id)
+        _apply_rollup_changes(db, [(before_data, after_data)], as_of=event.time, event_id=event.id)
+        if changed is None or not changed <= set(POINTS_RESULT_FIELDS):
+            # Record books do not use points; skip them for points recomputes
+            _update_track_records(
+                db,
+                [(event.params["raceId"], before_data, after_data)],
+                as_of=event.time,
+                event_id=event.id,
+            )
+        if _rating_inputs_changed(before_data, after_data):
+            rated_events = {}
+            for data in (before_data, after_data):
+                if data:
+                    rated_events.setdefault(_rating_event_key(data), data)
+            for race in rated_events.values():
+                _rate_event(db, race)
+
+        # Re-cache lap flags when lapTimes were edited elsewhere. The follow-up
+        # write finds the cache current, so this does not loop.
+        if after_data is not None:
+            lap_pace = _lap_pace_summaries([after_data.get("lapTimes") or []])[0]
+            if after_data.get("lapPace") != lap_pace:
+                after.reference.update({"lapPace": lap_pace})
+
+        # New results are counted where they are written (handleAddRaceResult,
+        # imports); deletes and results moved to another driver are counted here
+        before_driver = (before_data or {}).get("driverId")
+        after_driver = (after_data or {}).get("driverId")
+        if before_data is not None and before_driver != after_driver:
+            for driver_id, delta, view in ((before_driver, -1, "counters_before"), (after_driver, 1, "counters_after")):
+                if driver_id:
+                    _increment_user_counters(
+                        db, driver_id, as_of=event.time, event_id=event.id, view=view, racesEntered=delta
+                    )
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+
+
+@https_fn.on_request(cors=CORS_OPTIONS)
+def handleGetSeasonStandings(req: https_fn.Request) -> https_fn.Response:
+    """Get season standings sorted by points."""
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "GET":
+        return https_fn.Response("Method not allowed", status=405)
+
+    season = req.args.get("season", "2025")
+
+    try:
+        db = firestore.client()
+
+        standings_doc = (
+            db.collection("season_standings").document(_standings_doc_id(season)).get()
+        )
+        if standings_doc.exists:
+            standings_data = standings_doc.to_dict() or {}
+        else:
+            # First read of the season: build the standings from a scan
+            try:
+                standings_data = {"drivers": _seed_season_standings(db, season), "version": 1}
+            except Exception as e:
+                try:
+                    sentry_sdk.capture_exception(e)
+                except Exception:
+                    pass
+                drivers = _compute_season_standings(db, season)
+                return https_fn.Response(
+                    json.dumps({"season": season, "standings": _standings_list(drivers)}, default=str),
+                    status=200,
+                    headers={"Content-Type": "application/json"},
+                )
+
+        etag = _standings_etag(season, standings_data.get("version", 0))
+        cache_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if req.headers.get("If-None-Match") == etag:
+            return https_fn.Response("", status=304, headers=cache_headers)
+
+        standings_list = _standings_list(standings_data.get("drivers") or {})
+
+        return https_fn.Response(
+            json.dumps({"season": season, "standings": standings_list}, default=str),
+            status=200,
+            headers={"Content-Type": "application/json", **cache_headers},
+        )
+
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+
+@https_fn.on_request(cors=CORS_OPTIONS, timeout_sec=540)
+def handleCheckSeasonStandings(req: https_fn.Request) -> https_fn.Response:
+    """Compare materialized standings with a full recompute (Admin only).
+
+    JSON body {"season": ..., "repair": true} overwrites the standings
+    document with the recomputed totals when they differ.
+    """
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "POST":
+        return https_fn.Response("Method not allowed", status=405)
+
+    decoded_token, auth_error = _get_user_from_token(req)
+    if auth_error:
+        return auth_error
+
+    if not _is_admin(decoded_token):
+        return https_fn.Response("Forbidden: Admin role required", status=403)
+
+    data = req.get_json(silent=True) or {}
+    season = data.get("season")
+    if not season:
+        return https_fn.Response("season is required", status=400)
+    season = str(season)
+
+    try:
+        db = firestore.client()
+
+        standings_ref = db.collection("season_standings").document(_standings_doc_id(season))
+        standings_doc = standings_ref.get()
+        standings_data = (standings_doc.to_dict() or {}) if standings_doc.exists else {}
+        materialized = standings_data.get("drivers") or {}
+        recomputed = _compute_season_standings(db, season)
+
+        mismatches = []
+        for driver_id in sorted(set(materialized) | set(recomputed)):
+            stored = materialized.get(driver_id) or {}
+            expected = recomputed.get(driver_id) or {}
+            for field in STANDINGS_FIELDS:
+                if stored.get(field, 0) != expected.get(field, 0):
+                    mismatches.append(
+                        {
+                            "driverId": driver_id,
+                            "field": field,
+                            "stored": stored.get(field, 0),
+                            "expected": expected.get(field, 0),
+                        }
+                    )
+
+        repaired = False
+        if data.get("repair") and (mismatches or not standings_doc.exists):
+            standings_ref.set(
+                {
+                    "season": season,
+                    "drivers": recomputed,
+                    # A full overwrite, so carry the version forward explicitly
+                    "version": standings_data.get("version", 0) + 1,
+                    # Trigger deltas for results written before now are counted
+                    "seededAt": firestore.SERVER_TIMESTAMP,
+                    "updatedAt": firestore.SERVER_TIMESTAMP,
+                }
+            )
+            repaired = True
+
+        return https_fn.Response(
+            json.dumps(
+                {
+                    "season": season,
+                    "materialized": standings_doc.exists,
+                    "consistent": standings_doc.exists and not mismatches,
+                    "mismatches": mismatches,
+                    "repaired": repaired,
+                }
+            ),
+            status=200,
+            headers={"Content-Type": "application/json"},
+        )
+
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+
+# ============================================================================
+# POINTS SCHEMES
+# ============================================================================
+
+# points_schemes/{schemeId} holds one series' rules:
+#   {"name": "...", "seasons": ["2025"],
+#    "raceTypes": {"Feature": {"points": [50, 46, ...], "otherFinishers": 10,
+#                              "bonuses": {...}},
+#                  "*": {...}},            # any race type not listed
+#    "bonuses": {"start": 0, "pole": 0, "perPositionGained": 0}}
+# A result is scored by the scheme named in its pointsScheme field, else by
+# the scheme listing its season; with neither, the submitted points stand.
+POINTS_SCHEME_TTL_SECONDS = 300
+POINTS_BONUS_RULES = ("start", "pole", "perPositionGained")
+POINTS_RESULT_FIELDS = ("points", "pointsScheme")
+POINTS_RECOMPUTE_FIELDS = [
+    "driverId", "driverName", "carNumber", "season", "raceDate", "trackName", "raceType",
+    "startPosition", "finishPosition", "points", "pointsScheme", "pointsOverride",
+]
+_points_scheme_cache = {"schemes": None, "loadedAt": 0.0}
+
+
+def _get_points_schemes(db, force_refresh=False):
+    """All points schemes by ID, cached per instance for the TTL."""
+    cache = _points_scheme_cache
+    now = time.monotonic()
+    if (
+        not force_refresh
+        and cache["schemes"] is not None
+        and now - cache["loadedAt"] < POINTS_SCHEME_TTL_SECONDS
+    ):
+        return cache["schemes"]
+    cache["schemes"] = {doc.id: doc.to_dict() or {} for doc in db.collection("points_schemes").stream()}
+    cache["loadedAt"] = now
+    return cache["schemes"]
+
+
+def _points_scheme_for(schemes, race):
+    """(schemeId, scheme) that scores a result, or (None, None)."""
+    scheme_id = race.get("pointsScheme")
+    if scheme_id in schemes:
+        return scheme_id, schemes[scheme_id]
+    season = str(race.get("season", ""))
+    for scheme_id in sorted(schemes):
+        if season in [str(s) for s in schemes[scheme_id].get("seasons") or []]:
+            return scheme_id, schemes[scheme_id]
+    return None, None
+
+
+def _scheme_points(scheme, race):
+    """Points a scheme awards for one result, or None if it has no table for its raceType."""
+    race_types = scheme.get("raceTypes") or {}
+    rules = race_types.get(race.get("raceType") or "Feature") or race_types.get("*")
+    if not rules:
+        return None
+    bonuses = {**(scheme.get("bonuses") or {}), **(rules.get("bonuses") or {})}
+    table = rules.get("points") or []
+    finish = _as_position(race.get("finishPosition"))
+    start = _as_position(race.get("startPosition"))
+
+    points = bonuses.get("start", 0)
+    if finish:
+        points += table[finish - 1] if finish <= len(table) else rules.get("otherFinishers", 0)
+    if start == 1:
+        points += bonuses.get("pole", 0)
+    if finish and start and start > finish:
+        points += bonuses.get("perPositionGained", 0) * (start - finish)
+    return _as_points(points)
+
+
+def _apply_points_scheme(race, schemes):
+    """Score a result in place from its scheme; returns the scheme ID used."""
+    if race.get("pointsOverride"):
+        return None
+    scheme_id, scheme = _points_scheme_for(schemes, race)
+    points = _scheme_points(scheme, race) if scheme is not None else None
+    if points is None:
+        # No scheme, or none that scores this race type: the submitted points stand
+        return None
+    race["points"] = points
+    race["pointsScheme"] = scheme_id
+    return scheme_id
+
+
+def _validate_points_scheme(scheme):
+    """Return a list of problems with a points scheme definition."""
+
+    def _is_amount(value):
+        return isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+
+    def _bonus_errors(bonuses, path):
+        if bonuses is None:
+            return []
+        if not isinstance(bonuses, dict):
+            return [f"{path} must be an object"]
+        errors = [f"{path}.{rule} is not a known bonus rule" for rule in bonuses if rule not in POINTS_BONUS_RULES]
+        errors += [f"{path}.{rule} must be a non-negative number" for rule, value in bonuses.items()
+                   if rule in POINTS_BONUS_RULES and not _is_amount(value)]
+        return errors
+
+    errors = []
+    race_types = scheme.get("raceTypes")
+    if not isinstance(race_types, dict) or not race_types:
+        errors.append("raceTypes must map race types to points tables")
+        race_types = {}
+    for race_type, rules in race_types.items():
+        path = f"raceTypes.{race_type}"
+        if not isinstance(rules, dict):
+            errors.append(f"{path} must be an object")
+            continue
+        table = rules.get("points")
+        if not isinstance(table, list) or not table or not all(_is_amount(p) for p in table):
+            errors.append(f"{path}.points must be a non-empty list of non-negative numbers")
+        if not _is_amount(rules.get("otherFinishers", 0)):
+            errors.append(f"{path}.otherFinishers must be a non-negative number")
+        errors += _bonus_errors(rules.get("bonuses"), f"{path}.bonuses")
+    errors += _bonus_errors(scheme.get("bonuses"), "bonuses")
+    seasons = scheme.get("seasons", [])
+    if not isinstance(seasons, list) or not all(isinstance(s, (str, int)) for s in seasons):
+        errors.append("seasons must be a list of seasons")
+    return errors
+
+
+@https_fn.on_request(cors=CORS_OPTIONS)
+def handlePointsSchemes(req: https_fn.Request) -> https_fn.Response:
+    """List points schemes (GET) or create/replace one (POST, Admin only)."""
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method not in ("GET", "POST"):
+        return https_fn.Response("Method not allowed", status=405)
+
+    try:
+        db = firestore.client()
+
+        if req.method == "GET":
+            schemes = _get_points_schemes(db)
+            return https_fn.Response(
+                json.dumps({"schemes": [{"id": k, **v} for k, v in sorted(schemes.items())]}, default=str),
+                status=200,
+                headers={"Content-Type": "application/json"},
+            )
+
+        decoded_token, auth_error = _get_user_from_token(req)
+        if auth_error:
+            return auth_error
+
+        if not _is_admin(decoded_token):
+            return https_fn.Response("Forbidden: Admin role required", status=403)
+
+        data = req.get_json(silent=True)
+        if not isinstance(data, dict) or not data.get("id"):
+            return https_fn.Response("Scheme id is required", status=400)
+        scheme_id = str(data["id"])
+        scheme = {
+            "name": data.get("name") or scheme_id,
+            "seasons": data.get("seasons") or [],
+            "raceTypes": data.get("raceTypes"),
+            "bonuses": data.get("bonuses") or {},
+        }
+        errors = _validate_points_scheme(scheme)
+        if not errors:
+            scheme["seasons"] = [str(season) for season in scheme["seasons"]]
+            # A season can only default to one scheme
+            others = _get_points_schemes(db, force_refresh=True)
+            for other_id, other in others.items():
+                taken = set(scheme["seasons"]) & {str(s) for s in other.get("seasons") or []}
+                if other_id != scheme_id and taken:
+                    errors.append(f"seasons {sorted(taken)} already use scheme {other_id}")
+        if errors:
+            return https_fn.Response(
+                json.dumps({"message": "Invalid points scheme", "errors": errors}),
+                status=400,
+                headers={"Content-Type": "application/json"},
+            )
+
+        db.collection("points_schemes").document(scheme_id).set(
+            {**scheme, "updatedAt": firestore.SERVER_TIMESTAMP, "updatedBy": decoded_token["uid"]}
+        )
+        _points_scheme_cache["schemes"] = None
+
+        return https_fn.Response(
+            json.dumps({"message": "Points scheme saved", "id": scheme_id}),
+            status=200,
+            headers={"Content-Type": "application/json"},
+        )
+
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+
+def _apply_points_recompute(db, recompute_ref, recompute_data, changes=None):
+    """Move standings and rollups for a committed recompute, then mark it applied.
+
+    Rescored results carry pointsRecomputeId and are skipped by
+    handleRaceResultWritten, so the season's standings get one write for
+    the whole recompute. `changes` are (before, after) pairs; without them
+    the results tagged with this recompute are reloaded and their old points
+    taken from the log. Like _apply_race_import, the views dedupe on the
+    recompute's ID, so a pending recompute is resumed by calling this again.
+    Returns True once the recompute is applied.
+    """
+    if changes is None:
+        points_before = recompute_data.get("pointsBefore") or {}
+        refs = [db.collection("race_results").document(race_id) for race_id in points_before]
+        changes = []
+        for doc in db.get_all(refs):
+            race = (doc.to_dict() or {}) if doc.exists else {}
+            # Results from a partly committed run are the only ones that moved
+            if race.get("pointsRecomputeId") == recompute_ref.id:
+                changes.append(({**race, **points_before[doc.id]}, race))
+    as_of = recompute_data.get("committedAt")
+    event_id = f"recompute-{recompute_ref.id}"
+
+    _apply_standings_changes(db, changes, as_of=as_of, event_id=event_id)
+    applied = _apply_rollup_changes(db, changes, as_of=as_of, event_id=event_id)
+    _bump_career_versions(db, [after.get("driverId") for _, after in changes])
+    if not applied:
+        return False
+    recompute_ref.update({"status": "applied", "appliedAt": firestore.SERVER_TIMESTAMP})
+    return True
+
+
+@https_fn.on_request(cors=CORS_OPTIONS, timeout_sec=540)
+def handleRecomputeSeasonPoints(req: https_fn.Request) -> https_fn.Response:
+    """Rescore a season's results from points schemes (Admin only).
+
+    JSON body {"season": ..., "scheme": ..., "dryRun": true}. scheme is an
+    optional scheme ID, or an unsaved scheme object for a what-if run; without
+    it each result uses its own scheme. dryRun returns the standings the
+    scheme would produce without writing anything. Otherwise the old points
+    are logged in points_recomputes/{id}, changed results are updated in
+    WriteBatch chunks, and standings and rollups are moved once for the
+    whole recompute (see _apply_points_recompute). A recompute left pending
+    by a failure is resumed before the season is scanned again.
+    """
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "POST":
+        return https_fn.Response("Method not allowed", status=405)
+
+    decoded_token, auth_error = _get_user_from_token(req)
+    if auth_error:
+        return auth_error
+
+    if not _is_admin(decoded_token):
+        return https_fn.Response("Forbidden: Admin role required", status=403)
+
+    data = req.get_json(silent=True) or {}
+    season = data.get("season")
+    if not season:
+        return https_fn.Response("season is required", status=400)
+    season = str(season)
+    dry_run = bool(data.get("dryRun"))
+    requested = data.get("scheme")
+
+    if isinstance(requested, dict):
+        if not dry_run:
+            return https_fn.Response("Save the scheme before applying it; inline schemes need dryRun", status=400)
+        errors = _validate_points_scheme(requested)
+        if errors:
+            return https_fn.Response(
+                json.dumps({"message": "Invalid points scheme", "errors": errors}),
+                status=400,
+                headers={"Content-Type": "application/json"},
+            )
+
+    try:
+        db = firestore.client()
+        schemes = _get_points_schemes(db, force_refresh=True)
+        if isinstance(requested, str) and requested not in schemes:
+            return https_fn.Response(f"Unknown points scheme: {requested}", status=404)
+
+        if not dry_run:
+            pending = (
+                db.collection("points_recomputes")
+                .where("season", "==", season)
+                .where("status", "==", "pending")
+            )
+            for doc in pending.stream():
+                if not _apply_points_recompute(db, doc.reference, doc.to_dict() or {}):
+                    return https_fn.Response(
+                        "An earlier recompute is still being applied; retry the request",
+                        status=503,
+                    )
+
+        query = (
+            db.collection("race_results")
+            .where("season", "==", season)
+            .select(POINTS_RECOMPUTE_FIELDS)
+        )
+        races = []
+        changes = []
+        for doc in query.stream():
+            race = doc.to_dict() or {}
+            rescored = dict(race)
+            if race.get("pointsOverride"):
+                pass
+            elif isinstance(requested, dict):
+                points = _scheme_points(requested, race)
+                if points is not None:
+                    rescored["points"] = points
+                    rescored.pop("pointsScheme", None)
+            elif requested:
+                points = _scheme_points(schemes[requested], race)
+                if points is not None:
+                    rescored["points"] = points
+                    rescored["pointsScheme"] = requested
+            else:
+                _apply_points_scheme(rescored, schemes)
+            races.append(rescored)
+            if any(rescored.get(f) != race.get(f) for f in POINTS_RESULT_FIELDS):
+                changes.append((doc, race, rescored))
+
+        recompute_id = None
+        if not dry_run and changes:
+            recompute_ref = db.collection("points_recomputes").document()
+            recompute_id = recompute_ref.id
+            # Logged before the results so a failure after a commit can resume
+            recompute_data = {
+                "season": season,
+                "scheme": requested,
+                "pointsBefore": {
+                    doc.id: {f: race.get(f) for f in POINTS_RESULT_FIELDS} for doc, race, _ in changes
+                },
+                "requestedBy": decoded_token["uid"],
+                "requestedAt": firestore.SERVER_TIMESTAMP,
+                "status": "pending",
+            }
+            recompute_ref.set(recompute_data)
+
+            committed_at = None
+            try:
+                for i in range(0, len(changes), FIRESTORE_BATCH_LIMIT):
+                    batch = db.batch()
+                    for doc, _, rescored in changes[i:i + FIRESTORE_BATCH_LIMIT]:
+                        batch.update(
+                            doc.reference,
+                            {
+                                **{f: rescored.get(f) for f in POINTS_RESULT_FIELDS},
+                                "pointsRecomputeId": recompute_id,
+                            },
+                        )
+                    committed_at = _commit_time(batch.commit()) or committed_at
+            finally:
+                # Left pending either way; the next request resumes it
+                if committed_at is not None:
+                    recompute_data["committedAt"] = committed_at
+                    recompute_ref.update({"committedAt": committed_at})
+
+            applied = _apply_points_recompute(
+                db,
+                recompute_ref,
+                recompute_data,
+                [(race, rescored) for _, race, rescored in changes],
+            )
+            if not applied:
+                return https_fn.Response(
+                    json.dumps(
+                        {
+                            "message": "Results rescored but derived views are still pending; retry the request",
+                            "recomputeId": recompute_id,
+                        }
+                    ),
+                    status=503,
+                    headers={"Content-Type": "application/json"},
+                )
+
+        return https_fn.Response(
+            json.dumps(
+                {
+                    "season": season,
+                    "scheme": requested if not isinstance(requested, dict) else "what-if",
+                    "dryRun": dry_run,
+                    "recomputeId": recompute_id,
+                    "resultsScanned": len(races),
+                    "resultsChanged": len(changes),
+                    "changes": [
+                        {
+                            "raceId": doc.id,
+                            "driverId": race.get("driverId"),
+                            "raceDate": race.get("raceDate"),
+                            "raceType": race.get("raceType"),
+                            "finishPosition": race.get("finishPosition"),
+                            "pointsBefore": race.get("points"),
+                            "pointsAfter": rescored.get("points"),
+                        }
+                        for doc, race, rescored in changes
+                    ],
+                    "standings": _standings_list(_fold_season_standings(season, races)),
+                },
+                default=str,
+            ),
+            status=200,
+            headers={"Content-Type": "application/json"},
+        )
+
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return https_fn.Response(f"An error occurred: {e}", status=500)
+
+
+# ============================================================================
+# DRIVER RATINGS
+# ============================================================================
+
+# Multi-driver Elo: every race (raceDate + trackName + raceType) is scored as
+# a set of pairwise match-ups between its finishers. driver_ratings/{driverId}
+# holds the current rating, driver_ratings/{driverId}/history/{eventKey} one
+# entry per rated race, and rating_events/{eventKey} each participant's
+# pre-race rating and delta so a race can be re-rated when results are added
+# or corrected. Re-rating an older race applies its new deltas on top of the
+# current ratings; /api/rebuild-driver-ratings replays everything exactly.
+RATING_DEFAULT = 1500.0
+RATING_K = 32.0
+RATING_INPUT_FIELDS = ("driverId", "driverName", "finishPosition", "raceDate", "trackName", "raceType")
+
+
+def _rating_event_key(race):
+    """rating_events document ID for the race a result belongs to."""
+    return "__".join(
+        _rollup_key_part(race.get(field) or "")
+        for field in ("raceDate", "trackName", "raceType")
+    )
+
+
+def _rating_event_info(race):
+    return {
+        "raceDate": race.get("raceDate"),
+        "trackName": race.get("trackName"),
+        "raceType": race.get("raceType"),
+        "season": str(race.get("season", "")),
+    }
+
+
+def _elo_deltas(ratings, finishes):
+    """Rating changes for one race from pre-race ratings and finish positions.
+
+    Each driver is scored against every other finisher (win 1, tie 0.5) and
+    the K-factor is shared across the N-1 match-ups, so a race moves a
+    rating about as much as a single head-to-head would.
+    """
+    ratings = np.asarray(ratings, dtype=float)
+    finishes = np.asarray(finishes, dtype=float)
+    count = ratings.size
+    if count < 2:
+        return np.zeros(count)
+    expected = 1.0 / (1.0 + 10.0 ** ((ratings[None, :] - ratings[:, None]) / 400.0))
+    actual = (finishes[:, None] < finishes[None, :]) + 0.5 * (finishes[:, None] == finishes[None, :])
+    surprise = actual - expected
+    np.fill_diagonal(surprise, 0.0)
+    return RATING_K * surprise.sum(axis=1) / (count - 1)
+
+
+def _race_finishers(races):
+    """({driverId: best finish}, {driverId: name}) for one race's results."""
+    finishes = {}
+    names = {}
+    for race in races:
+        driver_id = race.get("driverId")
+        finish = _as_position(race.get("finishPosition"))
+        if not driver_id or not finish:
+            continue
+        finishes[driver_id] = min(finish, finishes.get(driver_id, finish))
+        names[driver_id] = race.get("driverName")
+    return finishes, names
+
+
+def _rate_event(db, race):
+    """Re-rate the race `race` belongs to from its current results.
+
+    Best-effort like the other derived views: failures are reported (and
+    False returned) and the ratings can be rebuilt.
+    """
+    event_key = _rating_event_key(race)
+    event_info = _rating_event_info(race)
+    query = (
+        db.collection("race_results")
+        .where("raceDate", "==", race.get("raceDate"))
+        .where("trackName", "==", race.get("trackName"))
+        .where("raceType", "==", race.get("raceType"))
+        .select(list(RATING_INPUT_FIELDS))
+    )
+    event_ref = db.collection("rating_events").document(event_key)
+
+    @firestore.transactional
+    def _apply(transaction):
+        # Read in the transaction so a retry after a conflict sees results
+        # written concurrently to the same race
+        finishes, names = _race_finishers(doc.to_dict() or {} for doc in transaction.get(query))
+        event_doc = event_ref.get(transaction=transaction)
+        previous = (event_doc.to_dict() or {}).get("participants", {}) if event_doc.exists else {}
+        driver_ids = sorted(set(finishes) | set(previous))
+        refs = {d: db.collection("driver_ratings").document(d) for d in driver_ids}
+        docs = {doc.id: doc.to_dict() or {} for doc in transaction.get_all(list(refs.values())) if doc.exists}
+
+        # Undo this race's earlier contribution before scoring it again
+        base = {
+            d: docs.get(d, {}).get("rating", RATING_DEFAULT) - previous.get(d, {}).get("delta", 0.0)
+            for d in driver_ids
+        }
+        rated = [d for d in driver_ids if d in finishes]
+        deltas = _elo_deltas([base[d] for d in rated], [finishes[d] for d in rated])
+
+        participants = {}
+        for driver_id, delta in zip(rated, deltas):
+            delta = float(delta)
+            existing = docs.get(driver_id, {})
+            participants[driver_id] = {
+                "finishPosition": finishes[driver_id],
+                "ratingBefore": base[driver_id],
+                "delta": delta,
+            }
+            transaction.set(
+                refs[driver_id],
+                {
+                    "driverId": driver_id,
+                    "driverName": names.get(driver_id) or existing.get("driverName"),
+                    "rating": base[driver_id] + delta,
+                    "events": existing.get("events", 0) + (0 if driver_id in previous else 1),
+                    "lastRaceDate": max(
+                        str(existing.get("lastRaceDate") or ""), str(event_info["raceDate"] or "")
+                    ),
+                    "updatedAt": firestore.SERVER_TIMESTAMP,
+                },
+            )
+            transaction.set(
+                refs[driver_id].collection("history").document(event_key),
+                {
+                    **event_info,
+                    "eventKey": event_key,
+                    "finishPosition": finishes[driver_id],
+                    "fieldSize": len(rated),
+                    "ratingBefore": base[driver_id],
+                    "ratingAfter": base[driver_id] + delta,
+                    "delta": delta,
+                },
+            )
+
+        # Drivers whose result was removed or moved to another race
+        for driver_id in driver_ids:
+            if driver_id in finishes:
+                continue
+            if driver_id in docs:
+                transaction.set(
+                    refs[driver_id],
+                    {
+                        "rating": base[driver_id],
+                        "events": max(0, docs[driver_id].get("events", 1) - 1),
+                        "updatedAt": firestore.SERVER_TIMESTAMP,
+                    },
+                    merge=True,
                 )
-                photo_count = sum(1 for _ in photos_query)
-                progress_data["photographer"] = {
-                    "current": photo_count,
-                    "target": 5,
-                    "percentage": min((photo_count / 5) * 100, 100),
-                    "completed": photo_count >= 5,
-                    "description": f"Upload {photo_count}/5 photos to the gallery",
-                }
-            except Exception as e:
-                print(f"Error getting photo count: {e}")
+            transaction.delete(refs[driver_id].collection("history").document(event_key))
 
-        # Fan Favorite achievement progress (get 10 total likes)
-        if "fan_favorite" not in user_achievement_ids:
-            try:
-                user_photos_query = (
-                    db.collection("gallery_images")
-                    .where("uploaderUid", "==", user_id)
-                    .stream()
-                )
-                total_likes = 0
-                for photo_doc in user_photos_query:
-                    photo_data = photo_doc.to_dict()
-                    total_likes += photo_data.get("likeCount", 0)
-
-                progress_data["fan_favorite"] = {
-                    "current": total_likes,
-                    "target": 10,
-                    "percentage": min((total_likes / 10) * 100, 100),
-                    "completed": total_likes >= 10,
-                    "description": f"Receive {total_likes}/10 total likes on your photos",
-                }
-            except Exception as e:
-                print(f"Error getting like count: {e}")
+        if participants:
+            transaction.set(
+                event_ref,
+                {**event_info, "participants": participants, "updatedAt": firestore.SERVER_TIMESTAMP},
+            )
+        else:
+            transaction.delete(event_ref)
 
-        # Community Member achievement (already earned or not)
-        if "community_member" not in user_achievement_ids:
-            progress_data["community_member"] = {
-                "current": 0,
-                "target": 1,
-                "percentage": 0,
-                "completed": False,
-                "description": "Join the RedsRacing community (automatic on login)",
-            }
+    try:
+        _apply(db.transaction())
+        return True
+    except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
+        return False
+
+
+def _rating_inputs_changed(before_data, after_data):
+    """Whether a race_results write can change any rating."""
+    if before_data is None or after_data is None:
+        return True
+    return any(before_data.get(f) != after_data.get(f) for f in RATING_INPUT_FIELDS)
+
+
+@https_fn.on_request(cors=CORS_OPTIONS)
+def handleGetDriverRatings(req: https_fn.Request) -> https_fn.Response:
+    """Get one driver's rating and history, or the top-rated drivers."""
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "GET":
+        return https_fn.Response("Method not allowed", status=405)
+
+    driver_id = req.args.get("driverId")
+    try:
+        limit = max(1, min(int(req.args.get("limit", LEADERBOARD_DEFAULT_LIMIT)), LEADERBOARD_SNAPSHOT_SIZE))
+    except ValueError:
+        return https_fn.Response("limit must be an integer", status=400)
+
+    def _public(rating):
+        return {
+            "driverId": rating.get("driverId"),
+            "driverName": rating.get("driverName"),
+            "rating": round(rating.get("rating", RATING_DEFAULT), 1),
+            "events": rating.get("events", 0),
+            "lastRaceDate": rating.get("lastRaceDate"),
+        }
+
+    try:
+        db = firestore.client()
+
+        if not driver_id:
+            query = (
+                db.collection("driver_ratings")
+                .order_by("rating", direction=firestore.Query.DESCENDING)
+                .limit(limit)
+            )
+            ratings = [_public(doc.to_dict() or {}) for doc in query.stream()]
+            for rank, rating in enumerate(ratings, start=1):
+                rating["rank"] = rank
+            body = {"ratings": ratings}
+        else:
+            rating_ref = db.collection("driver_ratings").document(driver_id)
+            rating_doc = rating_ref.get()
+            if not rating_doc.exists:
+                return https_fn.Response("Driver not rated", status=404)
+            history_query = (
+                rating_ref.collection("history")
+                .order_by("raceDate", direction=firestore.Query.DESCENDING)
+                .limit(limit)
+            )
+            history = []
+            for doc in history_query.stream():
+                entry = doc.to_dict() or {}
+                for field in ("ratingBefore", "ratingAfter", "delta"):
+                    entry[field] = round(entry.get(field, 0.0), 1)
+                history.append(entry)
+            body = {**_public(rating_doc.to_dict() or {}), "history": history}
 
         return https_fn.Response(
-            json.dumps(progress_data, default=str),
+            json.dumps(body, default=str),
             status=200,
             headers={"Content-Type": "application/json"},
         )
 
     except Exception as e:
+        try:
+            sentry_sdk.capture_exception(e)
+        except Exception:
+            pass
         return https_fn.Response(f"An error occurred: {e}", status=500)
 
 
-# ============================================================================
-# RACE ANALYTICS SYSTEM
-# ============================================================================
-
+@https_fn.on_request(cors=CORS_OPTIONS, timeout_sec=540)
+def handleRebuildDriverRatings(req: https_fn.Request) -> https_fn.Response:
+    """Replay every race in date order to rebuild all ratings (Admin only).
 
-@https_fn.on_request(cors=CORS_OPTIONS)
-def handleAddRaceResult(req: https_fn.Request) -> https_fn.Response:
-    """Add a new race result to Firestore (Admin only)."""
+    race_results is streamed once ordered by raceDate; only one day's results
+    are held in memory at a time. Every history subcollection is cleared
+    first, writes go out in WriteBatch chunks as the replay proceeds, and
+    rating events that no longer exist are removed.
+    """
     if req.method == "OPTIONS":
         return https_fn.Response("", status=204)
     if req.method != "POST":
         return https_fn.Response("Method not allowed", status=405)
 
-    # Verify authentication and admin role
     decoded_token, auth_error = _get_user_from_token(req)
     if auth_error:
         return auth_error
@@ -1334,43 +5879,132 @@ def handleAddRaceResult(req: https_fn.Request) -> https_fn.Response:
     if not _is_admin(decoded_token):
         return https_fn.Response("Forbidden: Admin role required", status=403)
 
-    data = req.get_json(silent=True)
-    if not data:
-        return https_fn.Response("Invalid request body", status=400)
-
-    # Required fields
-    required_fields = ["driverId", "driverName", "raceDate", "trackName", "season"]
-    if not all(field in data for field in required_fields):
-        return https_fn.Response(f"Missing required fields: {required_fields}", status=400)
-
     try:
         db = firestore.client()
 
-        race_result = {
-            "driverId": data["driverId"],
-            "driverName": data["driverName"],
-            "carNumber": data.get("carNumber", ""),
-            "raceDate": data["raceDate"],
-            "trackName": data["trackName"],
-            "trackLocation": data.get("trackLocation", ""),
-            "season": data["season"],
-            "raceType": data.get("raceType", "Feature"),  # Heat, Feature, etc.
-            "startPosition": data.get("startPosition"),
-            "finishPosition": data.get("finishPosition"),
-            "lapTimes": data.get("lapTimes", []),
-            "fastestLap": data.get("fastestLap"),
-            "points": data.get("points", 0),
-            "incidents": data.get("incidents", []),
-            "weather": data.get("weather", ""),
-            "notes": data.get("notes", ""),
-            "createdAt": firestore.SERVER_TIMESTAMP,
-            "createdBy": decoded_token["uid"],
-        }
+        pending = []
+
+        def _queue(action, ref, payload=None):
+            pending.append((action, ref, payload))
+            if len(pending) >= FIRESTORE_BATCH_LIMIT:
+                _flush()
+
+        def _flush():
+            if not pending:
+                return
+            batch = db.batch()
+            for action, ref, payload in pending:
+                if action == "set":
+                    batch.set(ref, payload)
+                else:
+                    batch.delete(ref)
+            batch.commit()
+            pending.clear()
+
+        # Clear every driver's history before replaying, including drivers
+        # whose rating document is already gone, so no stale entries survive
+        history_deleted = 0
+        for doc in db.collection_group("history").select([]).stream():
+            if doc.reference.parent.parent.parent.id == "driver_ratings":
+                _queue("delete", doc.reference)
+                history_deleted += 1
+        _flush()
+
+        previous_events = {doc.id for doc in db.collection("rating_events").select([]).stream()}
+        ratings = {}
+        replayed = set()
+        results_scanned = 0
+
+        def _replay_day(day_races):
+            events = {}
+            for race in day_races:
+                events.setdefault(_rating_event_key(race), []).append(race)
+            for event_key in sorted(events):
+                finishes, names = _race_finishers(events[event_key])
+                if not finishes:
+                    continue
+                event_info = _rating_event_info(events[event_key][0])
+                rated = sorted(finishes)
+                before = [ratings.get(d, {}).get("rating", RATING_DEFAULT) for d in rated]
+                deltas = _elo_deltas(before, [finishes[d] for d in rated])
+                participants = {}
+                for driver_id, rating_before, delta in zip(rated, before, deltas):
+                    delta = float(delta)
+                    state = ratings.setdefault(driver_id, {"events": 0})
+                    state.update(
+                        rating=rating_before + delta,
+                        events=state["events"] + 1,
+                        driverName=names.get(driver_id) or state.get("driverName"),
+                        lastRaceDate=str(event_info["raceDate"] or ""),
+                    )
+                    participants[driver_id] = {
+                        "finishPosition": finishes[driver_id],
+                        "ratingBefore": rating_before,
+                        "delta": delta,
+                    }
+                    _queue(
+                        "set",
+                        db.collection("driver_ratings").document(driver_id)
+                        .collection("history").document(event_key),
+                        {
+                            **event_info,
+                            "eventKey": event_key,
+                            "finishPosition": finishes[driver_id],
+                            "fieldSize": len(rated),
+                            "ratingBefore": rating_before,
+                            "ratingAfter": rating_before + delta,
+                            "delta": delta,
+                        },
+                    )
+                _queue(
+                    "set",
+                    db.collection("rating_events").document(event_key),
+                    {**event_info, "participants": participants, "updatedAt": firestore.SERVER_TIMESTAMP},
+                )
+                replayed.add(event_key)
 
-        doc_ref = db.collection("race_results").add(race_result)
+        query = (
+            db.collection("race_results")
+            .order_by("raceDate")
+            .select(list(RATING_INPUT_FIELDS) + ["season"])
+        )
+        day, day_races = None, []
+        for doc in query.stream():
+            race = doc.to_dict() or {}
+            results_scanned += 1
+            if race.get("raceDate") != day and day_races:
+                _replay_day(day_races)
+                day_races = []
+            day = race.get("raceDate")
+            day_races.append(race)
+        if day_races:
+            _replay_day(day_races)
+
+        for driver_id, state in ratings.items():
+            _queue(
+                "set",
+                db.collection("driver_ratings").document(driver_id),
+                {"driverId": driver_id, **state, "updatedAt": firestore.SERVER_TIMESTAMP},
+            )
+        stale_events = [key for key in previous_events if key not in replayed]
+        for event_key in stale_events:
+            _queue("delete", db.collection("rating_events").document(event_key))
+        for doc in db.collection("driver_ratings").stream():
+            if doc.id not in ratings:
+                _queue("delete", doc.reference)
+        _flush()
 
         return https_fn.Response(
-            json.dumps({"message": "Race result added successfully", "id": doc_ref[1].id}),
+            json.dumps(
+                {
+                    "message": "Driver ratings rebuilt",
+                    "resultsScanned": results_scanned,
+                    "eventsRated": len(replayed),
+                    "eventsRemoved": len(stale_events),
+                    "historyDeleted": history_deleted,
+                    "drivers": len(ratings),
+                }
+            ),
             status=200,
             headers={"Content-Type": "application/json"},
         )
@@ -1383,80 +6017,150 @@ def handleAddRaceResult(req: https_fn.Request) -> https_fn.Response:
         return https_fn.Response(f"An error occurred: {e}", status=500)
 
 
+# ============================================================================
+# RACE PREDICTIONS
+# ============================================================================
+
+# Finish predictions come from a ridge regression on each driver's start
+# position, recent form and history at the track, all expressed as field
+# percentiles (0 = front, 1 = back) so fields of any size are comparable.
+# handleTrainPredictionModel replays race_results once and stores:
+#   prediction_models/finish       - coefficients and fit quality
+#   prediction_features/{driverId} - the form and track history the model
+#                                    reads, as of the training run
+# so a prediction is one cached model plus one batched read for the field.
+PREDICTION_FEATURES = ("intercept", "startPct", "formPct", "trackPct")
+PREDICTION_FORM_RACES = 5
+PREDICTION_RIDGE = 1.0
+PREDICTION_MIN_SAMPLES = 20
+PREDICTION_MODEL_TTL_SECONDS = 600
+_prediction_model_cache = {"model": None, "loadedAt": 0.0}
+
+
+def _field_pct(position, field_size):
+    """0-1 position within a field, or None when it cannot be placed."""
+    if not position or field_size < 2:
+        return None
+    return min(max((position - 1) / (field_size - 1), 0.0), 1.0)
+
+
+def _prediction_feature_row(features, track_key, start_pct):
+    """Model inputs for one driver, in PREDICTION_FEATURES order."""
+    form = features.get("recentFinishPcts") or []
+    track = (features.get("tracks") or {}).get(track_key) or {}
+    return [
+        1.0,
+        0.5 if start_pct is None else start_pct,
+        sum(form) / len(form) if form else 0.5,
+        track["sum"] / track["count"] if track.get("count") else 0.5,
+    ]
+
+
+def _fit_prediction_model(rows, targets):
+    """Ridge least squares; returns (coefficients, rmse). The intercept is not penalized."""
+    x = np.asarray(rows, dtype=float)
+    y = np.asarray(targets, dtype=float)
+    penalty = PREDICTION_RIDGE * np.eye(x.shape[1])
+    penalty[0, 0] = 0.0
+    coefficients = np.linalg.solve(x.T @ x + penalty, x.T @ y)
+    rmse = float(np.sqrt(np.mean((x @ coefficients - y) ** 2)))
+    return coefficients, rmse
+
+
+def _get_prediction_model(db):
+    """The stored model, cached per instance and re-read after the TTL."""
+    cache = _prediction_model_cache
+    now = time.monotonic()
+    if cache["model"] is not None and now - cache["loadedAt"] < PREDICTION_MODEL_TTL_SECONDS:
+        return cache["model"]
+    doc = db.collection("prediction_models").document("finish").get()
+    model = doc.to_dict() if doc.exists else None
+    if model and list(model.get("features") or []) != list(PREDICTION_FEATURES):
+        # Trained by a different version of the feature set
+        model = None
+    cache["model"] = model
+    cache["loadedAt"] = now
+    return model
+
+
+def _predict_field(model, field, features_by_driver, track_key):
+    """Predicted finishing order for a field of {driverId, startPosition} entries."""
+    size = len(field)
+    rows = [
+        _prediction_feature_row(
+            features_by_driver.get(entry["driverId"], {}),
+            track_key,
+            _field_pct(entry.get("startPosition"), size),
+        )
+        for entry in field
+    ]
+    x = np.asarray(rows, dtype=float)
+    scores = np.clip(x @ np.asarray(model["coefficients"], dtype=float), 0.0, 1.0)
+    order = np.argsort(scores, kind="stable")
+
+    predictions = []
+    for predicted_finish, index in enumerate(order, start=1):
+        entry = field[index]
+        features = features_by_driver.get(entry["driverId"], {})
+        predictions.append({
+            "predictedFinish": predicted_finish,
+            "driverId": entry["driverId"],
+            "driverName": features.get("driverName"),
+            "startPosition": entry.get("startPosition"),
+            "expectedFinish": round(1 + float(scores[index]) * (size - 1), 2),
+            "recentForm": round(rows[index][2], 3),
+            "trackHistory": round(rows[index][3], 3),
+            "trackRaces": ((features.get("tracks") or {}).get(track_key) or {}).get("count", 0),
+        })
+    return predictions
+
+
 @https_fn.on_request(cors=CORS_OPTIONS)
-def handleGetRaceAnalytics(req: https_fn.Request) -> https_fn.Response:
-    """Get comprehensive race analytics for a driver."""
+def handlePredictRaceFinish(req: https_fn.Request) -> https_fn.Response:
+    """Predict the finishing order for a field of drivers at a track.
+
+    driverIds lists the field in starting order; pass grid=false when the
+    starting order is not known yet.
+    """
     if req.method == "OPTIONS":
         return https_fn.Response("", status=204)
     if req.method != "GET":
         return https_fn.Response("Method not allowed", status=405)
 
-    driver_id = req.args.get("driverId")
-    season = req.args.get("season")
     track_name = req.args.get("trackName")
-
-    if not driver_id:
-        return https_fn.Response("driverId parameter is required", status=400)
+    driver_ids = list(
+        dict.fromkeys(d.strip() for d in (req.args.get("driverIds") or "").split(",") if d.strip())
+    )
+    if not track_name or len(driver_ids) < 2:
+        return https_fn.Response("trackName and at least two driverIds are required", status=400)
+    if len(driver_ids) > MAX_COMPARISON_DRIVERS:
+        return https_fn.Response(f"At most {MAX_COMPARISON_DRIVERS} drivers can be predicted", status=400)
+    grid_known = req.args.get("grid", "true").lower() != "false"
 
     try:
         db = firestore.client()
-
-        # Build query
-        query = db.collection("race_results").where("driverId", "==", driver_id)
-        if season:
-            query = query.where("season", "==", season)
-        if track_name:
-            query = query.where("trackName", "==", track_name)
-
-        races = list(query.stream())
-
-        if not races:
-            return https_fn.Response(
-                json.dumps({"message": "No race data found", "analytics": {}}),
-                status=200,
-                headers={"Content-Type": "application/json"},
-            )
-
-        # Calculate analytics
-        finish_positions = []
-        start_positions = []
-        fastest_laps = []
-        points_total = 0
-        races_data = []
-
-        for race_doc in races:
-            race_data = race_doc.to_dict()
-            races_data.append({"id": race_doc.id, **race_data})
-
-            if race_data.get("finishPosition"):
-                finish_positions.append(race_data["finishPosition"])
-            if race_data.get("startPosition"):
-                start_positions.append(race_data["startPosition"])
-            if race_data.get("fastestLap"):
-                fastest_laps.append(race_data["fastestLap"])
-            points_total += race_data.get("points", 0)
-
-        analytics = {
-            "driverId": driver_id,
-            "totalRaces": len(races),
-            "totalPoints": points_total,
-            "avgFinishPosition": round(mean(finish_positions), 2) if finish_positions else None,
-            "medianFinishPosition": median(finish_positions) if finish_positions else None,
-            "bestFinish": min(finish_positions) if finish_positions else None,
-            "worstFinish": max(finish_positions) if finish_positions else None,
-            "avgStartPosition": round(mean(start_positions), 2) if start_positions else None,
-            "avgPositionsGained": (
-                round(mean([s - f for s, f in zip(start_positions, finish_positions)]), 2)
-                if start_positions and finish_positions and len(start_positions) == len(finish_positions)
-                else None
-            ),
-            "fastestLapTime": min(fastest_laps) if fastest_laps else None,
-            "avgLapTime": round(mean(fastest_laps), 2) if fastest_laps else None,
-            "races": races_data,
+        model = _get_prediction_model(db)
+        if not model:
+            return https_fn.Response("Prediction model has not been trained", status=404)
+
+        refs = [db.collection("prediction_features").document(d) for d in driver_ids]
+        features_by_driver = {doc.id: doc.to_dict() or {} for doc in db.get_all(refs) if doc.exists}
+        field = [
+            {"driverId": driver_id, "startPosition": position if grid_known else None}
+            for position, driver_id in enumerate(driver_ids, start=1)
+        ]
+
+        body = {
+            "trackName": track_name,
+            "model": {
+                "trainedAt": model.get("trainedAt"),
+                "samples": model.get("samples"),
+                "rmse": model.get("rmse"),
+            },
+            "predictions": _predict_field(model, field, features_by_driver, _rollup_key_part(track_name)),
         }
-
         return https_fn.Response(
-            json.dumps(analytics, default=str),
+            json.dumps(body, default=str),
             status=200,
             headers={"Content-Type": "application/json"},
         )
@@ -1469,79 +6173,117 @@ def handleGetRaceAnalytics(req: https_fn.Request) -> https_fn.Response:
         return https_fn.Response(f"An error occurred: {e}", status=500)
 
 
-@https_fn.on_request(cors=CORS_OPTIONS)
-def handleDriverComparison(req: https_fn.Request) -> https_fn.Response:
-    """Compare two drivers' performance."""
+@https_fn.on_request(cors=CORS_OPTIONS, timeout_sec=540)
+def handleTrainPredictionModel(req: https_fn.Request) -> https_fn.Response:
+    """Fit the finish model from race_results and refresh driver features (Admin only).
+
+    Races are replayed in date order so every training row only uses form
+    and track history from earlier race days.
+    """
     if req.method == "OPTIONS":
         return https_fn.Response("", status=204)
-    if req.method != "GET":
+    if req.method != "POST":
         return https_fn.Response("Method not allowed", status=405)
 
-    driver1_id = req.args.get("driver1Id")
-    driver2_id = req.args.get("driver2Id")
-    season = req.args.get("season")
+    decoded_token, auth_error = _get_user_from_token(req)
+    if auth_error:
+        return auth_error
 
-    if not driver1_id or not driver2_id:
-        return https_fn.Response("Both driver1Id and driver2Id are required", status=400)
+    if not _is_admin(decoded_token):
+        return https_fn.Response("Forbidden: Admin role required", status=403)
 
     try:
         db = firestore.client()
-
-        # Get analytics for both drivers
-        def get_driver_stats(driver_id):
-            query = db.collection("race_results").where("driverId", "==", driver_id)
-            if season:
-                query = query.where("season", "==", season)
-
-            races = list(query.stream())
-            if not races:
-                return None
-
-            finish_positions = []
-            points_total = 0
-            fastest_laps = []
-
-            for race_doc in races:
-                race_data = race_doc.to_dict()
-                if race_data.get("finishPosition"):
-                    finish_positions.append(race_data["finishPosition"])
-                points_total += race_data.get("points", 0)
-                if race_data.get("fastestLap"):
-                    fastest_laps.append(race_data["fastestLap"])
-
-            return {
-                "driverId": driver_id,
-                "driverName": races[0].to_dict().get("driverName", "Unknown"),
-                "totalRaces": len(races),
-                "totalPoints": points_total,
-                "avgFinishPosition": round(mean(finish_positions), 2) if finish_positions else None,
-                "bestFinish": min(finish_positions) if finish_positions else None,
-                "worstFinish": max(finish_positions) if finish_positions else None,
-                "fastestLapTime": min(fastest_laps) if fastest_laps else None,
-            }
-
-        driver1_stats = get_driver_stats(driver1_id)
-        driver2_stats = get_driver_stats(driver2_id)
-
-        if not driver1_stats or not driver2_stats:
+        drivers = {}
+        rows = []
+        targets = []
+        results_scanned = 0
+
+        def _replay_day(day_races):
+            events = {}
+            for race in day_races:
+                events.setdefault(_rating_event_key(race), []).append(race)
+            updates = []
+            for races in events.values():
+                entries = {}
+                for race in races:
+                    finish = _as_position(race.get("finishPosition"))
+                    driver_id = race.get("driverId")
+                    if driver_id and finish and finish < entries.get(driver_id, (finish + 1,))[0]:
+                        entries[driver_id] = (finish, race)
+                size = len(entries)
+                track_key = _rollup_key_part(races[0].get("trackName") or "")
+                for driver_id, (finish, race) in entries.items():
+                    finish_pct = _field_pct(finish, size)
+                    if finish_pct is None:
+                        continue
+                    start_pct = _field_pct(_as_position(race.get("startPosition")), size)
+                    rows.append(_prediction_feature_row(drivers.get(driver_id, {}), track_key, start_pct))
+                    targets.append(finish_pct)
+                    updates.append((driver_id, race, track_key, finish_pct))
+            # Apply after the whole day so same-day races do not see each other
+            for driver_id, race, track_key, finish_pct in updates:
+                state = drivers.setdefault(
+                    driver_id, {"driverId": driver_id, "recentFinishPcts": [], "tracks": {}, "races": 0}
+                )
+                state["driverName"] = race.get("driverName") or state.get("driverName")
+                state["recentFinishPcts"] = (state["recentFinishPcts"] + [finish_pct])[-PREDICTION_FORM_RACES:]
+                track = state["tracks"].setdefault(
+                    track_key, {"trackName": race.get("trackName"), "count": 0, "sum": 0.0}
+                )
+                track["count"] += 1
+                track["sum"] += finish_pct
+                state["races"] += 1
+
+        query = (
+            db.collection("race_results")
+            .order_by("raceDate")
+            .select(["driverId", "driverName", "raceDate", "trackName", "raceType", "startPosition", "finishPosition"])
+        )
+        day, day_races = None, []
+        for doc in query.stream():
+            race = doc.to_dict() or {}
+            results_scanned += 1
+            if race.get("raceDate") != day and day_races:
+                _replay_day(day_races)
+                day_races = []
+            day = race.get("raceDate")
+            day_races.append(race)
+        if day_races:
+            _replay_day(day_races)
+
+        if len(rows) < PREDICTION_MIN_SAMPLES:
             return https_fn.Response(
-                json.dumps({"message": "Insufficient data for comparison"}),
-                status=200,
-                headers={"Content-Type": "application/json"},
+                f"At least {PREDICTION_MIN_SAMPLES} placed results are needed to train (found {len(rows)})",
+                status=400,
             )
 
-        comparison = {
-            "driver1": driver1_stats,
-            "driver2": driver2_stats,
-            "winner": {
-                "avgFinish": driver1_stats["driverId"] if (driver1_stats.get("avgFinishPosition") or 999) < (driver2_stats.get("avgFinishPosition") or 999) else driver2_stats["driverId"],
-                "totalPoints": driver1_stats["driverId"] if driver1_stats["totalPoints"] > driver2_stats["totalPoints"] else driver2_stats["driverId"],
-                "bestFinish": driver1_stats["driverId"] if (driver1_stats.get("bestFinish") or 999) < (driver2_stats.get("bestFinish") or 999) else driver2_stats["driverId"],
-            },
+        coefficients, rmse = _fit_prediction_model(rows, targets)
+        model = {
+            "features": list(PREDICTION_FEATURES),
+            "coefficients": [float(c) for c in coefficients],
+            "samples": len(rows),
+            "rmse": round(rmse, 4),
+            "formRaces": PREDICTION_FORM_RACES,
+            "trainedAt": datetime.utcnow().isoformat() + "Z",
         }
 
+        driver_states = list(drivers.values())
+        for i in range(0, len(driver_states), FIRESTORE_BATCH_LIMIT):
+            batch = db.batch()
+            for state in driver_states[i:i + FIRESTORE_BATCH_LIMIT]:
+                batch.set(db.collection("prediction_features").document(state["driverId"]), state)
+            batch.commit()
+        db.collection("prediction_models").document("finish").set(model)
+        _prediction_model_cache.update(model=model, loadedAt=time.monotonic())
+
         return https_fn.Response(
-            json.dumps(comparison, default=str),
+            json.dumps({
+                "message": "Prediction model trained",
+                "resultsScanned": results_scanned,
+                "drivers": len(driver_states),
+                **model,
+            }),
             status=200,
             headers={"Content-Type": "application/json"},
         )
@@ -1554,71 +6296,211 @@ def handleDriverComparison(req: https_fn.Request) -> https_fn.Response:
         return https_fn.Response(f"An error occurred: {e}", status=500)
 
 
-@https_fn.on_request(cors=CORS_OPTIONS)
-def handleGetTrackRecords(req: https_fn.Request) -> https_fn.Response:
-    """Get track records across all drivers."""
+# ============================================================================
+# CHAMPIONSHIP SIMULATOR
+# ============================================================================
+
+# Monte Carlo season completions: every remaining race, each driver's points
+# are resampled from their own results this season, and they skip the race
+# at the rate they have missed races so far. Results are stored in
+# championship_simulations/{id} with the season_standings version they were
+# computed from, so a simulation runs at most once per standings change.
+SIM_DEFAULT_RUNS = 10000
+SIM_MAX_RUNS = 200000
+# Runs per chunk are sized so runs x drivers x races stays under this budget;
+# each element costs ~17 bytes across the float32/int32 working arrays.
+SIM_CHUNK_ELEMENTS = 2_000_000
+SIM_PARALLEL_THRESHOLD = 50000
+SIM_MAX_REMAINING_RACES = 50
+
+
+def _simulation_doc_id(season, remaining_races, runs, top_n):
+    return f"{_standings_doc_id(season)}__r{remaining_races}__n{runs}__top{top_n}"
+
+
+def _simulate_season_chunk(args):
+    """Simulate `runs` season completions; returns per-driver tallies.
+
+    Module-level so it can run in a ProcessPoolExecutor worker.
+    """
+    current, history, lengths, attendance, remaining_races, runs, top_n, seed = args
+    rng = np.random.default_rng(seed)
+    drivers = current.size
+
+    # (runs, drivers, races) draws from each driver's padded history row
+    shape = (runs, drivers, remaining_races)
+    picks = (rng.random(shape, dtype=np.float32) * lengths[None, :, None]).astype(np.int32)
+    # float32 products can round up to the row length itself
+    np.minimum(picks, (lengths - 1).astype(np.int32)[None, :, None], out=picks)
+    points = history[np.arange(drivers, dtype=np.int32)[None, :, None], picks]
+    del picks
+    points *= rng.random(shape, dtype=np.float32) < attendance[None, :, None]
+    totals = current[None, :] + points.sum(axis=2, dtype=np.float64)
+    del points
+
+    # Rank each run by points, breaking ties at random
+    order = np.lexsort((rng.random(totals.shape), -totals), axis=-1)
+    positions = np.empty_like(order)
+    np.put_along_axis(positions, order, np.arange(drivers)[None, :], axis=1)
+
+    return {
+        "titles": (positions == 0).sum(axis=0),
+        "topN": (positions < top_n).sum(axis=0),
+        "positionSum": (positions + 1).sum(axis=0),
+        "pointsSum": totals.sum(axis=0),
+    }
+
+
+def _simulate_championship(current, histories, attendance, remaining_races, runs, top_n, seed):
+    """Tallies over `runs` completions, fanned out to processes for large runs."""
+    drivers = len(current)
+    lengths = np.array([max(len(h), 1) for h in histories], dtype=np.float32)
+    history = np.zeros((drivers, int(lengths.max())), dtype=np.float32)
+    for i, points in enumerate(histories):
+        history[i, : len(points)] = points
+
+    chunk_runs = max(1, SIM_CHUNK_ELEMENTS // max(drivers * remaining_races, 1))
+    chunks = [chunk_runs] * (runs // chunk_runs)
+    if runs % chunk_runs:
+        chunks.append(runs % chunk_runs)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    tasks = [
+        (np.asarray(current, dtype=float), history, lengths, np.asarray(attendance, dtype=np.float32),
+         remaining_races, chunk, top_n, chunk_seed)
+        for chunk, chunk_seed in zip(chunks, seeds)
+    ]
+
+    workers = min(len(tasks), os.cpu_count() or 1)
+    if runs >= SIM_PARALLEL_THRESHOLD and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_simulate_season_chunk, tasks))
+    else:
+        results = [_simulate_season_chunk(task) for task in tasks]
+
+    return {key: sum(result[key] for result in results) for key in results[0]}
+
+
+def _season_points_histories(db, season):
+    """Points scored in each of a season's results, per driver."""
+    histories = {}
+    query = db.collection("race_results").where("season", "==", season).select(["driverId", "points"])
+    for doc in query.stream():
+        race = doc.to_dict() or {}
+        if race.get("driverId"):
+            histories.setdefault(race["driverId"], []).append(_as_points(race.get("points")))
+    return histories
+
+
+def _scheme_best_race_points(scheme, field_size):
+    """Most points one driver can take from a single race under a scheme."""
+    best = 0
+    for race_type in (scheme.get("raceTypes") or {}):
+        for start in {1, max(field_size, 1)}:
+            race = {"raceType": race_type, "startPosition": start, "finishPosition": 1}
+            best = max(best, _scheme_points(scheme, race) or 0)
+    return best
+
+
+@https_fn.on_request(cors=CORS_OPTIONS, timeout_sec=300, memory=options.MemoryOption.GB_1)
+def handleSimulateChampionship(req: https_fn.Request) -> https_fn.Response:
+    """Title and top-N probabilities from Monte Carlo season completions."""
     if req.method == "OPTIONS":
         return https_fn.Response("", status=204)
     if req.method != "GET":
         return https_fn.Response("Method not allowed", status=405)
 
-    track_name = req.args.get("trackName")
-    season = req.args.get("season")
+    season = req.args.get("season", "2025")
+    try:
+        remaining_races = int(req.args.get("remainingRaces", ""))
+        runs = int(req.args.get("simulations", SIM_DEFAULT_RUNS))
+        top_n = int(req.args.get("topN", 3))
+    except ValueError:
+        return https_fn.Response("remainingRaces, simulations and topN must be integers", status=400)
+    if not 1 <= remaining_races <= SIM_MAX_REMAINING_RACES:
+        return https_fn.Response(f"remainingRaces must be 1-{SIM_MAX_REMAINING_RACES}", status=400)
+    if not 1000 <= runs <= SIM_MAX_RUNS:
+        return https_fn.Response(f"simulations must be 1000-{SIM_MAX_RUNS}", status=400)
+    if top_n < 1:
+        return https_fn.Response("topN must be at least 1", status=400)
 
     try:
         db = firestore.client()
 
-        query = db.collection("race_results")
-        if track_name:
-            query = query.where("trackName", "==", track_name)
-        if season:
-            query = query.where("season", "==", season)
-
-        races = list(query.stream())
+        standings_ref = db.collection("season_standings").document(_standings_doc_id(season))
+        cache_ref = db.collection("championship_simulations").document(
+            _simulation_doc_id(season, remaining_races, runs, top_n)
+        )
+        docs = {doc.id: doc for doc in db.get_all([standings_ref, cache_ref])}
+        standings_doc = docs.get(standings_ref.id)
+        if standings_doc is not None and standings_doc.exists:
+            standings_data = standings_doc.to_dict() or {}
+        else:
+            # First read of the season, as in handleGetSeasonStandings
+            standings_data = {"drivers": _seed_season_standings(db, season), "version": 1}
+        version = standings_data.get("version", 0)
 
-        if not races:
+        cache_doc = docs.get(cache_ref.id)
+        cached = (cache_doc.to_dict() or {}) if cache_doc is not None and cache_doc.exists else {}
+        if cached.get("standingsVersion") == version and cached.get("result"):
             return https_fn.Response(
-                json.dumps({"message": "No race data found"}),
+                json.dumps({**cached["result"], "cached": True}, default=str),
                 status=200,
                 headers={"Content-Type": "application/json"},
             )
 
-        # Find records
-        fastest_lap_record = None
-        best_finish_record = None
-
-        for race_doc in races:
-            race_data = race_doc.to_dict()
-
-            # Fastest lap
-            if race_data.get("fastestLap"):
-                if not fastest_lap_record or race_data["fastestLap"] < fastest_lap_record["fastestLap"]:
-                    fastest_lap_record = {
-                        "driverName": race_data.get("driverName"),
-                        "fastestLap": race_data["fastestLap"],
-                        "raceDate": race_data.get("raceDate"),
-                        "trackName": race_data.get("trackName"),
-                    }
+        standings = _standings_list(standings_data.get("drivers") or {})
+        if not standings:
+            return https_fn.Response("No results recorded for this season yet", status=404)
 
-            # Best finish
-            if race_data.get("finishPosition") == 1:
-                if not best_finish_record:
-                    best_finish_record = {
-                        "driverName": race_data.get("driverName"),
-                        "raceDate": race_data.get("raceDate"),
-                        "trackName": race_data.get("trackName"),
-                    }
+        season_histories = _season_points_histories(db, season)
+        most_races = max(d.get("racesEntered", 0) for d in standings)
+        current = [d.get("totalPoints", 0) for d in standings]
+        histories = [season_histories.get(d["driverId"]) or [0] for d in standings]
+        attendance = [min(d.get("racesEntered", 0) / most_races, 1.0) for d in standings]
 
-        records = {
-            "trackName": track_name,
+        tallies = _simulate_championship(
+            current, histories, attendance, remaining_races, runs, top_n,
+            seed=[int(version), remaining_races, runs],
+        )
+
+        # Mathematical check, independent of the sampled form: a win in every
+        # remaining race under the season's scheme, else the best result seen
+        _, scheme = _points_scheme_for(_get_points_schemes(db), {"season": season})
+        if scheme is not None:
+            best_race = _scheme_best_race_points(scheme, len(standings))
+        else:
+            best_race = max((max(h) for h in histories), default=0)
+        max_haul = best_race * remaining_races
+        leader_points = max(current)
+        drivers = [
+            {
+                "driverId": driver["driverId"],
+                "driverName": driver.get("driverName"),
+                "position": driver["position"],
+                "points": driver.get("totalPoints", 0),
+                "titleProbability": round(float(tallies["titles"][i]) / runs, 4),
+                "topNProbability": round(float(tallies["topN"][i]) / runs, 4),
+                "expectedPoints": round(float(tallies["pointsSum"][i]) / runs, 1),
+                "expectedPosition": round(float(tallies["positionSum"][i]) / runs, 2),
+                "racesSampled": len(season_histories.get(driver["driverId"], [])),
+                "canStillWin": driver.get("totalPoints", 0) + max_haul >= leader_points,
+            }
+            for i, driver in enumerate(standings)
+        ]
+        drivers.sort(key=lambda d: (-d["titleProbability"], d["position"]))
+
+        result = {
             "season": season,
-            "fastestLapRecord": fastest_lap_record,
-            "bestFinishRecord": best_finish_record,
-            "totalRaces": len(races),
+            "standingsVersion": version,
+            "remainingRaces": remaining_races,
+            "simulations": runs,
+            "topN": top_n,
+            "drivers": drivers,
         }
+        cache_ref.set({"standingsVersion": version, "result": result, "updatedAt": firestore.SERVER_TIMESTAMP})
 
         return https_fn.Response(
-            json.dumps(records, default=str),
+            json.dumps({**result, "cached": False}, default=str),
             status=200,
             headers={"Content-Type": "application/json"},
         )
@@ -1631,61 +6513,153 @@ def handleGetTrackRecords(req: https_fn.Request) -> https_fn.Response:
         return https_fn.Response(f"An error occurred: {e}", status=500)
 
 
-@https_fn.on_request(cors=CORS_OPTIONS)
-def handleGetSeasonStandings(req: https_fn.Request) -> https_fn.Response:
-    """Get season standings sorted by points."""
-    if req.method == "OPTIONS":
-        return https_fn.Response("", status=204)
-    if req.method != "GET":
-        return https_fn.Response("Method not allowed", status=405)
+# ============================================================================
+# DRIVER CAREERS
+# ============================================================================
 
-    season = req.args.get("season", "2025")
+# Career summaries are folded from one projection of the driver's results
+# (season table and race-by-race trends alike) and cached in
+# driver_careers/{driverId}. The race_results trigger and event
+# imports bump that document's "version"; a cached summary is served only
+# while its summaryVersion still matches.
+CAREER_MOVING_AVERAGE_RACES = 5
+CAREER_RACE_FIELDS = ["season", "raceDate", *ROLLUP_SOURCE_FIELDS]
 
-    try:
-        db = firestore.client()
 
-        races = db.collection("race_results").where("season", "==", season).stream()
+def _bump_career_versions(db, driver_ids):
+    """Invalidate the cached career summaries of these drivers."""
+    for driver_id in sorted({d for d in driver_ids if d}):
+        db.collection("driver_careers").document(driver_id).set(
+            {"version": firestore.Increment(1)}, merge=True
+        )
 
-        # Aggregate points by driver
-        driver_standings = {}
 
-        for race_doc in races:
-            race_data = race_doc.to_dict()
-            driver_id = race_data.get("driverId")
-            driver_name = race_data.get("driverName")
-            points = race_data.get("points", 0)
+def _finish_moving_averages(finishes, window):
+    """Mean of each run of `window` finishes, aligned to the run's last race."""
+    values = np.asarray(finishes, dtype=float)
+    averages = np.full(values.size, np.nan)
+    if values.size >= window:
+        averages[window - 1:] = sliding_window_view(values, window).mean(axis=1)
+    return averages
 
-            if driver_id not in driver_standings:
-                driver_standings[driver_id] = {
-                    "driverId": driver_id,
-                    "driverName": driver_name,
-                    "carNumber": race_data.get("carNumber", ""),
-                    "totalPoints": 0,
-                    "racesEntered": 0,
-                    "wins": 0,
-                    "top5s": 0,
+
+def _driver_career(db, driver_id):
+    """Career summary for one driver, or None if they have no results."""
+    query = db.collection("race_results").where("driverId", "==", driver_id).select(CAREER_RACE_FIELDS)
+    races = sorted(
+        (doc.to_dict() or {} for doc in query.stream()),
+        key=lambda race: str(race.get("raceDate") or ""),
+    )
+    if not races:
+        return None
+
+    # The season table and the trends are folded from the same rows, so a
+    # correction not yet reflected in driver_rollups cannot split them
+    rollups = {None: {}}
+    for race in races:
+        _fold_race_into_rollup(rollups[None], race)
+        _fold_race_into_rollup(rollups.setdefault(str(race.get("season", "")), {}), race)
+
+    def _round(value, digits=2):
+        return round(float(value), digits) if np.isfinite(value) else None
+
+    def _table_row(rollup):
+        stats = _rollup_analytics(rollup)
+        races_run = stats["totalRaces"]
+        stats["wins"] = (rollup.get("finishCounts") or {}).get("1", 0)
+        stats["pointsPerStart"] = round(stats["totalPoints"] / races_run, 2) if races_run else None
+        return stats
+
+    # Race-by-race finishes, then per-season trend lines in one vectorized pass
+    placed = [(race, _as_position(race.get("finishPosition"))) for race in races]
+    placed = [(race, finish) for race, finish in placed if finish]
+    finishes = [finish for _, finish in placed]
+    moving = _finish_moving_averages(finishes, CAREER_MOVING_AVERAGE_RACES)
+    seasons = sorted(s for s in rollups if s is not None)
+    season_finishes = [
+        [finish for race, finish in placed if str(race.get("season", "")) == season] for season in seasons
+    ]
+    width = max([len(f) for f in season_finishes] + [1])
+    matrix = np.full((len(seasons), width), np.nan)
+    for row, values in enumerate(season_finishes):
+        matrix[row, : len(values)] = values
+    season_slopes = _row_slopes(matrix) if seasons else []
+
+    season_rows = []
+    for index, season in enumerate(seasons):
+        row = {"season": season, **_table_row(rollups[season])}
+        row["finishTrend"] = _round(season_slopes[index], 3)
+        last = max((i for i, (race, _) in enumerate(placed) if str(race.get("season", "")) == season), default=None)
+        row["endOfSeasonForm"] = _round(moving[last]) if last is not None else None
+        season_rows.append(row)
+
+    season_averages = np.array(
+        [[row["avgFinishPosition"] if row["avgFinishPosition"] is not None else np.nan for row in season_rows]],
+        dtype=float,
+    )
+    career = _table_row(rollups[None])
+    career["seasons"] = len(season_rows)
+    return {
+        "driverId": driver_id,
+        "driverName": next((r.get("driverName") for r in reversed(races) if r.get("driverName")), None),
+        "career": career,
+        "seasons": season_rows,
+        "trends": {
+            "window": CAREER_MOVING_AVERAGE_RACES,
+            "movingAverageFinish": [
+                {
+                    "raceDate": race.get("raceDate"),
+                    "season": str(race.get("season", "")),
+                    "finishPosition": finish,
+                    "movingAverage": _round(average),
                 }
+                for (race, finish), average in zip(placed, moving)
+            ],
+            # Positions per race / per season; negative means finishing higher
+            "improvementSlope": _round(_row_slopes(np.array([finishes], dtype=float))[0], 3)
+            if finishes
+            else None,
+            "seasonOverSeasonSlope": _round(_row_slopes(season_averages)[0], 3)
+            if season_rows
+            else None,
+        },
+    }
+
 
-            driver_standings[driver_id]["totalPoints"] += points
-            driver_standings[driver_id]["racesEntered"] += 1
+@https_fn.on_request(cors=CORS_OPTIONS)
+def handleGetDriverCareer(req: https_fn.Request) -> https_fn.Response:
+    """Season-by-season career summary with rolling trends for one driver."""
+    if req.method == "OPTIONS":
+        return https_fn.Response("", status=204)
+    if req.method != "GET":
+        return https_fn.Response("Method not allowed", status=405)
 
-            finish_pos = race_data.get("finishPosition")
-            if finish_pos == 1:
-                driver_standings[driver_id]["wins"] += 1
-            if finish_pos and finish_pos <= 5:
-                driver_standings[driver_id]["top5s"] += 1
+    driver_id = req.args.get("driverId")
+    if not driver_id:
+        return https_fn.Response("driverId is required", status=400)
 
-        # Sort by points
-        standings_list = sorted(
-            driver_standings.values(), key=lambda x: x["totalPoints"], reverse=True
-        )
+    try:
+        db = firestore.client()
 
-        # Add position numbers
-        for i, driver in enumerate(standings_list):
-            driver["position"] = i + 1
+        cache_ref = db.collection("driver_careers").document(driver_id)
+        cache_doc = cache_ref.get()
+        cached = (cache_doc.to_dict() or {}) if cache_doc.exists else {}
+        version = cached.get("version", 0)
+        summary = cached.get("summary")
+        from_cache = summary is not None and cached.get("summaryVersion") == version
+
+        if not from_cache:
+            summary = _driver_career(db, driver_id)
+            if summary is None:
+                return https_fn.Response("No results found for driver", status=404)
+            # A result written meanwhile bumps "version" and retires this copy
+            cache_ref.set(
+                {"summary": summary, "summaryVersion": version, "builtAt": firestore.SERVER_TIMESTAMP},
+                merge=True,
+            )
 
         return https_fn.Response(
-            json.dumps({"season": season, "standings": standings_list}, default=str),
+            json.dumps({**summary, "cached": from_cache}, default=str),
             status=200,
             headers={"Content-Type": "application/json"},
         )
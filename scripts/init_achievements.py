@@ -113,6 +113,13 @@ def print_firestore_commands():
                     print(f"  {key}: {value},")
         print("});\n")
 
+    # Cloud Functions cache the catalog in memory; bumping the version tells
+    # warm instances to reload it.
+    print("// Invalidate the cached achievement catalog")
+    print("db.collection('config').doc('achievements_catalog').set({")
+    print("  version: firebase.firestore.FieldValue.increment(1),")
+    print("}, { merge: true });\n")
+
 if __name__ == "__main__":
     print("RedsRacing Sample Achievements")
     print("=" * 30)
@@ -127,4 +134,5 @@ if __name__ == "__main__":
     print("1. Open Firebase Console > Firestore Database")
     print("2. Create a collection called 'achievements'")
     print("3. For each achievement, create a document with the ID and fields shown above")
-    print("4. Or upload the sample_achievements.json file using the Firebase Admin SDK")
\ No newline at end of file
+    print("4. Or upload the sample_achievements.json file using the Firebase Admin SDK")
+    print("5. Increment config/achievements_catalog.version after any catalog change")
\ No newline at end of file
@@ -0,0 +1,91 @@
+"""
+Rekey user_achievements documents to deterministic IDs for RedsRacing.
+
+Awards are now stored as user_achievements/{userId}_{achievementId} so that a
+single create() both checks for and records an award. This script moves
+documents written with auto-generated IDs onto their deterministic ID.
+Duplicate awards for the same user and achievement collapse into the earliest
+one.
+
+Run once after deploying the deterministic-ID functions, then call
+/api/rebuild-leaderboard so point totals drop any duplicates removed here.
+
+Usage:
+    python scripts/rekey_user_achievements.py --dry-run
+    python scripts/rekey_user_achievements.py
+"""
+
+import argparse
+
+import firebase_admin
+from firebase_admin import firestore
+
+# Each rekeyed award is one create plus one delete
+BATCH_PAIRS = 200
+
+
+def _earned_sort_key(doc):
+    """Sort awards oldest first; awards without a dateEarned go last."""
+    date_earned = (doc.to_dict() or {}).get("dateEarned")
+    return (date_earned is None, date_earned.timestamp() if date_earned else 0)
+
+
+def rekey(db, dry_run=False):
+    """Move every award onto its deterministic ID. Returns a summary dict."""
+    by_target = {}
+    for doc in db.collection("user_achievements").stream():
+        data = doc.to_dict() or {}
+        user_id = data.get("userId")
+        achievement_id = data.get("achievementId")
+        if not user_id or not achievement_id:
+            print(f"Skipping malformed award {doc.id}")
+            continue
+        by_target.setdefault(f"{user_id}_{achievement_id}", []).append(doc)
+
+    moved = 0
+    duplicates = 0
+    pending = []
+
+    for target_id, docs in by_target.items():
+        docs.sort(key=_earned_sort_key)
+        keeper = next((d for d in docs if d.id == target_id), docs[0])
+        for doc in docs:
+            if doc.id == target_id:
+                continue
+            if doc is keeper:
+                pending.append(("move", doc, target_id))
+                moved += 1
+            else:
+                pending.append(("delete", doc, None))
+                duplicates += 1
+
+    if not dry_run:
+        for i in range(0, len(pending), BATCH_PAIRS):
+            batch = db.batch()
+            for action, doc, target_id in pending[i:i + BATCH_PAIRS]:
+                if action == "move":
+                    batch.set(
+                        db.collection("user_achievements").document(target_id),
+                        doc.to_dict(),
+                    )
+                batch.delete(doc.reference)
+            batch.commit()
+
+    return {"awards": len(by_target), "moved": moved, "duplicatesRemoved": duplicates}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="report changes without writing")
+    args = parser.parse_args()
+
+    firebase_admin.initialize_app()
+    summary = rekey(firestore.client(), dry_run=args.dry_run)
+
+    print("RedsRacing user_achievements rekey" + (" (dry run)" if args.dry_run else ""))
+    print("=" * 30)
+    print(f"Distinct awards:     {summary['awards']}")
+    print(f"Moved to new IDs:    {summary['moved']}")
+    print(f"Duplicates removed:  {summary['duplicatesRemoved']}")
+    if summary["duplicatesRemoved"] and not args.dry_run:
+        print("Run /api/rebuild-leaderboard to refresh point totals.")
@@ -1,28 +1,40 @@
 import unittest
 from unittest.mock import Mock, patch
+import copy
 import json
 import os
 import sys
+from datetime import datetime
 from flask import Flask
+from google.api_core.exceptions import AlreadyExists
 
 # Add the functions_python directory to the path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions_python'))
 
+import main
 from main import (
     handleGetProfile, 
     handleUpdateProfile, 
     handleGetAchievements, 
     handleAssignAchievement,
+    handleGetLeaderboard,
+    handleAutoAwardAchievement,
+    handleAutoAwardAchievementsBatch,
+    handleGetAchievementProgress,
+    handleBackfillRaceAchievements,
+    handleBulkAssignAchievements,
     _get_user_from_token,
-    _is_admin
+    _is_admin,
+    _get_achievement_catalog,
 )
 
 class MockRequest:
     """Mock Firebase Functions Request object."""
-    def __init__(self, method='GET', path='/profile/user123', headers=None, json_data=None, base_url="https://example.com"):
+    def __init__(self, method='GET', path='/profile/user123', headers=None, json_data=None, base_url="https://example.com", args=None):
         self.method = method
         self.path = path
         self.headers = headers or {}
+        self.args = args or {}
         self._json_data = json_data
         self.base_url = base_url
 
@@ -35,6 +47,8 @@ class TestProfileEndpoints(unittest.TestCase):
     def setUp(self):
         """Set up test fixtures."""
         self.app = Flask(__name__)
+        main._achievement_catalog_cache.update(achievements=None, version=None, checkedAt=0.0)
+        main._compiled_achievement_rules['byAction'] = None
         self.mock_auth_token = {
             'uid': 'test_user_123',
             'email': 'test@example.com',
@@ -93,6 +107,44 @@ class TestProfileEndpoints(unittest.TestCase):
             response_data = json.loads(response.data)
             self.assertEqual(response_data['username'], 'testuser')
 
+    @patch('main.firestore.client')
+    def test_get_profile_batches_achievement_reads(self, mock_firestore_client):
+        """Test achievement details are resolved with one batched fetch."""
+        request = MockRequest(path='/profile/user123')
+        with self.app.test_request_context(path=request.path):
+            mock_db = Mock()
+            mock_firestore_client.return_value = mock_db
+            mock_profile_doc = Mock()
+            mock_profile_doc.exists = True
+            mock_profile_doc.to_dict.return_value = {'username': 'testuser'}
+            mock_db.collection.return_value.document.return_value.get.return_value = mock_profile_doc
+
+            earned = []
+            details = []
+            for achievement_id in ['first_race', 'podium_finish', 'photographer']:
+                ach_doc = Mock()
+                ach_doc.to_dict.return_value = {'userId': 'user123', 'achievementId': achievement_id}
+                earned.append(ach_doc)
+                detail_doc = Mock()
+                detail_doc.id = achievement_id
+                detail_doc.exists = True
+                detail_doc.to_dict.return_value = {'name': achievement_id}
+                details.append(detail_doc)
+            mock_db.collection.return_value.where.return_value.stream.return_value = earned
+            # The catalog only knows two of the three badges; the third is fetched
+            mock_db.collection.return_value.stream.return_value = details[:2]
+            mock_db.get_all.return_value = details[2:]
+
+            response = handleGetProfile(request)
+
+            self.assertEqual(response.status_code, 200)
+            response_data = json.loads(response.data)
+            self.assertEqual(len(response_data['achievements']), 3)
+            # profile + 3 earned + version doc + 2 catalog docs + 1 batched fetch
+            self.assertEqual(response_data['firestoreReads'], 8)
+            mock_db.get_all.assert_called_once()
+            self.assertEqual(len(mock_db.get_all.call_args[0][0]), 1)
+
     @patch('main.firestore.client')
     def test_get_profile_not_found(self, mock_firestore_client):
         """Test profile not found scenario."""
@@ -177,14 +229,582 @@ class TestProfileEndpoints(unittest.TestCase):
             mock_db = Mock()
             mock_firestore_client.return_value = mock_db
             mock_achievement_doc = Mock()
-            mock_achievement_doc.exists = True
-            mock_db.collection.return_value.document.return_value.get.return_value = mock_achievement_doc
+            mock_achievement_doc.id = 'achievement_1'
+            mock_achievement_doc.to_dict.return_value = {'name': 'First Race', 'points': 10}
+            mock_db.collection.return_value.stream.return_value = [mock_achievement_doc]
             mock_db.collection.return_value.where.return_value.where.return_value.limit.return_value.stream.return_value = []
 
             response = handleAssignAchievement(request)
 
             self.assertEqual(response.status_code, 200)
 
+    def test_achievement_catalog_served_from_memory(self):
+        """Test warm instances reuse the catalog until the TTL lapses."""
+        mock_db = Mock()
+        mock_achievement_doc = Mock()
+        mock_achievement_doc.id = 'first_race'
+        mock_achievement_doc.to_dict.side_effect = lambda: {'name': 'First Race'}
+        mock_db.collection.return_value.stream.return_value = [mock_achievement_doc]
+        version_doc = Mock()
+        version_doc.exists = True
+        version_doc.to_dict.return_value = {'version': 3}
+        mock_db.collection.return_value.document.return_value.get.return_value = version_doc
+
+        catalog, reads = _get_achievement_catalog(mock_db)
+        self.assertEqual(catalog['first_race']['id'], 'first_race')
+        self.assertEqual(reads, 2)
+
+        catalog, reads = _get_achievement_catalog(mock_db)
+        self.assertEqual(reads, 0)
+        self.assertEqual(mock_db.collection.return_value.stream.call_count, 1)
+
+    def test_achievement_catalog_rescans_on_version_change(self):
+        """Test an expired TTL only re-streams the catalog when its version moved."""
+        mock_db = Mock()
+        mock_achievement_doc = Mock()
+        mock_achievement_doc.id = 'first_race'
+        mock_achievement_doc.to_dict.side_effect = lambda: {'name': 'First Race'}
+        mock_db.collection.return_value.stream.return_value = [mock_achievement_doc]
+        version_doc = Mock()
+        version_doc.exists = True
+        version_doc.to_dict.return_value = {'version': 3}
+        mock_db.collection.return_value.document.return_value.get.return_value = version_doc
+
+        _get_achievement_catalog(mock_db)
+        main._achievement_catalog_cache['checkedAt'] = 0.0
+        _, reads = _get_achievement_catalog(mock_db)
+        self.assertEqual(reads, 1)
+        self.assertEqual(mock_db.collection.return_value.stream.call_count, 1)
+
+        version_doc.to_dict.return_value = {'version': 4}
+        main._achievement_catalog_cache['checkedAt'] = 0.0
+        _get_achievement_catalog(mock_db)
+        self.assertEqual(mock_db.collection.return_value.stream.call_count, 2)
+
+    @patch('main._refresh_leaderboard_snapshot')
+    @patch('main.auth.verify_id_token')
+    @patch('main.firestore.client')
+    def test_assign_achievement_credits_leaderboard(self, mock_firestore_client, mock_verify_token, mock_refresh):
+        """Test the award and the leaderboard increment are committed together."""
+        request_data = {'userId': 'test_user_123', 'achievementId': 'achievement_1'}
+        request = MockRequest(method='POST', headers={'Authorization': 'Bearer admin_token'}, json_data=request_data)
+        with self.app.test_request_context(path=request.path, method=request.method, headers=request.headers, json=request_data):
+            mock_verify_token.return_value = self.mock_admin_token
+            mock_db = Mock()
+            mock_firestore_client.return_value = mock_db
+            mock_achievement_doc = Mock()
+            mock_achievement_doc.id = 'achievement_1'
+            mock_achievement_doc.to_dict.return_value = {'name': 'First Race', 'points': 10}
+            mock_db.collection.return_value.stream.return_value = [mock_achievement_doc]
+
+            response = handleAssignAchievement(request)
+
+            self.assertEqual(response.status_code, 200)
+            mock_db.collection.return_value.document.assert_any_call('test_user_123_achievement_1')
+            mock_db.collection.return_value.where.assert_not_called()
+            batch = mock_db.batch.return_value
+            batch.create.assert_called_once()
+            batch.set.assert_called_once()
+            batch.commit.assert_called_once()
+            entry_data = batch.set.call_args[0][1]
+            self.assertEqual(entry_data['userId'], 'test_user_123')
+            mock_refresh.assert_called_once_with(mock_db, 'test_user_123')
+
+    @patch('main._refresh_leaderboard_snapshot')
+    @patch('main.auth.verify_id_token')
+    @patch('main.firestore.client')
+    def test_assign_achievement_duplicate(self, mock_firestore_client, mock_verify_token, mock_refresh):
+        """Test the create-if-absent write rejects an award the user already holds."""
+        request_data = {'userId': 'test_user_123', 'achievementId': 'achievement_1'}
+        request = MockRequest(method='POST', headers={'Authorization': 'Bearer admin_token'}, json_data=request_data)
+        with self.app.test_request_context(path=request.path, method=request.method, headers=request.headers, json=request_data):
+            mock_verify_token.return_value = self.mock_admin_token
+            mock_db = Mock()
+            mock_firestore_client.return_value = mock_db
+            mock_achievement_doc = Mock()
+            mock_achievement_doc.id = 'achievement_1'
+            mock_achievement_doc.to_dict.return_value = {'name': 'First Race', 'points': 10}
+            mock_db.collection.return_value.stream.return_value = [mock_achievement_doc]
+            mock_db.batch.return_value.commit.side_effect = AlreadyExists('exists')
+
+            response = handleAssignAchievement(request)
+
+            self.assertEqual(response.status_code, 400)
+            mock_refresh.assert_not_called()
+
+    @patch('main.firestore.client')
+    def test_get_leaderboard_reads_snapshot(self, mock_firestore_client):
+        """Test the leaderboard is served from the materialized snapshot."""
+        request = MockRequest(path='/leaderboard')
+        with self.app.test_request_context(path=request.path):
+            mock_db = Mock()
+            mock_firestore_client.return_value = mock_db
+            snapshot_doc = Mock()
+            snapshot_doc.exists = True
+            snapshot_doc.to_dict.return_value = {'entries': [
+                {'userId': 'a', 'displayName': 'A', 'totalPoints': 50, 'achievementCount': 2},
+                {'userId': 'b', 'displayName': 'B', 'totalPoints': 10, 'achievementCount': 1},
+            ]}
+            mock_db.collection.return_value.document.return_value.get.return_value = snapshot_doc
+
+            response = handleGetLeaderboard(request)
+
+            self.assertEqual(response.status_code, 200)
+            response_data = json.loads(response.data)
+            self.assertEqual([u['rank'] for u in response_data], [1, 2])
+            self.assertEqual(response_data[0]['userId'], 'a')
+            mock_db.collection.return_value.stream.assert_not_called()
+            mock_db.collection.return_value.order_by.assert_not_called()
+
+    @patch('main.firestore.client')
+    def test_get_leaderboard_pages_with_cursor(self, mock_firestore_client):
+        """Test a cursor resumes the ordered index after the previous page."""
+        cursor = main._encode_leaderboard_cursor({'userId': 'b', 'totalPoints': 10}, 2)
+        request = MockRequest(path='/leaderboard', args={'limit': '2', 'cursor': cursor})
+        with self.app.test_request_context(path=request.path):
+            mock_db = Mock()
+            mock_firestore_client.return_value = mock_db
+            query = mock_db.collection.return_value.order_by.return_value.order_by.return_value
+            docs = []
+            for user_id, points in [('c', 8), ('d', 5), ('e', 1)]:
+                doc = Mock()
+                doc.to_dict.return_value = {'userId': user_id, 'totalPoints': points}
+                docs.append(doc)
+            query.start_after.return_value.limit.return_value.stream.return_value = docs
+
+            response = handleGetLeaderboard(request)
+
+            self.assertEqual(response.status_code, 200)
+            response_data = json.loads(response.data)
+            self.assertEqual([u['rank'] for u in response_data['entries']], [3, 4])
+            query.start_after.assert_called_once_with({'totalPoints': 10, 'userId': 'b'})
+            self.assertEqual(main._decode_leaderboard_cursor(response_data['nextCursor']), (5, 'd', 4))
+
+    @patch('main.firestore.client')
+    def test_get_leaderboard_rank_lookup_outside_snapshot(self, mock_firestore_client):
+        """Test a user's rank is counted from the points index, not sorted."""
+        request = MockRequest(path='/leaderboard', args={'userId': 'fan_7'})
+        with self.app.test_request_context(path=request.path):
+            mock_db = Mock()
+            mock_firestore_client.return_value = mock_db
+            entry_doc = Mock()
+            entry_doc.exists = True
+            entry_doc.to_dict.return_value = {'userId': 'fan_7', 'totalPoints': 15, 'entries': []}
+            mock_db.collection.return_value.document.return_value.get.return_value = entry_doc
+            entries = mock_db.collection.return_value
+            ahead = Mock()
+            ahead.value = 120
+            tied = Mock()
+            tied.value = 3
+            entries.where.return_value.count.return_value.get.return_value = [[ahead]]
+            entries.where.return_value.where.return_value.count.return_value.get.return_value = [[tied]]
+
+            response = handleGetLeaderboard(request)
+
+            self.assertEqual(response.status_code, 200)
+            response_data = json.loads(response.data)
+            self.assertEqual(response_data['rank'], 124)
+            entries.stream.assert_not_called()
+
+    def test_achievement_rules_dispatch_by_action(self):
+        """Test compiled rules only evaluate the rules for the event's action."""
+        rules = main._compile_achievement_rules(main.DEFAULT_ACHIEVEMENT_RULES)
+        self.assertEqual(
+            main._evaluate_achievement_rules(rules, 'race_completed', {'finishPosition': 2, 'fastestLap': 15.1}),
+            ['first_race', 'podium_finish', 'speed_demon'],
+        )
+        self.assertEqual(
+            main._evaluate_achievement_rules(rules, 'race_completed', {'finishPosition': 1, 'isHomeTrack': True, 'seasonRaces': 5}),
+            ['first_race', 'podium_finish', 'consistent_racer', 'track_master'],
+        )
+        self.assertEqual(main._evaluate_achievement_rules(rules, 'photo_upload', {'totalPhotos': 4}), [])
+        self.assertEqual(main._evaluate_achievement_rules(rules, 'photo_upload', {'totalPhotos': 5}), ['photographer'])
+        self.assertEqual(main._evaluate_achievement_rules(rules, 'unknown_action', {}), [])
+
+    def test_achievement_rules_reject_unknown_operator(self):
+        """Test rule compilation fails fast on a bad operator."""
+        with self.assertRaises(ValueError):
+            main._compile_achievement_rules([
+                {'achievementId': 'x', 'actions': ['a'], 'conditions': [{'field': 'f', 'op': '~', 'value': 1}]}
+            ])
+
+    @patch('main._refresh_leaderboard_snapshot')
+    @patch('main.firestore.client')
+    def test_auto_award_racing_achievements(self, mock_firestore_client, mock_refresh):
+        """Test a race_completed event awards the matching racing achievements."""
+        request_data = {'userId': 'driver_1', 'actionType': 'race_completed', 'actionData': {'finishPosition': 3}}
+        request = MockRequest(method='POST', json_data=request_data)
+        with self.app.test_request_context(path=request.path, method=request.method, json=request_data):
+            mock_db = Mock()
+            mock_firestore_client.return_value = mock_db
+            catalog_docs = []
+            for achievement_id in ['first_race', 'podium_finish', 'speed_demon']:
+                doc = Mock()
+                doc.id = achievement_id
+                doc.to_dict.return_value = {'name': achievement_id, 'description': '', 'points': 10}
+                catalog_docs.append(doc)
+            mock_db.collection.return_value.stream.return_value = catalog_docs
+            rules_doc = Mock()
+            rules_doc.exists = False
+            mock_db.collection.return_value.document.return_value.get.return_value = rules_doc
+            mock_db.get_all.return_value = []
+
+            response = handleAutoAwardAchievement(request)
+
+            self.assertEqual(response.status_code, 200)
+            response_data = json.loads(response.data)
+            self.assertEqual(
+                [a['id'] for a in response_data['awardedAchievements']],
+                ['first_race', 'podium_finish'],
+            )
+            # The profile is read once for both awards
+            profile_reads = [c for c in mock_db.collection.call_args_list if c.args == ('users',)]
+            self.assertEqual(len(profile_reads), 1)
+
+    @patch('main._refresh_leaderboard_snapshot')
+    @patch('main.firestore.client')
+    def test_auto_award_batch_groups_events(self, mock_firestore_client, mock_refresh):
+        """Test a burst of events is evaluated in one pass and committed in one batch."""
+        events = [
+            {'userId': 'u1', 'actionType': 'photo_upload', 'actionData': {'totalPhotos': 5}},
+            {'userId': 'u2', 'actionType': 'first_login'},
+            {'userId': 'u1', 'actionType': 'photo_upload', 'actionData': {'totalPhotos': 6}},
+            {'userId': 'u1', 'actionType': 'first_login'},
+            {'actionType': 'first_login'},
+        ]
+        request = MockRequest(method='POST', json_data={'events': events})
+        with self.app.test_request_context(path=request.path, method=request.method, json={'events': events}):
+            mock_db = Mock()
+            mock_firestore_client.return_value = mock_db
+            catalog_docs = []
+            for achievement_id in ['photographer', 'community_member']:
+                doc = Mock()
+                doc.id = achievement_id
+                doc.to_dict.return_value = {'name': achievement_id, 'description': '', 'points': 5}
+                catalog_docs.append(doc)
+            mock_db.collection.return_value.stream.return_value = catalog_docs
+            rules_doc = Mock()
+            rules_doc.exists = False
+            mock_db.collection.return_value.document.return_value.get.return_value = rules_doc
+            held_doc = Mock()
+            held_doc.exists = True
+            held_doc.to_dict.return_value = {'userId': 'u1', 'achievementId': 'community_member'}
+            mock_db.get_all.side_effect = [[held_doc], []]
+
+            response = handleAutoAwardAchievementsBatch(request)
+
+            self.assertEqual(response.status_code, 200)
+            results = json.loads(response.data)['results']
+            self.assertEqual([a['id'] for a in results[0]['awardedAchievements']], ['photographer'])
+            self.assertEqual([a['id'] for a in results[1]['awardedAchievements']], ['community_member'])
+            self.assertEqual(results[2]['awardedAchievements'], [])
+            self.assertEqual(results[3]['awardedAchievements'], [])
+            self.assertIn('error', results[4])
+            batch = mock_db.batch.return_value
+            self.assertEqual(batch.create.call_count, 2)
+            batch.commit.assert_called_once()
+            self.assertEqual(set(mock_refresh.call_args[0][1:]), {'u1', 'u2'})
+
+    @patch('main.firestore.client')
+    def test_achievement_progress_from_counters(self, mock_firestore_client):
+        """Test progress is served from the user's counter document."""
+        request = MockRequest(path='/achievement_progress/user123')
+        with self.app.test_request_context(path=request.path):
+            mock_db = Mock()
+            mock_firestore_client.return_value = mock_db
+            mock_db.get_all.return_value = []
+            stats_doc = Mock()
+            stats_doc.exists = True
+            stats_doc.to_dict.return_value = {'photosUploaded': 3, 'likesReceived': 12, 'racesEntered': 0}
+            mock_db.collection.return_value.document.return_value.get.return_value = stats_doc
+
+            response = handleGetAchievementProgress(request)
+
+            self.assertEqual(response.status_code, 200)
+            response_data = json.loads(response.data)
+            self.assertEqual(response_data['photographer']['current'], 3)
+            self.assertTrue(response_data['fan_favorite']['completed'])
+            mock_db.collection.return_value.where.assert_not_called()
+
+    @patch('main.firestore.transactional', lambda fn: fn)
+    def test_user_counters_seeded_from_aggregation(self):
+        """Test missing counters are aggregated and seeded inside a transaction."""
+        mock_db = Mock()
+        stats_doc = Mock()
+        stats_doc.exists = False
+        stats_ref = mock_db.collection.return_value.document.return_value
+        stats_ref.get.return_value = stats_doc
+        query = mock_db.collection.return_value.where.return_value
+        count_result = Mock()
+        count_result.value = 4
+        sum_result = Mock()
+        sum_result.value = 9
+        query.count.return_value.get.return_value = [[count_result]]
+        query.sum.return_value.get.return_value = [[sum_result]]
+        transaction = mock_db.transaction.return_value
+
+        counters, reads = main._get_user_counters(mock_db, 'user123')
+
+        self.assertEqual(counters, {'photosUploaded': 4, 'likesReceived': 9, 'racesEntered': 4})
+        self.assertEqual(reads, 5)
+        query.stream.assert_not_called()
+        stats_ref.get.assert_called_with(transaction=transaction)
+        query.count.return_value.get.assert_called_with(transaction=transaction)
+        seeded = transaction.set.call_args[0][1]
+        self.assertEqual(seeded['likesReceived'], 9)
+        self.assertIn('seededAt', seeded)
+
+    def test_user_counters_fall_back_to_streaming(self):
+        """Test a failed aggregation streams the counts and seeds nothing."""
+        mock_db = Mock()
+        stats_doc = Mock()
+        stats_doc.exists = False
+        stats_ref = mock_db.collection.return_value.document.return_value
+        stats_ref.get.return_value = stats_doc
+        photos = []
+        for likes in (2, 5):
+            photo = Mock()
+            photo.to_dict.return_value = {'likeCount': likes}
+            photos.append(photo)
+        query = mock_db.collection.return_value.where.return_value
+        query.stream.return_value = photos
+        query.select.return_value.stream.return_value = [Mock()]
+        query.count.return_value.get.side_effect = RuntimeError('aggregation unavailable')
+
+        with patch('main.firestore.transactional', lambda fn: fn):
+            counters, _ = main._get_user_counters(mock_db, 'user123')
+
+        self.assertEqual(counters, {'photosUploaded': 2, 'likesReceived': 7, 'racesEntered': 1})
+        mock_db.transaction.return_value.set.assert_not_called()
+
+    @patch('main.firestore.transactional', lambda fn: fn)
+    def test_counter_increment_skipped_when_seeded_after_write(self):
+        """Test a delta already counted by the seeding aggregation is not applied again."""
+        mock_db = Mock()
+        stats_doc = Mock()
+        stats_doc.exists = True
+        stats_doc.to_dict.return_value = {'photosUploaded': 1, 'seededAt': datetime(2025, 6, 2)}
+        mock_db.collection.return_value.document.return_value.get.return_value = stats_doc
+        transaction = mock_db.transaction.return_value
+
+        main._increment_user_counters(mock_db, 'u1', as_of=datetime(2025, 6, 1), photosUploaded=1)
+        transaction.update.assert_not_called()
+
+        main._increment_user_counters(mock_db, 'u1', as_of=datetime(2025, 6, 3), photosUploaded=1)
+        transaction.update.assert_called_once()
+
+    @patch('main.firestore.client')
+    def test_gallery_trigger_applies_like_delta(self, mock_firestore_client):
+        """Test a like on a photo increments the uploader's likesReceived counter."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        before = Mock()
+        before.exists = True
+        before.to_dict.return_value = {'uploaderUid': 'u1', 'likeCount': 2}
+        after = Mock()
+        after.exists = True
+        after.to_dict.return_value = {'uploaderUid': 'u1', 'likeCount': 3}
+        event = Mock()
+        event.data.before = before
+        event.data.after = after
+
+        with patch('main._increment_user_counters') as mock_increment:
+            # Call the undecorated function; the wrapper expects a raw CloudEvent
+            main.handleGalleryImageWritten.__wrapped__(event)
+            mock_increment.assert_called_once_with(
+                mock_db, 'u1', as_of=event.time, event_id=event.id, view='counters_0',
+                photosUploaded=0, likesReceived=1,
+            )
+
+    @patch('main.firestore.transactional', lambda fn: fn)
+    def test_counter_increment_applied_once_per_event(self):
+        """Test a redelivered trigger event does not count a photo twice."""
+        mock_db = Mock()
+        stats_doc = Mock()
+        stats_doc.exists = True
+        stats_doc.to_dict.return_value = {'photosUploaded': 1}
+        processed = {}
+        marker = Mock()
+
+        def _document(doc_id):
+            ref = Mock()
+            if doc_id == 'evt_1':
+                marker.exists = doc_id in processed
+                marker.to_dict.return_value = processed.get(doc_id, {})
+                ref.get.return_value = marker
+            else:
+                ref.get.return_value = stats_doc
+            return ref
+
+        mock_db.collection.return_value.document.side_effect = _document
+        transaction = mock_db.transaction.return_value
+        transaction.set.side_effect = lambda ref, data, merge=False: processed.setdefault('evt_1', {}).update(data)
+
+        for _ in range(2):
+            main._increment_user_counters(mock_db, 'u1', as_of=datetime(2025, 6, 1), event_id='evt_1', photosUploaded=1)
+
+        transaction.update.assert_called_once()
+
+    @patch('main._award_new_candidates')
+    @patch('main.auth.verify_id_token')
+    @patch('main.firestore.client')
+    def test_backfill_race_achievements_pages_and_checkpoints(self, mock_firestore_client, mock_verify_token, mock_award):
+        """Test the backfill streams race_results in pages and checkpoints its cursor."""
+        request = MockRequest(method='POST', headers={'Authorization': 'Bearer admin_token'}, json_data={'pageSize': 2})
+        with self.app.test_request_context(path=request.path, method=request.method, headers=request.headers, json={'pageSize': 2}):
+            mock_verify_token.return_value = self.mock_admin_token
+            mock_db = Mock()
+            mock_firestore_client.return_value = mock_db
+            job_doc = Mock()
+            job_doc.exists = False
+            job_ref = mock_db.collection.return_value.document.return_value
+            job_ref.get.return_value = job_doc
+            progress_refs = {'drivers': Mock(), 'seasons': Mock()}
+            job_ref.collection.side_effect = lambda name: progress_refs[name]
+            for progress_ref in progress_refs.values():
+                progress_ref.select.return_value.stream.return_value = []
+                progress_ref.stream.return_value = []
+                progress_ref.document.side_effect = lambda doc_id: f'ref:{doc_id}'
+            # Progress docs written by one page are read back by the next
+            stored = {}
+            mock_db.batch.return_value.set.side_effect = (
+                lambda ref, payload, merge=False: stored.__setitem__(ref, copy.deepcopy(payload))
+            )
+
+            def _progress_doc(ref):
+                doc = Mock()
+                doc.id = ref.split(':', 1)[1]
+                doc.exists = ref in stored
+                doc.to_dict.return_value = copy.deepcopy(stored.get(ref))
+                return doc
+
+            mock_db.get_all.side_effect = lambda refs: [_progress_doc(ref) for ref in refs]
+            catalog_docs = []
+            for achievement_id in ['first_race', 'podium_finish', 'season_veteran']:
+                doc = Mock()
+                doc.id = achievement_id
+                doc.to_dict.return_value = {'name': achievement_id, 'description': '', 'points': 10}
+                catalog_docs.append(doc)
+            mock_db.collection.return_value.stream.return_value = catalog_docs
+
+            def race(doc_id, driver, season, date, finish):
+                doc = Mock()
+                doc.id = doc_id
+                doc.to_dict.return_value = {
+                    'driverId': driver, 'season': season, 'raceDate': date, 'finishPosition': finish,
+                }
+                return doc
+
+            first_query = mock_db.collection.return_value.order_by.return_value.limit.return_value
+            first_query.stream.return_value = [race('a', 'd1', '2024', '2024-06-01', 2), race('b', 'd2', '2024', '2024-06-01', 7)]
+            first_query.start_after.return_value.stream.side_effect = [
+                [race('c', 'd1', '2024', '2024-07-01', 9)],
+            ]
+            mock_award.side_effect = lambda db, achievements, candidates: set(candidates)
+
+            response = handleBackfillRaceAchievements(request)
+
+            self.assertEqual(response.status_code, 200)
+            response_data = json.loads(response.data)
+            self.assertEqual(response_data['status'], 'done')
+            self.assertEqual(response_data['processed'], 3)
+            first_query.start_after.assert_called_once_with({'__name__': 'b'})
+            first_page = mock_award.call_args_list[0][0][2]
+            self.assertEqual(
+                set(first_page),
+                {('d1', 'first_race'), ('d1', 'podium_finish'), ('d2', 'first_race')},
+            )
+            # 2024 is the only season, so it is treated as in progress
+            self.assertEqual(mock_award.call_count, 2)
+            checkpoint = job_ref.set.call_args[0][0]
+            self.assertEqual(checkpoint['status'], 'done')
+            self.assertEqual(checkpoint['cursor'], 'c')
+            self.assertNotIn('state', checkpoint)
+            # Driver tallies go to the drivers subcollection, one doc per driver
+            driver_writes = stored
+            self.assertEqual(driver_writes['ref:d1']['seasons']['2024']['races'], 2)
+            self.assertEqual(driver_writes['ref:d1']['lastResultId'], 'c')
+            self.assertEqual(driver_writes['ref:d2']['seasons']['2024']['races'], 1)
+
+    @patch('main._refresh_leaderboard_snapshot')
+    @patch('main.auth.verify_id_token')
+    @patch('main.firestore.client')
+    def test_bulk_assign_reports_per_row(self, mock_firestore_client, mock_verify_token, mock_refresh):
+        """Test bulk CSV assignment validates, deduplicates and batches writes."""
+        csv_rows = "userId,achievementId\nu1,first_race\nu2,first_race\nu1,first_race\nu3,no_such_badge\nu4,first_race\n,first_race\n"
+        request_data = {'csv': csv_rows}
+        request = MockRequest(method='POST', headers={'Authorization': 'Bearer admin_token'}, json_data=request_data)
+        with self.app.test_request_context(path=request.path, method=request.method, headers=request.headers, json=request_data):
+            mock_verify_token.return_value = self.mock_admin_token
+            mock_db = Mock()
+            mock_firestore_client.return_value = mock_db
+            catalog_doc = Mock()
+            catalog_doc.id = 'first_race'
+            catalog_doc.to_dict.return_value = {'name': 'First Race', 'points': 10}
+            mock_db.collection.return_value.stream.return_value = [catalog_doc]
+            held_doc = Mock()
+            held_doc.exists = True
+            held_doc.to_dict.return_value = {'userId': 'u4', 'achievementId': 'first_race'}
+            mock_db.get_all.side_effect = [[held_doc], []]
+
+            response = handleBulkAssignAchievements(request)
+
+            self.assertEqual(response.status_code, 200)
+            response_data = json.loads(response.data)
+            self.assertEqual(
+                [r['status'] for r in response_data['results']],
+                ['assigned', 'assigned', 'duplicate', 'unknown_achievement', 'already_held', 'invalid'],
+            )
+            self.assertEqual(response_data['summary']['assigned'], 2)
+            batch = mock_db.batch.return_value
+            self.assertEqual(batch.create.call_count, 2)
+            batch.commit.assert_called_once()
+            self.assertEqual(batch.create.call_args[0][1]['assignedBy'], 'admin_user_123')
+
+    @patch('main._refresh_leaderboard_snapshot')
+    @patch('main.auth.verify_id_token')
+    @patch('main.firestore.client')
+    def test_bulk_assign_reports_path_unsafe_ids(self, mock_firestore_client, mock_verify_token, mock_refresh):
+        """Test IDs with a slash are reported per row and the rest still apply."""
+        request_data = {'assignments': [
+            {'userId': 'u1', 'achievementId': 'first_race'},
+            {'userId': 'a/b', 'achievementId': 'first_race'},
+            {'userId': 'u2', 'achievementId': 'first/race'},
+            {'userId': '..', 'achievementId': 'first_race'},
+        ]}
+        request = MockRequest(method='POST', headers={'Authorization': 'Bearer admin_token'}, json_data=request_data)
+        with self.app.test_request_context(path=request.path, method=request.method, headers=request.headers, json=request_data):
+            mock_verify_token.return_value = self.mock_admin_token
+            mock_db = Mock()
+            mock_firestore_client.return_value = mock_db
+            catalog_doc = Mock()
+            catalog_doc.id = 'first_race'
+            catalog_doc.to_dict.return_value = {'name': 'First Race', 'points': 10}
+            mock_db.collection.return_value.stream.return_value = [catalog_doc]
+            mock_db.get_all.side_effect = [[], []]
+
+            response = handleBulkAssignAchievements(request)
+
+            self.assertEqual(response.status_code, 200)
+            response_data = json.loads(response.data)
+            self.assertEqual(
+                [r['status'] for r in response_data['results']],
+                ['assigned', 'invalid_id', 'invalid_id', 'invalid_id'],
+            )
+            batch = mock_db.batch.return_value
+            self.assertEqual(batch.create.call_count, 1)
+            self.assertEqual(batch.create.call_args[0][1]['userId'], 'u1')
+
+    @patch('main.auth.verify_id_token')
+    def test_bulk_assign_rejects_bad_csv(self, mock_verify_token):
+        """Test CSV without the required columns is rejected."""
+        request_data = {'csv': "user,badge\nu1,first_race\n"}
+        request = MockRequest(method='POST', headers={'Authorization': 'Bearer admin_token'}, json_data=request_data)
+        with self.app.test_request_context(path=request.path, method=request.method, headers=request.headers, json=request_data):
+            mock_verify_token.return_value = self.mock_admin_token
+            response = handleBulkAssignAchievements(request)
+            self.assertEqual(response.status_code, 400)
+
     @patch('main.auth.verify_id_token')
     def test_assign_achievement_forbidden(self, mock_verify_token):
         """Test achievement assignment by non-admin user."""
@@ -0,0 +1,2048 @@
+import unittest
+from unittest.mock import Mock, call, patch
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import sys
+from statistics import median
+from datetime import datetime, timedelta
+from flask import Flask
+
+# Add the functions_python directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'functions_python'))
+
+import main
+from main import (
+    handleAddRaceResult,
+    handleGetRaceAnalytics,
+    handleDriverComparison,
+    handleRebuildDriverRollups,
+    handleGetSeasonStandings,
+    handleCheckSeasonStandings,
+    handleGetTrackRecords,
+    handleRebuildTrackRecords,
+    handleGetLapAnalytics,
+    handleGetLapDelta,
+    handleImportRaceEvent,
+    handleExportRaceResults,
+    handleGetDriverRatings,
+    handleRebuildDriverRatings,
+    handlePredictRaceFinish,
+    handleTrainPredictionModel,
+    handleSimulateChampionship,
+    handlePointsSchemes,
+    handleRecomputeSeasonPoints,
+    handleGetDriverCareer,
+    _add_race_to_record_book,
+    _lap_time_analytics,
+    _lap_pace_summaries,
+    _empty_record_book,
+    _record_book_id,
+    _remove_race_from_record_book,
+    _driver_rollup_id,
+    _head_to_head,
+    _fold_race_into_rollup,
+    _histogram_median,
+    _rollup_analytics,
+    _elo_deltas,
+    _rating_event_key,
+    _fit_prediction_model,
+    _predict_field,
+    _simulate_championship,
+    _scheme_points,
+    _points_scheme_for,
+    _validate_points_scheme,
+    _driver_career,
+)
+
+
+class MockRequest:
+    """Mock Firebase Functions Request object."""
+    def __init__(self, method='GET', path='/api/race-analytics', headers=None, json_data=None, args=None, data=''):
+        self.method = method
+        self.path = path
+        self.headers = headers or {}
+        self.args = args or {}
+        self._json_data = json_data
+        self._data = data
+
+    def get_json(self, silent=True):
+        return self._json_data
+
+    def get_data(self, as_text=False):
+        return self._data
+
+
+def _race_doc(doc_id, **data):
+    doc = Mock()
+    doc.id = doc_id
+    doc.exists = True
+    doc.to_dict.side_effect = lambda: dict(data)
+    return doc
+
+
+def _change_event(before_data, after_data, race_id='race_1'):
+    event = Mock()
+    event.id = f'evt_{race_id}'
+    event.time = datetime(2025, 6, 1, 20, 0)
+    event.params = {'raceId': race_id}
+    for name, data in (('before', before_data), ('after', after_data)):
+        snapshot = Mock()
+        snapshot.exists = data is not None
+        snapshot.to_dict.return_value = data
+        setattr(event.data, name, snapshot)
+    return event
+
+
+def _missing_doc(doc_id='missing'):
+    doc = Mock()
+    doc.id = doc_id
+    doc.exists = False
+    return doc
+
+
+SAMPLE_RACES = [
+    {'driverId': 'jon', 'driverName': 'Jon', 'season': '2025', 'trackName': 'Dells',
+     'startPosition': 6, 'finishPosition': 2, 'fastestLap': 15.2, 'points': 40},
+    {'driverId': 'jon', 'driverName': 'Jon', 'season': '2025', 'trackName': 'Slinger',
+     'startPosition': 3, 'finishPosition': 5, 'fastestLap': 14.8, 'points': 30},
+    {'driverId': 'jon', 'driverName': 'Jon', 'season': '2025', 'trackName': 'Dells',
+     'finishPosition': 1, 'points': 50},
+    {'driverId': 'jon', 'driverName': 'Jon', 'season': '2025', 'trackName': 'Dells',
+     'startPosition': 4, 'finishPosition': 4, 'fastestLap': 15.0, 'points': 35},
+]
+
+
+class TestDriverRollups(unittest.TestCase):
+    """Test cases for the per-driver race rollups."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        context = self.app.test_request_context()
+        context.push()
+        self.addCleanup(context.pop)
+        self.admin_token = {'uid': 'admin_user_123', 'role': 'team-member'}
+
+    def _folded(self, races):
+        rollup = {}
+        for race in races:
+            _fold_race_into_rollup(rollup, race)
+        return rollup
+
+    def test_rollup_ids_cover_each_scope(self):
+        """Test rollup document IDs for every scope are distinct and ID-safe."""
+        ids = {
+            _driver_rollup_id('jon'),
+            _driver_rollup_id('jon', '2025'),
+            _driver_rollup_id('jon', None, 'Dells Raceway/Park'),
+            _driver_rollup_id('jon', '2025', 'Dells Raceway/Park'),
+        }
+        self.assertEqual(len(ids), 4)
+        self.assertTrue(all('/' not in doc_id for doc_id in ids))
+
+    def test_histogram_median_matches_statistics(self):
+        """Test the histogram median agrees with statistics.median."""
+        for values in ([3], [1, 2], [1, 2, 2, 7], [5, 1, 9, 1, 3]):
+            counts = {}
+            for value in values:
+                counts[str(value)] = counts.get(str(value), 0) + 1
+            self.assertEqual(_histogram_median(counts), median(values))
+        self.assertIsNone(_histogram_median({}))
+
+    def test_rollup_analytics_from_folded_races(self):
+        """Test rollup statistics match the per-race definitions."""
+        stats = _rollup_analytics(self._folded(SAMPLE_RACES))
+
+        self.assertEqual(stats['totalRaces'], 4)
+        self.assertEqual(stats['totalPoints'], 155)
+        self.assertEqual(stats['avgFinishPosition'], 3.0)
+        self.assertEqual(stats['medianFinishPosition'], 3.0)
+        self.assertEqual(stats['bestFinish'], 1)
+        self.assertEqual(stats['worstFinish'], 5)
+        self.assertEqual(stats['avgStartPosition'], 4.33)
+        # Only races with both positions count towards positions gained
+        self.assertEqual(stats['avgPositionsGained'], 0.67)
+        self.assertEqual(stats['fastestLapTime'], 14.8)
+        self.assertEqual(stats['avgLapTime'], 15.0)
+
+    @patch('main._get_points_schemes', return_value={})
+    @patch('main._increment_user_counters')
+    @patch('main.auth.verify_id_token')
+    @patch('main.firestore.client')
+    def test_add_race_result_leaves_rollups_to_trigger(self, mock_firestore_client, mock_verify_token, mock_counters, mock_schemes):
+        """Test adding a result writes only the result; the trigger maintains rollups."""
+        mock_verify_token.return_value = self.admin_token
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        result_ref = mock_db.collection.return_value.document.return_value
+        result_ref.id = 'race_1'
+
+        request = MockRequest(method='POST', headers={'Authorization': 'Bearer admin_token'}, json_data=dict(SAMPLE_RACES[0], raceDate='2025-06-01'))
+        response = handleAddRaceResult(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['id'], 'race_1')
+        result_ref.set.assert_called_once()
+        mock_db.batch.assert_not_called()
+        mock_counters.assert_called_once_with(
+            mock_db, 'jon', as_of=result_ref.set.return_value.update_time, racesEntered=1
+        )
+
+    def _rollup_transaction_db(self, stored):
+        """Mock db whose transaction reads the given {docId: rollup} documents."""
+        mock_db = Mock()
+        mock_db.collection.return_value.document.side_effect = lambda doc_id: Mock(id=doc_id)
+        transaction = mock_db.transaction.return_value
+        transaction.get_all.side_effect = lambda refs: [
+            _race_doc(ref.id, **stored[ref.id]) if ref.id in stored else _missing_doc(ref.id)
+            for ref in refs
+        ]
+        return mock_db, transaction
+
+    @patch('main.firestore.transactional', lambda fn: fn)
+    def test_rollup_changes_apply_correction_delta(self):
+        """Test a corrected result moves its contribution and skips unbuilt rollups."""
+        before = dict(SAMPLE_RACES[0], points=40, finishPosition=2)
+        after = dict(SAMPLE_RACES[0], points=45, finishPosition=1)
+        all_id = _driver_rollup_id('jon')
+        mock_db, transaction = self._rollup_transaction_db({all_id: self._folded(SAMPLE_RACES)})
+
+        main._apply_rollup_changes(mock_db, [(before, after)])
+
+        written = {c.args[0].id: c.args[1] for c in transaction.set.call_args_list}
+        # Only the built rollup is written; missing scopes are left for the read path
+        self.assertEqual(list(written), [all_id])
+        self.assertEqual(written[all_id]['races'], 4)
+        self.assertEqual(written[all_id]['pointsTotal'], 160)
+        self.assertEqual(written[all_id]['finishCounts'], {'1': 2, '5': 1, '4': 1})
+        self.assertEqual(written[all_id]['lapMin'], 14.8)
+
+    @patch('main.firestore.transactional', lambda fn: fn)
+    def test_lap_times_edit_ignores_stale_lap_pace(self):
+        """Test a direct lapTimes edit moves rollup lap sums to a fresh rebuild's."""
+        before = dict(SAMPLE_RACES[0], lapTimes=[15.0, 15.1, 15.2])
+        before['lapPace'] = main._race_lap_pace(before)
+        # lapTimes rewritten without touching the cached lapPace
+        after = dict(before, lapTimes=[15.0, 15.1, 30.0, 15.2])
+        all_id = _driver_rollup_id('jon')
+        mock_db, transaction = self._rollup_transaction_db({all_id: self._folded([before] + SAMPLE_RACES[1:])})
+
+        main._apply_rollup_changes(mock_db, [(before, after)])
+
+        written = transaction.set.call_args.args[1]
+        rebuilt = self._folded([dict(after, lapPace=None)] + SAMPLE_RACES[1:])
+        for field in ('raceLapCount', 'raceLapSum', 'greenLapCount', 'greenLapSum'):
+            self.assertAlmostEqual(written[field], rebuilt[field])
+        self.assertEqual(written['greenLapCount'], 3)
+
+    @patch('main._seed_driver_rollup')
+    @patch('main.firestore.transactional', lambda fn: fn)
+    def test_rollup_delete_rescans_lost_fastest_lap(self, mock_seed):
+        """Test deleting the result holding lapMin rescans that rollup instead."""
+        all_id = _driver_rollup_id('jon')
+        mock_db, transaction = self._rollup_transaction_db({all_id: self._folded(SAMPLE_RACES)})
+
+        main._apply_rollup_changes(mock_db, [(SAMPLE_RACES[1], None)])
+
+        transaction.set.assert_not_called()
+        mock_seed.assert_called_once()
+        self.assertEqual(mock_seed.call_args.args[1]['driverId'], 'jon')
+        self.assertTrue(mock_seed.call_args.kwargs['replace'])
+
+    @patch('main.firestore.transactional', lambda fn: fn)
+    def test_rollup_changes_skip_rollups_seeded_later(self):
+        """Test a rollup seeded after the write already counts it."""
+        all_id = _driver_rollup_id('jon')
+        seeded = dict(self._folded(SAMPLE_RACES), seededAt=datetime(2025, 6, 2))
+        mock_db, transaction = self._rollup_transaction_db({all_id: seeded})
+
+        main._apply_rollup_changes(mock_db, [(None, SAMPLE_RACES[0])], as_of=datetime(2025, 6, 1))
+        transaction.set.assert_not_called()
+
+        main._apply_rollup_changes(mock_db, [(None, SAMPLE_RACES[0])], as_of=datetime(2025, 6, 3))
+        self.assertEqual(transaction.set.call_args.args[1]['races'], 5)
+
+    @patch('main._rate_event')
+    @patch('main._update_track_records')
+    @patch('main._apply_standings_changes')
+    @patch('main._apply_rollup_changes')
+    @patch('main.firestore.client')
+    def test_trigger_applies_rollup_delta(self, mock_firestore_client, mock_rollups, *_):
+        """Test a corrected result reaches the rollups as a (before, after) pair."""
+        before = dict(SAMPLE_RACES[0])
+        after = dict(SAMPLE_RACES[0], points=45)
+        event = _change_event(before, after)
+
+        main.handleRaceResultWritten.__wrapped__(event)
+
+        mock_rollups.assert_called_once_with(
+            mock_firestore_client.return_value, [(before, after)], as_of=event.time, event_id=event.id
+        )
+
+    @patch('main.firestore.transactional', lambda fn: fn)
+    def test_seed_rollup_scans_in_transaction(self):
+        """Test a missing rollup is built from a transactional scan and stamped."""
+        mock_db = Mock()
+        transaction = mock_db.transaction.return_value
+        mock_db.collection.return_value.document.return_value.get.return_value = _missing_doc()
+        transaction.get.return_value = [_race_doc(f'r{i}', **race) for i, race in enumerate(SAMPLE_RACES)]
+
+        rollup = main._seed_driver_rollup(mock_db, {'driverId': 'jon', 'season': '2025', 'trackName': None})
+
+        self.assertEqual(rollup['races'], 4)
+        seeded = transaction.set.call_args.args[1]
+        self.assertEqual(seeded['pointsTotal'], 155)
+        self.assertIn('seededAt', seeded)
+
+    @patch('main.firestore.client')
+    def test_race_analytics_stats_only_is_one_read(self, mock_firestore_client):
+        """Test includeRaces=false answers from the rollup document alone."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        rollup_doc = _race_doc(_driver_rollup_id('jon', '2025'), **self._folded(SAMPLE_RACES))
+        mock_db.collection.return_value.document.return_value.get.return_value = rollup_doc
+
+        request = MockRequest(args={'driverId': 'jon', 'season': '2025', 'includeRaces': 'false'})
+        response = handleGetRaceAnalytics(request)
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)
+        self.assertEqual(data['totalRaces'], 4)
+        self.assertEqual(data['bestFinish'], 1)
+        self.assertNotIn('races', data)
+        mock_db.collection.return_value.where.assert_not_called()
+
+    @patch('main.firestore.client')
+    def test_race_analytics_falls_back_to_scan_without_rollup(self, mock_firestore_client):
+        """Test a missing rollup is computed from the scanned races."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        mock_db.collection.return_value.document.return_value.get.return_value = _missing_doc()
+        mock_db.collection.return_value.where.return_value.stream.return_value = [
+            _race_doc(f'race_{i}', **race) for i, race in enumerate(SAMPLE_RACES)
+        ]
+
+        response = handleGetRaceAnalytics(MockRequest(args={'driverId': 'jon'}))
+
+        data = json.loads(response.data)
+        self.assertEqual(data['totalPoints'], 155)
+        self.assertEqual(data['medianFinishPosition'], 3.0)
+        self.assertEqual(len(data['races']), 4)
+
+    @patch('main.firestore.client')
+    def test_race_analytics_projects_requested_fields(self, mock_firestore_client):
+        """Test fields= is pushed into the query as a select."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        query = mock_db.collection.return_value.where.return_value
+        query.select.return_value.stream.return_value = [
+            _race_doc('race_1', raceDate='2025-06-01', finishPosition=2),
+        ]
+
+        request = MockRequest(args={'driverId': 'jon', 'include': 'races', 'fields': 'raceDate,finishPosition'})
+        response = handleGetRaceAnalytics(request)
+
+        data = json.loads(response.data)
+        self.assertEqual(data, {'driverId': 'jon', 'races': [{'id': 'race_1', 'raceDate': '2025-06-01', 'finishPosition': 2}]})
+        query.select.assert_called_once_with(['raceDate', 'finishPosition'])
+        # Races only: the rollup is not read
+        mock_db.collection.return_value.document.assert_not_called()
+
+    @patch('main.firestore.client')
+    def test_race_analytics_fallback_fold_selects_its_inputs(self, mock_firestore_client):
+        """Test a summary without a rollup projects only the fields the fold needs."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        mock_db.collection.return_value.document.return_value.get.return_value = _missing_doc()
+        query = mock_db.collection.return_value.where.return_value
+        query.select.return_value.stream.return_value = [
+            _race_doc(f'race_{i}', **race) for i, race in enumerate(SAMPLE_RACES)
+        ]
+
+        response = handleGetRaceAnalytics(MockRequest(args={'driverId': 'jon', 'include': 'summary'}))
+
+        data = json.loads(response.data)
+        self.assertEqual(data['totalPoints'], 155)
+        self.assertNotIn('races', data)
+        self.assertEqual(query.select.call_args.args[0], main.ROLLUP_SOURCE_FIELDS)
+
+    def test_race_analytics_rejects_unknown_fields(self):
+        """Test unknown fields and include sections are rejected."""
+        response = handleGetRaceAnalytics(MockRequest(args={'driverId': 'jon', 'fields': 'raceDate,password'}))
+        self.assertEqual(response.status_code, 400)
+        response = handleGetRaceAnalytics(MockRequest(args={'driverId': 'jon', 'include': 'everything'}))
+        self.assertEqual(response.status_code, 400)
+
+    @patch('main.firestore.client')
+    def test_driver_comparison_reads_both_rollups_at_once(self, mock_firestore_client):
+        """Test driver comparison uses a single get_all over the rollups."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        other = self._folded([{'driverId': 'sam', 'driverName': 'Sam', 'finishPosition': 3, 'points': 200}])
+        mock_db.get_all.return_value = [
+            _race_doc(_driver_rollup_id('jon', '2025'), **self._folded(SAMPLE_RACES)),
+            _race_doc(_driver_rollup_id('sam', '2025'), **other),
+        ]
+
+        request = MockRequest(args={'driver1Id': 'jon', 'driver2Id': 'sam', 'season': '2025'})
+        response = handleDriverComparison(request)
+
+        data = json.loads(response.data)
+        self.assertEqual(data['driver1']['driverName'], 'Jon')
+        self.assertEqual(data['winner']['totalPoints'], 'sam')
+        self.assertEqual(data['winner']['bestFinish'], 'jon')
+        mock_db.get_all.assert_called_once()
+        mock_db.collection.return_value.where.assert_not_called()
+
+    def test_head_to_head_matrix(self):
+        """Test head-to-head counts only races both drivers finished."""
+        races = [
+            {'driverId': 'jon', 'raceDate': '2025-06-01', 'trackName': 'Dells', 'raceType': 'Feature', 'finishPosition': 2},
+            {'driverId': 'sam', 'raceDate': '2025-06-01', 'trackName': 'Dells', 'raceType': 'Feature', 'finishPosition': 5},
+            {'driverId': 'ava', 'raceDate': '2025-06-01', 'trackName': 'Dells', 'raceType': 'Feature', 'finishPosition': 1},
+            # Heat at the same event is a separate race
+            {'driverId': 'sam', 'raceDate': '2025-06-01', 'trackName': 'Dells', 'raceType': 'Heat', 'finishPosition': 1},
+            {'driverId': 'jon', 'raceDate': '2025-06-08', 'trackName': 'Slinger', 'raceType': 'Feature', 'finishPosition': 7},
+            {'driverId': 'sam', 'raceDate': '2025-06-08', 'trackName': 'Slinger', 'raceType': 'Feature', 'finishPosition': 3},
+        ]
+
+        matrix = _head_to_head(races, ['jon', 'sam', 'ava'])
+
+        self.assertEqual(matrix['jon']['sam'], {'races': 2, 'ahead': 1, 'behind': 1})
+        self.assertEqual(matrix['ava']['jon'], {'races': 1, 'ahead': 1, 'behind': 0})
+        self.assertEqual(matrix['jon']['ava'], {'races': 1, 'ahead': 0, 'behind': 1})
+        self.assertNotIn('ava', matrix['ava'])
+
+    @patch('main.firestore.client')
+    def test_driver_comparison_matrix_chunks_in_queries(self, mock_firestore_client):
+        """Test a large field is fetched with chunked in queries plus one rollup read."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        driver_ids = [f'd{i}' for i in range(main.FIRESTORE_IN_LIMIT + 5)]
+        mock_db.get_all.return_value = [
+            _race_doc(_driver_rollup_id(d), driverName=d.upper(), races=1, pointsTotal=i,
+                      finishCount=1, finishSum=i + 1, finishCounts={str(i + 1): 1})
+            for i, d in enumerate(driver_ids)
+        ]
+        rating = _race_doc('d3', driverId='d3', rating=1587.26)
+        rating.reference.parent.id = 'driver_ratings'
+        mock_db.get_all.return_value.append(rating)
+        mock_db.collection.return_value.where.return_value.select.return_value.stream.return_value = []
+
+        response = handleDriverComparison(MockRequest(args={'driverIds': ','.join(driver_ids)}))
+
+        data = json.loads(response.data)
+        self.assertEqual(len(data['drivers']), len(driver_ids))
+        self.assertEqual(data['leaders']['totalPoints'], driver_ids[-1])
+        self.assertEqual(data['leaders']['bestFinish'], 'd0')
+        self.assertEqual(data['leaders']['rating'], 'd3')
+        self.assertEqual(data['drivers'][3]['rating'], 1587.3)
+        self.assertIsNone(data['drivers'][0]['rating'])
+        in_filters = [c.args for c in mock_db.collection.return_value.where.call_args_list]
+        # Chunks are fetched concurrently, so their order is not fixed
+        self.assertEqual(sorted(len(args[2]) for args in in_filters), [5, main.FIRESTORE_IN_LIMIT])
+        self.assertTrue(all(args[1] == 'in' for args in in_filters))
+        mock_db.get_all.assert_called_once()
+
+    def test_driver_comparison_matrix_validates_ids(self):
+        """Test driverIds needs at least two distinct drivers."""
+        response = handleDriverComparison(MockRequest(args={'driverIds': 'jon,jon'}))
+        self.assertEqual(response.status_code, 400)
+
+    @patch('main.auth.verify_id_token')
+    @patch('main.firestore.client')
+    def test_rebuild_driver_rollups(self, mock_firestore_client, mock_verify_token):
+        """Test the rebuild rewrites every scope and deletes stale rollups."""
+        mock_verify_token.return_value = self.admin_token
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        stale = _race_doc('gone__all', driverId='gone')
+        mock_db.collection.return_value.stream.side_effect = [
+            [_race_doc(f'race_{i}', **race) for i, race in enumerate(SAMPLE_RACES)],
+            [stale],
+        ]
+
+        request = MockRequest(method='POST', headers={'Authorization': 'Bearer admin_token'}, json_data={})
+        response = handleRebuildDriverRollups(request)
+
+        data = json.loads(response.data)
+        self.assertEqual(data['racesScanned'], 4)
+        # all, season 2025, two tracks and two season/track pairs
+        self.assertEqual(data['rollupsWritten'], 6)
+        self.assertEqual(data['rollupsDeleted'], 1)
+        mock_db.batch.return_value.delete.assert_called_once_with(stale.reference)
+        # Stamped with the scan's start, so the trigger skips writes the scan counted
+        seeded = {c.args[1]['seededAt'] for c in mock_db.batch.return_value.set.call_args_list}
+        self.assertEqual(len(seeded), 1)
+        written = mock_db.batch.return_value.set.call_args.args[1]
+        self.assertTrue(main._seeded_after(written, seeded.pop() - timedelta(seconds=1)))
+
+    @patch('main.auth.verify_id_token')
+    def test_rebuild_driver_rollups_forbidden(self, mock_verify_token):
+        """Test non-admins cannot rebuild rollups."""
+        mock_verify_token.return_value = {'uid': 'fan', 'role': 'public-fan'}
+        request = MockRequest(method='POST', headers={'Authorization': 'Bearer token'}, json_data={})
+        response = handleRebuildDriverRollups(request)
+        self.assertEqual(response.status_code, 403)
+
+
+class TestSeasonStandings(unittest.TestCase):
+    """Test cases for the materialized season standings."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        context = self.app.test_request_context()
+        context.push()
+        self.addCleanup(context.pop)
+        self.admin_token = {'uid': 'admin_user_123', 'role': 'team-member'}
+        # Record books, rollups and ratings are covered separately
+        for target in ('main._update_track_records', 'main._apply_rollup_changes', 'main._rate_event'):
+            patcher = patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch('main.firestore.transactional', lambda fn: fn)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _trigger_db(self, mock_firestore_client, stored=None):
+        """Mock db holding the given {docId: data} documents, read through its transaction."""
+        stored = {'2025': {'season': '2025'}} if stored is None else stored
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        refs = {}
+
+        def _document(doc_id):
+            if doc_id not in refs:
+                refs[doc_id] = Mock(id=doc_id)
+                refs[doc_id].get.side_effect = lambda **_: (
+                    _race_doc(doc_id, **stored[doc_id]) if doc_id in stored else _missing_doc(doc_id)
+                )
+            return refs[doc_id]
+
+        mock_db.collection.return_value.document.side_effect = _document
+        mock_db.transaction.return_value.get_all.side_effect = lambda refs_: [r.get() for r in refs_]
+        return mock_db
+
+    def _standings_update(self, mock_db):
+        updates = [
+            c for c in mock_db.transaction.return_value.set.call_args_list if 'drivers' in c.args[1]
+        ]
+        self.assertEqual(len(updates), 1)
+        return updates[0]
+
+    @patch('main.firestore.client')
+    def test_trigger_adds_new_result(self, mock_firestore_client):
+        """Test a new result increments the driver's season totals."""
+        mock_db = self._trigger_db(mock_firestore_client)
+        race = {'driverId': 'jon', 'driverName': 'Jon', 'season': '2025', 'finishPosition': 1, 'points': 50}
+
+        main.handleRaceResultWritten.__wrapped__(_change_event(None, race))
+
+        update = self._standings_update(mock_db)
+        self.assertEqual(update.kwargs, {'merge': True})
+        entry = update.args[1]['drivers']['jon']
+        self.assertEqual(entry['totalPoints'].value, 50)
+        self.assertEqual(entry['wins'].value, 1)
+        self.assertEqual(entry['top5s'].value, 1)
+        self.assertEqual(entry['driverName'], 'Jon')
+        self.assertEqual(update.args[1]['version'].value, 1)
+
+    @patch('main.firestore.client')
+    def test_trigger_applies_correction_delta(self, mock_firestore_client):
+        """Test a corrected finish only moves the fields that changed."""
+        mock_db = self._trigger_db(mock_firestore_client)
+        before = {'driverId': 'jon', 'season': '2025', 'finishPosition': 1, 'points': 50}
+        after = dict(before, finishPosition=6, points=30)
+
+        main.handleRaceResultWritten.__wrapped__(_change_event(before, after))
+
+        entry = self._standings_update(mock_db).args[1]['drivers']['jon']
+        self.assertEqual(entry['totalPoints'].value, -20)
+        self.assertEqual(entry['wins'].value, -1)
+        self.assertEqual(entry['top5s'].value, -1)
+        self.assertNotIn('racesEntered', entry)
+
+    @patch('main.firestore.client')
+    def test_trigger_removes_deleted_result(self, mock_firestore_client):
+        """Test deleting a result takes it back out of the standings."""
+        mock_db = self._trigger_db(mock_firestore_client)
+        race = {'driverId': 'jon', 'season': 2025, 'finishPosition': 3, 'points': 40}
+
+        main.handleRaceResultWritten.__wrapped__(_change_event(race, None))
+
+        mock_db.collection.return_value.document.assert_any_call('2025')
+        entry = self._standings_update(mock_db).args[1]['drivers']['jon']
+        self.assertEqual(entry['racesEntered'].value, -1)
+        self.assertNotIn('driverName', entry)
+
+    @patch('main.firestore.client')
+    def test_trigger_ignores_redelivered_event(self, mock_firestore_client):
+        """Test an event already applied to the standings is not counted twice."""
+        race = {'driverId': 'jon', 'season': '2025', 'finishPosition': 1, 'points': 50}
+        event = _change_event(None, race)
+        mock_db = self._trigger_db(
+            mock_firestore_client, {'2025': {'season': '2025'}, event.id: {'standings': True}}
+        )
+
+        main.handleRaceResultWritten.__wrapped__(event)
+
+        self.assertEqual(mock_db.transaction.return_value.set.call_count, 0)
+
+    @patch('main.firestore.client')
+    def test_trigger_skips_unbuilt_or_newer_standings(self, mock_firestore_client):
+        """Test deltas never create partial standings or recount a newer seed."""
+        race = {'driverId': 'jon', 'season': '2025', 'finishPosition': 1, 'points': 50}
+        for stored in ({}, {'2025': {'season': '2025', 'seededAt': datetime(2025, 6, 2)}}):
+            mock_db = self._trigger_db(mock_firestore_client, stored)
+
+            main.handleRaceResultWritten.__wrapped__(_change_event(None, race))
+
+            written = [c.args[1] for c in mock_db.transaction.return_value.set.call_args_list]
+            self.assertEqual([w for w in written if 'drivers' in w], [])
+            # The event is still marked, with a TTL
+            self.assertIn('expireAt', written[0])
+
+    @patch('main.firestore.client')
+    def test_standings_seeded_on_first_read(self, mock_firestore_client):
+        """Test a season without standings is built from a scan and stored."""
+        mock_db = self._trigger_db(mock_firestore_client, {})
+        transaction = mock_db.transaction.return_value
+        transaction.get.return_value = [
+            _race_doc('r1', driverId='jon', driverName='Jon', finishPosition=1, points=50),
+            _race_doc('r2', driverId='sam', driverName='Sam', finishPosition=2, points=40),
+        ]
+
+        response = handleGetSeasonStandings(MockRequest(args={'season': '2025'}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['ETag'], '"2025-1"')
+        self.assertEqual([d['driverId'] for d in json.loads(response.data)['standings']], ['jon', 'sam'])
+        seeded = transaction.set.call_args.args[1]
+        self.assertEqual(seeded['drivers']['jon']['totalPoints'], 50)
+        self.assertIn('seededAt', seeded)
+
+    @patch('main.firestore.client')
+    def test_standings_served_with_etag(self, mock_firestore_client):
+        """Test standings come from the materialized document with an ETag."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        mock_db.collection.return_value.document.return_value.get.return_value = _race_doc(
+            '2025',
+            season='2025',
+            version=7,
+            drivers={
+                'jon': {'driverId': 'jon', 'totalPoints': 120, 'racesEntered': 3, 'wins': 1, 'top5s': 2},
+                'sam': {'driverId': 'sam', 'totalPoints': 150, 'racesEntered': 3, 'wins': 2, 'top5s': 3},
+                'gone': {'driverId': 'gone', 'totalPoints': 0, 'racesEntered': 0, 'wins': 0, 'top5s': 0},
+            },
+        )
+
+        response = handleGetSeasonStandings(MockRequest(args={'season': '2025'}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['ETag'], '"2025-7"')
+        standings = json.loads(response.data)['standings']
+        self.assertEqual([d['driverId'] for d in standings], ['sam', 'jon'])
+        self.assertEqual(standings[0]['position'], 1)
+        mock_db.collection.return_value.where.assert_not_called()
+
+        cached = handleGetSeasonStandings(MockRequest(args={'season': '2025'}, headers={'If-None-Match': '"2025-7"'}))
+        self.assertEqual(cached.status_code, 304)
+
+    @patch('main.auth.verify_id_token')
+    @patch('main.firestore.client')
+    def test_check_season_standings_reports_and_repairs(self, mock_firestore_client, mock_verify_token):
+        """Test the consistency checker diffs against a full recompute."""
+        mock_verify_token.return_value = self.admin_token
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        standings_ref = mock_db.collection.return_value.document.return_value
+        standings_ref.get.return_value = _race_doc(
+            '2025',
+            version=4,
+            drivers={'jon': {'driverId': 'jon', 'totalPoints': 90, 'racesEntered': 2, 'wins': 1, 'top5s': 2}},
+        )
+        mock_db.collection.return_value.where.return_value.stream.return_value = [
+            _race_doc(f'race_{i}', **race) for i, race in enumerate(SAMPLE_RACES)
+        ]
+
+        request = MockRequest(method='POST', headers={'Authorization': 'Bearer admin_token'}, json_data={'season': '2025', 'repair': True})
+        response = handleCheckSeasonStandings(request)
+
+        data = json.loads(response.data)
+        self.assertFalse(data['consistent'])
+        self.assertIn({'driverId': 'jon', 'field': 'totalPoints', 'stored': 90, 'expected': 155}, data['mismatches'])
+        self.assertTrue(data['repaired'])
+        written = standings_ref.set.call_args.args[0]
+        self.assertEqual(written['drivers']['jon']['racesEntered'], 4)
+        self.assertEqual(written['version'], 5)
+
+
+class TestTrackRecords(unittest.TestCase):
+    """Test cases for the track record book index."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        context = self.app.test_request_context()
+        context.push()
+        self.addCleanup(context.pop)
+        self.admin_token = {'uid': 'admin_user_123', 'role': 'team-member'}
+        self.races = [
+            ('r1', {'driverId': 'jon', 'driverName': 'Jon', 'raceDate': '2025-06-14', 'finishPosition': 1, 'fastestLap': 15.3}),
+            ('r2', {'driverId': 'sam', 'driverName': 'Sam', 'raceDate': '2025-05-03', 'finishPosition': 1, 'fastestLap': 15.1}),
+            ('r3', {'driverId': 'jon', 'driverName': 'Jon', 'raceDate': '2025-07-19', 'finishPosition': 1}),
+            ('r4', {'driverId': 'sam', 'driverName': 'Sam', 'raceDate': '2025-07-19', 'finishPosition': 2, 'fastestLap': 14.9}),
+        ]
+
+    def _book(self, races):
+        book = _empty_record_book({'trackName': 'Dells', 'season': None, 'raceType': None})
+        for race_id, race in races:
+            _add_race_to_record_book(book, race_id, race)
+        return book
+
+    def test_record_book_semantics(self):
+        """Test laps are ordered and first/latest wins follow raceDate, not insertion order."""
+        book = self._book(self.races)
+
+        self.assertEqual([e['raceId'] for e in book['fastestLaps']], ['r4', 'r2', 'r1'])
+        self.assertEqual(book['firstWin']['raceId'], 'r2')
+        self.assertEqual(book['latestWin']['raceId'], 'r3')
+        self.assertEqual(book['winsByDriver']['jon']['wins'], 2)
+        self.assertEqual(book['races'], 4)
+
+    def test_record_book_keeps_top_laps_only(self):
+        """Test only the fastest TRACK_RECORD_LAPS laps are stored."""
+        races = [(f'r{i}', {'driverId': 'jon', 'fastestLap': 20 - i * 0.1}) for i in range(main.TRACK_RECORD_LAPS + 3)]
+        book = self._book(races)
+        self.assertEqual(len(book['fastestLaps']), main.TRACK_RECORD_LAPS)
+        self.assertEqual(book['fastestLaps'][0]['raceId'], f'r{main.TRACK_RECORD_LAPS + 2}')
+
+        # Losing an entry from a full list needs a rescan to find the next lap
+        removed = races[-1]
+        self.assertTrue(_remove_race_from_record_book(book, removed[0], removed[1]))
+
+    def test_record_book_removal(self):
+        """Test removals that the book can absorb versus ones needing a rescan."""
+        book = self._book(self.races)
+        self.assertFalse(_remove_race_from_record_book(book, 'r4', dict(self.races[3][1])))
+        self.assertEqual([e['raceId'] for e in book['fastestLaps']], ['r2', 'r1'])
+
+        # The first win is gone but other wins remain
+        self.assertTrue(_remove_race_from_record_book(book, 'r2', dict(self.races[1][1])))
+        self.assertNotIn('sam', book['winsByDriver'])
+
+        single = self._book(self.races[:1])
+        self.assertFalse(_remove_race_from_record_book(single, 'r1', dict(self.races[0][1])))
+        self.assertIsNone(single['firstWin'])
+        self.assertEqual(single['races'], 0)
+
+    def test_record_book_correction_keeps_standing_holders(self):
+        """Test a corrected result re-added to a full book only rescans when it got worse."""
+        races = [(f'r{i}', {'driverId': 'jon', 'fastestLap': 15 + i * 0.1}) for i in range(main.TRACK_RECORD_LAPS + 2)]
+        book = self._book(races)
+        faster = dict(races[3][1], fastestLap=14.5)
+        self.assertFalse(_remove_race_from_record_book(book, 'r3', races[3][1], faster))
+        _add_race_to_record_book(book, 'r3', faster)
+        self.assertEqual(book['fastestLaps'][0]['raceId'], 'r3')
+
+        # Slower than every stored lap: an unstored lap may now rank ahead
+        slower = dict(races[3][1], fastestLap=16.5)
+        self.assertTrue(_remove_race_from_record_book(self._book(races), 'r3', races[3][1], slower))
+
+        # The first win moves to a later date while other wins remain
+        book = self._book(self.races)
+        later = dict(self.races[1][1], raceDate='2025-06-30')
+        self.assertTrue(_remove_race_from_record_book(book, 'r2', self.races[1][1], later))
+        book = self._book(self.races)
+        earlier = dict(self.races[1][1], raceDate='2025-04-01')
+        self.assertFalse(_remove_race_from_record_book(book, 'r2', self.races[1][1], earlier))
+        _add_race_to_record_book(book, 'r2', earlier)
+        self.assertEqual(book['firstWin']['raceDate'], '2025-04-01')
+
+    def test_unrelated_edit_skips_record_books(self):
+        """Test an edit that leaves a result's record entries unchanged reads no books."""
+        mock_db = Mock()
+        race = dict(self.races[0][1], season='2025', trackName='Dells', raceType='Feature')
+
+        applied = main._update_track_records(mock_db, [('r1', race, dict(race, notes='Loose in 3', points=12))])
+
+        self.assertTrue(applied)
+        mock_db.transaction.assert_not_called()
+        mock_db.collection.assert_not_called()
+
+    @patch('main.firestore.client')
+    def test_track_records_single_read(self, mock_firestore_client):
+        """Test records are served from one record book document."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        book = self._book(self.races)
+        mock_db.collection.return_value.document.return_value.get.return_value = _race_doc('book', **book)
+
+        response = handleGetTrackRecords(MockRequest(args={'trackName': 'Dells', 'limit': '2'}))
+
+        data = json.loads(response.data)
+        mock_db.collection.return_value.document.assert_called_with(_record_book_id('Dells'))
+        self.assertEqual(data['fastestLapRecord']['fastestLap'], 14.9)
+        self.assertEqual(len(data['fastestLaps']), 2)
+        self.assertEqual(data['bestFinishRecord']['raceDate'], '2025-05-03')
+        self.assertEqual(data['latestWin']['raceId'], 'r3')
+        self.assertEqual(data['winCounts'][0]['driverId'], 'jon')
+        self.assertEqual(data['totalRaces'], 4)
+        mock_db.collection.return_value.where.assert_not_called()
+
+    @patch('main.firestore.client')
+    def test_race_result_trigger_updates_track_records(self, mock_firestore_client):
+        """Test the race_results trigger passes each change to the record books."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        race = dict(self.races[0][1], season='2025', trackName='Dells')
+
+        with patch('main._update_track_records') as mock_update, patch('main._rate_event'), \
+                patch('main._apply_standings_changes'), patch('main._apply_rollup_changes'):
+            event = _change_event(None, race, race_id='r1')
+            main.handleRaceResultWritten.__wrapped__(event)
+            mock_update.assert_called_once_with(
+                mock_db, [('r1', None, race)], as_of=event.time, event_id=event.id
+            )
+
+    @patch('main._seed_record_book')
+    @patch('main.firestore.transactional', lambda fn: fn)
+    def test_track_record_updates_skip_unbuilt_books(self, mock_seed):
+        """Test only existing books take the change; missing ones wait for a read."""
+        race = dict(self.races[0][1], season='2025', trackName='Dells', raceType='Feature')
+        built_id = _record_book_id('Dells')
+        mock_db = Mock()
+        mock_db.collection.return_value.document.side_effect = lambda doc_id: Mock(id=doc_id)
+        transaction = mock_db.transaction.return_value
+        transaction.get_all.side_effect = lambda refs: [
+            _race_doc(ref.id, **self._book(self.races[1:2])) if ref.id == built_id else _missing_doc(ref.id)
+            for ref in refs
+        ]
+
+        main._update_track_records(mock_db, [('r1', None, race)])
+
+        written = {c.args[0].id: c.args[1] for c in transaction.set.call_args_list}
+        self.assertEqual(list(written), [built_id])
+        self.assertEqual(written[built_id]['races'], 2)
+        mock_seed.assert_not_called()
+
+    @patch('main.firestore.transactional', lambda fn: fn)
+    def test_track_records_seeded_on_first_read(self):
+        """Test a missing book is built from a transactional scan and stored."""
+        with patch('main.firestore.client') as mock_firestore_client:
+            mock_db = mock_firestore_client.return_value
+            mock_db.collection.return_value.document.return_value.get.return_value = _missing_doc()
+            transaction = mock_db.transaction.return_value
+            transaction.get.return_value = [_race_doc(race_id, **race) for race_id, race in self.races]
+
+            response = handleGetTrackRecords(MockRequest(args={'trackName': 'Dells'}))
+
+        self.assertEqual(json.loads(response.data)['totalRaces'], 4)
+        seeded = transaction.set.call_args.args[1]
+        self.assertEqual(seeded['races'], 4)
+        self.assertIn('seededAt', seeded)
+
+    @patch('main.auth.verify_id_token')
+    @patch('main.firestore.client')
+    def test_rebuild_track_records(self, mock_firestore_client, mock_verify_token):
+        """Test the rebuild writes all eight scopes per track/season/type."""
+        mock_verify_token.return_value = self.admin_token
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        mock_db.collection.return_value.stream.side_effect = [
+            [_race_doc(race_id, season='2025', trackName='Dells', raceType='Feature', **race) for race_id, race in self.races],
+            [],
+        ]
+
+        request = MockRequest(method='POST', headers={'Authorization': 'Bearer admin_token'}, json_data={})
+        response = handleRebuildTrackRecords(request)
+
+        data = json.loads(response.data)
+        self.assertEqual(data['racesScanned'], 4)
+        self.assertEqual(data['recordBooksWritten'], 8)
+        seeded = {c.args[1]['seededAt'] for c in mock_db.batch.return_value.set.call_args_list}
+        self.assertEqual(len(seeded), 1)
+        self.assertIsNotNone(seeded.pop().tzinfo)
+
+
+class TestLapAnalytics(unittest.TestCase):
+    """Test cases for the vectorized lap-time analytics."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        context = self.app.test_request_context()
+        context.push()
+        self.addCleanup(context.pop)
+
+    def test_per_race_statistics(self):
+        """Test per-race stats against hand-computed values on ragged lap lists."""
+        races = [
+            {'id': 'r1', 'lapTimes': [15.0, 15.2, 15.4, 15.6, 15.8, 16.0]},
+            {'id': 'r2', 'lapTimes': [14.9, 15.1, 'bad', 15.0]},
+            {'id': 'r3', 'lapTimes': []},
+        ]
+
+        analytics = _lap_time_analytics(races, window=3)
+
+        self.assertEqual([r['raceId'] for r in analytics['races']], ['r1', 'r2'])
+        r1, r2 = analytics['races']
+        self.assertEqual(r1['lapCount'], 6)
+        self.assertEqual(r1['meanLap'], 15.5)
+        self.assertEqual(r1['medianLap'], 15.5)
+        self.assertAlmostEqual(r1['degradationPerLap'], 0.2)
+        self.assertEqual(r1['bestRollingAvg'], 15.2)
+        self.assertEqual(r1['percentiles']['p10'], 15.1)
+        # The invalid lap is skipped but keeps its place in the stint
+        self.assertEqual(r2['lapCount'], 3)
+        self.assertEqual(r2['medianLap'], 15.0)
+        self.assertIsNone(r2['bestRollingAvg'])
+        self.assertEqual(analytics['overall']['lapCount'], 9)
+        self.assertEqual(analytics['overall']['bestLap'], 14.9)
+
+    def test_no_lap_data(self):
+        """Test races without lap times produce an empty result."""
+        analytics = _lap_time_analytics([{'id': 'r1'}, {'id': 'r2', 'lapTimes': [0, None]}])
+        self.assertEqual(analytics, {'overall': None, 'greenFlagOverall': None, 'races': []})
+
+    @patch('main.firestore.client')
+    def test_lap_analytics_endpoint(self, mock_firestore_client):
+        """Test the endpoint projects lapTimes and orders races by date."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        query = mock_db.collection.return_value.where.return_value
+        query.select.return_value.stream.return_value = [
+            _race_doc('late', raceDate='2025-08-01', lapTimes=[15.0, 15.1]),
+            _race_doc('early', raceDate='2025-06-01', lapTimes=[15.3, 15.2]),
+        ]
+
+        response = handleGetLapAnalytics(MockRequest(args={'driverId': 'jon', 'window': '2'}))
+
+        data = json.loads(response.data)
+        self.assertEqual(data['racesAnalyzed'], 2)
+        self.assertEqual([r['raceId'] for r in data['races']], ['early', 'late'])
+        self.assertEqual(data['races'][0]['bestRollingAvg'], 15.25)
+        query.select.assert_called_once_with(['lapTimes', 'lapPace', 'raceDate', 'trackName'])
+
+    def test_slow_laps_flagged(self):
+        """Test caution laps are flagged and excluded from green-flag sums."""
+        laps = [15.2, 15.1, 15.3, 24.8, 25.1, 15.2, 15.0, 15.4]
+        summary = _lap_pace_summaries([laps, [15.0, 15.0, 15.0, 15.5], []])
+
+        self.assertEqual(summary[0]['slowLaps'], [3, 4])
+        self.assertEqual(summary[0]['lapCount'], 8)
+        self.assertEqual(summary[0]['greenLapCount'], 6)
+        self.assertAlmostEqual(summary[0]['greenLapSum'], 91.2)
+        # Zero spread does not flag ordinary variation
+        self.assertEqual(summary[1]['slowLaps'], [])
+        self.assertIsNone(summary[2])
+
+    def test_green_flag_pace_uses_cached_flags(self):
+        """Test cached slowLaps are used as stored instead of being recomputed."""
+        cached = {'version': main.LAP_PACE_VERSION, 'slowLaps': [0], 'lapCount': 3,
+                  'lapSum': 45.0, 'greenLapCount': 2, 'greenLapSum': 30.0,
+                  'lapsHash': main._lap_times_digest([15.0, 15.0, 15.0])}
+        races = [{'id': 'r1', 'lapTimes': [15.0, 15.0, 15.0], 'lapPace': cached}]
+
+        with patch('main._slow_lap_mask') as mock_mask:
+            analytics = _lap_time_analytics(races)
+            mock_mask.assert_not_called()
+
+        race = analytics['races'][0]
+        self.assertEqual(race['slowLaps'], [0])
+        self.assertEqual(race['greenFlag']['lapCount'], 2)
+        self.assertEqual(analytics['greenFlagOverall']['lapCount'], 2)
+
+    def test_rollups_report_green_flag_pace(self):
+        """Test rollups carry raw and green-flag race-lap averages."""
+        rollup = _fold_race_into_rollup({}, {'driverId': 'jon', 'lapTimes': [15.0, 15.2, 25.0, 15.2]})
+        stats = _rollup_analytics(rollup)
+        self.assertEqual(stats['avgRaceLap'], 17.6)
+        self.assertEqual(stats['avgGreenFlagLap'], 15.13)
+
+    @patch('main._rate_event')
+    @patch('main._update_track_records')
+    @patch('main._apply_rollup_changes')
+    @patch('main._apply_standings_changes')
+    @patch('main.firestore.client')
+    def test_trigger_caches_lap_flags(self, mock_firestore_client, mock_standings, mock_rollups, mock_records, mock_rate):
+        """Test edited lapTimes are re-flagged once and the cache write is ignored."""
+        mock_firestore_client.return_value = Mock()
+        before = {'driverId': 'jon', 'season': '2025', 'lapTimes': [15.0, 15.1]}
+        after = dict(before, lapTimes=[15.0, 15.1, 30.0, 15.2])
+        event = _change_event(before, after)
+
+        main.handleRaceResultWritten.__wrapped__(event)
+
+        lap_pace = event.data.after.reference.update.call_args.args[0]['lapPace']
+        self.assertEqual(lap_pace['slowLaps'], [2])
+
+        mock_records.reset_mock()
+        cache_write = _change_event(after, dict(after, lapPace=lap_pace))
+        main.handleRaceResultWritten.__wrapped__(cache_write)
+        mock_records.assert_not_called()
+        cache_write.data.after.reference.update.assert_not_called()
+
+    def test_lap_analytics_requires_driver(self):
+        """Test driverId is required."""
+        response = handleGetLapAnalytics(MockRequest(args={}))
+        self.assertEqual(response.status_code, 400)
+
+
+class TestLapDelta(unittest.TestCase):
+    """Test cases for the lap-by-lap head-to-head deltas."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        context = self.app.test_request_context()
+        context.push()
+        self.addCleanup(context.pop)
+        main._lap_delta_cache.clear()
+        self.results = [
+            _race_doc('a', driverId='sam', driverName='Sam', finishPosition=2, lapTimes=[15.0, 15.2, 15.1]),
+            _race_doc('b', driverId='jon', driverName='Jon', finishPosition=1, lapTimes=[15.1, 15.0, 14.9, 15.0]),
+            _race_doc('c', driverId='ava', driverName='Ava', finishPosition=3, lapTimes=[]),
+        ]
+
+    def _query(self, mock_db):
+        return mock_db.collection.return_value.where.return_value.where.return_value.where.return_value.select.return_value
+
+    @patch('main.firestore.client')
+    def test_lap_delta_aligns_laps(self, mock_firestore_client):
+        """Test gaps are measured against the winner by default."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        self._query(mock_db).stream.return_value = self.results
+
+        response = handleGetLapDelta(MockRequest(args={'raceDate': '2024-06-01', 'trackName': 'Dells'}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('s-maxage', response.headers['Cache-Control'])
+        data = json.loads(response.data)
+        self.assertEqual(data['reference'], 'jon')
+        self.assertEqual(data['laps'], 4)
+        jon, sam = data['drivers']
+        self.assertEqual(jon['gapToReference'], [0.0, 0.0, 0.0, 0.0])
+        self.assertEqual(sam['lapDelta'], [-0.1, 0.2, 0.2, None])
+        self.assertEqual(sam['gapToReference'], [-0.1, 0.1, 0.3, None])
+        self.assertEqual(sam['cumulative'], [15.0, 30.2, 45.3, None])
+
+    @patch('main.firestore.client')
+    def test_lap_delta_cached(self, mock_firestore_client):
+        """Test repeated requests are served from the instance cache."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        self._query(mock_db).stream.return_value = self.results
+        args = {'raceDate': '2024-06-01', 'trackName': 'Dells', 'driverIds': 'sam,jon', 'reference': 'sam'}
+
+        first = handleGetLapDelta(MockRequest(args=args))
+        second = handleGetLapDelta(MockRequest(args=args))
+
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(json.loads(second.data)['drivers'][1]['gapToReference'][:3], [0.1, -0.1, -0.3])
+        self.assertEqual(self._query(mock_db).stream.call_count, 1)
+
+    @patch('main.time.time')
+    @patch('main.firestore.client')
+    def test_lap_delta_recent_race_short_ttl(self, mock_firestore_client, mock_time):
+        """Test a race from today is re-read after the short TTL, not after an hour."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        self._query(mock_db).stream.return_value = self.results
+        args = {'raceDate': datetime.utcnow().date().isoformat(), 'trackName': 'Dells'}
+
+        mock_time.return_value = 1000.0
+        response = handleGetLapDelta(MockRequest(args=args))
+        self.assertEqual(response.headers['Cache-Control'], main.LAP_DELTA_RECENT_CACHE_CONTROL)
+        mock_time.return_value = 1000.0 + main.LAP_DELTA_RECENT_CACHE_TTL_SECONDS + 1
+        handleGetLapDelta(MockRequest(args=args))
+
+        self.assertEqual(self._query(mock_db).stream.call_count, 2)
+
+    @patch('main.firestore.client')
+    def test_lap_delta_missing_driver(self, mock_firestore_client):
+        """Test requested drivers without lap times are reported."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        self._query(mock_db).stream.return_value = self.results
+
+        response = handleGetLapDelta(MockRequest(args={'raceDate': '2024-06-01', 'trackName': 'Dells', 'driverIds': 'jon,ava'}))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.data)['driverIds'], ['ava'])
+
+    def test_lap_delta_requires_race(self):
+        """Test raceDate and trackName are required."""
+        response = handleGetLapDelta(MockRequest(args={'raceDate': '2024-06-01'}))
+        self.assertEqual(response.status_code, 400)
+
+
+class TestRaceEventImport(unittest.TestCase):
+    """Test cases for the bulk race-event import."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        context = self.app.test_request_context()
+        context.push()
+        self.addCleanup(context.pop)
+        self.admin_token = {'uid': 'admin_user_123', 'role': 'team-member'}
+        self.event = {'raceDate': '2025-06-01', 'trackName': 'Dells', 'season': '2025'}
+        patches = {
+            'verify': patch('main.auth.verify_id_token', return_value=self.admin_token),
+            'client': patch('main.firestore.client'),
+            'standings': patch('main._apply_standings_changes'),
+            'records': patch('main._update_track_records'),
+            'rollups': patch('main._apply_rollup_changes'),
+            'counters': patch('main._increment_user_counters'),
+            'ratings': patch('main._rate_event'),
+            'schemes': patch('main._get_points_schemes', return_value={}),
+        }
+        self.mocks = {}
+        for name, patcher in patches.items():
+            self.mocks[name] = patcher.start()
+            self.addCleanup(patcher.stop)
+        self.db = Mock()
+        self.mocks['client'].return_value = self.db
+        self.db.collection.return_value.document.return_value.id = 'doc_1'
+        self.existing_query = self.db.collection.return_value.where.return_value.where.return_value.select.return_value
+        self.existing_query.stream.return_value = []
+        self.commit_time = datetime(2025, 6, 1, 20, 0)
+        self.db.batch.return_value.commit.return_value = [Mock(update_time=self.commit_time)]
+
+    def _post(self, json_data=None, args=None, data=''):
+        request = MockRequest(method='POST', headers={'Authorization': 'Bearer admin_token'},
+                              json_data=json_data, args=args, data=data)
+        return handleImportRaceEvent(request)
+
+    def test_import_json_event(self):
+        """Test a sheet is written in one batch and downstream views update once."""
+        results = [
+            {'driverId': 'jon', 'driverName': 'Jon', 'raceType': 'Heat', 'finishPosition': 1, 'lapTimes': [15.2, 15.1]},
+            {'driverId': 'jon', 'driverName': 'Jon', 'finishPosition': 2, 'startPosition': 5, 'points': 40},
+            {'driverId': 'sam', 'driverName': 'Sam', 'finishPosition': 1, 'points': 50},
+        ]
+
+        response = self._post({'event': self.event, 'results': results})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['imported'], 3)
+        batch = self.db.batch.return_value
+        batch.commit.assert_called_once()
+        written = [c.args[1] for c in batch.set.call_args_list if not c.kwargs]
+        self.assertEqual(len(written), 3)
+        self.assertEqual(written[0]['fastestLap'], 15.1)
+        self.assertEqual(written[1]['raceType'], 'Feature')
+        self.assertTrue(all(race['importId'] for race in written))
+        # Rollups are updated once for the sheet, as of the results' commit
+        self.mocks['rollups'].assert_called_once()
+        self.assertEqual(len(self.mocks['rollups'].call_args.args[1]), 3)
+        self.assertEqual(
+            self.mocks['rollups'].call_args.kwargs, {'as_of': self.commit_time, 'event_id': 'import-doc_1'}
+        )
+        # Logged as pending before the results, applied after the views
+        import_ref = self.db.collection.return_value.document.return_value
+        self.assertEqual(import_ref.set.call_args_list[0].args[0]['status'], 'pending')
+        self.assertEqual(import_ref.update.call_args.args[0]['status'], 'applied')
+        self.mocks['standings'].assert_called_once()
+        self.assertEqual(len(self.mocks['standings'].call_args.args[1]), 3)
+        self.mocks['records'].assert_called_once()
+        self.mocks['counters'].assert_any_call(self.db, 'jon', as_of=self.commit_time, racesEntered=2)
+        self.db.collection.assert_any_call('driver_careers')
+        # One re-rating per race in the sheet (heat and feature)
+        self.assertEqual(self.mocks['ratings'].call_count, 2)
+
+    def test_import_csv_with_event_args(self):
+        """Test a raw CSV body with event fields in the query string."""
+        sheet = (
+            'driverId,driverName,finishPosition,startPosition,lapTimes,incidents\n'
+            'jon,Jon,1,3,15.2;15.0;15.1,\n'
+            'sam,Sam,2,1,,Spin lap 4;Contact lap 9\n'
+        )
+
+        response = self._post(args=self.event, data=sheet)
+
+        self.assertEqual(response.status_code, 200)
+        written = [c.args[1] for c in self.db.batch.return_value.set.call_args_list if not c.kwargs]
+        self.assertEqual(written[0]['lapTimes'], [15.2, 15.0, 15.1])
+        self.assertEqual(written[0]['finishPosition'], 1)
+        self.assertEqual(written[0]['season'], '2025')
+        self.assertEqual(written[1]['incidents'], ['Spin lap 4', 'Contact lap 9'])
+        self.assertIsNone(written[1]['fastestLap'])
+
+    def test_import_stores_numeric_ids_as_strings(self):
+        """Test a numeric season, driverId or car number is stored as the string readers query."""
+        event = dict(self.event, season=2024)
+        results = [{'driverId': 42, 'driverName': 'Jon', 'carNumber': 8, 'finishPosition': 1}]
+
+        response = self._post({'event': event, 'results': results})
+
+        self.assertEqual(response.status_code, 200)
+        written = [c.args[1] for c in self.db.batch.return_value.set.call_args_list if not c.kwargs][0]
+        self.assertEqual((written['season'], written['driverId'], written['carNumber']), ('2024', '42', '8'))
+        self.mocks['counters'].assert_called_once_with(self.db, '42', as_of=self.commit_time, racesEntered=1)
+
+    def test_import_rejects_invalid_rows(self):
+        """Test every row is validated and nothing is written on failure."""
+        results = [
+            {'driverId': 'jon', 'driverName': 'Jon', 'finishPosition': 'first'},
+            {'driverName': 'Nobody', 'lapTimes': [15.0, -1]},
+            {'driverId': 'sam', 'driverName': 'Sam'},
+            {'driverId': 'sam', 'driverName': 'Sam'},
+        ]
+
+        response = self._post({'event': self.event, 'results': results})
+
+        self.assertEqual(response.status_code, 400)
+        errors = {e['row']: e['errors'] for e in json.loads(response.data)['errors']}
+        self.assertEqual(errors[1], ['finishPosition must be a positive integer'])
+        self.assertIn('driverId is required', errors[2])
+        self.assertIn('lapTimes must be positive numbers', errors[2])
+        self.assertEqual(errors[4], ['duplicate of row 3'])
+        self.db.batch.assert_not_called()
+
+    def test_import_rejects_recorded_results(self):
+        """Test re-importing an event conflicts instead of duplicating results."""
+        self.existing_query.stream.return_value = [_race_doc('old', driverId='jon', raceType='Feature')]
+
+        response = self._post({'event': self.event, 'results': [{'driverId': 'jon', 'driverName': 'Jon'}]})
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.data)['conflicts'], [{'row': 1, 'driverId': 'jon', 'raceType': 'Feature'}])
+        self.db.batch.assert_not_called()
+
+    def test_import_left_pending_when_views_fail(self):
+        """Test a failed derived step reports 503 and leaves the import resumable."""
+        self.mocks['rollups'].return_value = False
+
+        response = self._post({'event': self.event, 'results': [{'driverId': 'jon', 'driverName': 'Jon'}]})
+
+        self.assertEqual(response.status_code, 503)
+        import_ref = self.db.collection.return_value.document.return_value
+        statuses = [c.args[0].get('status') for c in import_ref.update.call_args_list]
+        self.assertNotIn('applied', statuses)
+        self.mocks['counters'].assert_not_called()
+
+    def test_resend_resumes_pending_import(self):
+        """Test re-sending a sheet whose import is pending resumes it instead of conflicting."""
+        self.existing_query.stream.return_value = [
+            _race_doc('r1', driverId='jon', raceType='Feature', importId='imp1'),
+        ]
+        import_ref = self.db.collection.return_value.document.return_value
+        import_ref.id = 'imp1'
+        import_ref.get.return_value = _race_doc(
+            'imp1', status='pending', resultIds=['r1'], committedAt=self.commit_time
+        )
+        self.db.get_all.return_value = [
+            _race_doc('r1', driverId='jon', season='2025', raceDate='2025-06-01', trackName='Dells', importId='imp1'),
+        ]
+
+        response = self._post({'event': self.event, 'results': [{'driverId': 'jon', 'driverName': 'Jon'}]})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['importId'], 'imp1')
+        self.db.batch.assert_not_called()
+        self.assertEqual(self.mocks['standings'].call_args.kwargs, {'as_of': self.commit_time, 'event_id': 'import-imp1'})
+        self.assertEqual(import_ref.update.call_args.args[0]['status'], 'applied')
+
+    def test_trigger_skips_imported_creates(self):
+        """Test the per-document trigger leaves imported results to the import."""
+        race = {'driverId': 'jon', 'season': '2025', 'importId': 'imp1'}
+
+        main.handleRaceResultWritten.__wrapped__(_change_event(None, race))
+        self.mocks['standings'].assert_not_called()
+
+        # Later corrections to an imported result flow through the trigger
+        main.handleRaceResultWritten.__wrapped__(_change_event(race, dict(race, points=10)))
+        self.mocks['standings'].assert_called_once()
+
+
+class TestRaceResultsExport(unittest.TestCase):
+    """Test cases for the streaming race_results export."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        context = self.app.test_request_context()
+        context.push()
+        self.addCleanup(context.pop)
+        verify = patch('main.auth.verify_id_token', return_value={'uid': 'admin_user_123', 'role': 'team-member'})
+        verify.start()
+        self.addCleanup(verify.stop)
+
+    def _export(self, mock_db, pages, args):
+        query = mock_db.collection.return_value.where.return_value.select.return_value.order_by.return_value.limit.return_value
+        query.stream.side_effect = [pages[0]]
+        query.start_after.return_value.stream.side_effect = pages[1:]
+        request = MockRequest(headers={'Authorization': 'Bearer admin_token'}, args=args)
+        return handleExportRaceResults(request), query
+
+    @patch('main.firestore.client')
+    def test_export_ndjson_pages(self, mock_firestore_client):
+        """Test results stream across pages as one JSON object per line."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        first_page = [_race_doc(f'r{i}', driverId='jon', season='2025', incidents=['spin']) for i in range(main.EXPORT_PAGE_SIZE)]
+        second_page = [_race_doc('last', driverId='sam', season='2025')]
+
+        with patch('main.EXPORT_PAGE_SIZE', len(first_page)):
+            response, query = self._export(mock_db, [first_page, second_page], {'season': '2025'})
+            # Nothing is read until the body is consumed
+            query.stream.assert_not_called()
+            lines = response.get_data(as_text=True).splitlines()
+
+        self.assertEqual(response.headers['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(len(lines), len(first_page) + 1)
+        self.assertEqual(json.loads(lines[0])['incidents'], 'spin')
+        self.assertEqual(json.loads(lines[-1])['id'], 'last')
+        query.start_after.assert_called_once_with({'__name__': first_page[-1].id})
+
+    @patch('main.firestore.client')
+    def test_export_laps_csv_long_format(self, mock_firestore_client):
+        """Test lapTimes are flattened to one CSV row per lap."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        race = _race_doc('r1', driverId='jon', season='2025', raceDate='2025-06-01', trackName='Dells',
+                         raceType='Feature', lapTimes=[15.2, 24.0, 15.1], lapPace={'slowLaps': [1]})
+
+        response, _ = self._export(mock_db, [[race]], {'season': '2025', 'format': 'csv', 'table': 'laps'})
+
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual(lines[0], ','.join(main.EXPORT_LAP_COLUMNS))
+        self.assertEqual(lines[2], 'r1,jon,2025,2025-06-01,Dells,Feature,2,24.0,True')
+        self.assertEqual(len(lines), 4)
+        self.assertIn('race_laps_2025.csv', response.headers['Content-Disposition'])
+
+    @patch('main.sentry_sdk.capture_exception')
+    @patch('main.firestore.client')
+    def test_export_failure_ends_with_error_record(self, mock_firestore_client, mock_capture):
+        """Test a mid-stream failure is reported and marked at the end of the body."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        first_page = [_race_doc(f'r{i}', driverId='jon', season='2025') for i in range(2)]
+
+        for export_format in ('ndjson', 'csv'):
+            with patch('main.EXPORT_PAGE_SIZE', len(first_page)):
+                response, _ = self._export(
+                    mock_db, [first_page, RuntimeError('deadline exceeded')],
+                    {'season': '2025', 'format': export_format},
+                )
+                lines = response.get_data(as_text=True).splitlines()
+
+            if export_format == 'ndjson':
+                self.assertEqual(len(lines), 3)
+                self.assertIn('deadline exceeded', json.loads(lines[-1])['error'])
+            else:
+                self.assertEqual(len(lines), 4)
+                self.assertTrue(lines[-1].startswith('# error:'))
+        self.assertEqual(mock_capture.call_count, 2)
+
+    def test_export_validates_format(self):
+        """Test unknown formats and tables are rejected."""
+        request = MockRequest(headers={'Authorization': 'Bearer admin_token'}, args={'format': 'xml'})
+        self.assertEqual(handleExportRaceResults(request).status_code, 400)
+        request = MockRequest(headers={'Authorization': 'Bearer admin_token'}, args={'table': 'pits'})
+        self.assertEqual(handleExportRaceResults(request).status_code, 400)
+
+
+class TestDriverRatings(unittest.TestCase):
+    """Test cases for the multi-driver Elo ratings."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        context = self.app.test_request_context()
+        context.push()
+        self.addCleanup(context.pop)
+        self.admin_token = {'uid': 'admin_user_123', 'role': 'team-member'}
+
+    def test_elo_deltas_reward_beating_stronger_drivers(self):
+        """Test upsets move ratings more and the field stays zero-sum."""
+        even = _elo_deltas([1500, 1500, 1500], [1, 2, 3])
+        self.assertAlmostEqual(even[0], 16.0)
+        self.assertAlmostEqual(even[1], 0.0)
+        self.assertAlmostEqual(sum(even), 0.0)
+
+        upset = _elo_deltas([1400, 1600], [1, 2])
+        favourite = _elo_deltas([1600, 1400], [1, 2])
+        self.assertGreater(upset[0], favourite[0])
+        self.assertEqual(list(_elo_deltas([1500], [1])), [0.0])
+
+    def test_event_key_groups_one_race(self):
+        """Test results of the same race share a rating event."""
+        race = {'raceDate': '2025-06-01', 'trackName': 'Dells Raceway', 'raceType': 'Feature'}
+        self.assertEqual(_rating_event_key(race), _rating_event_key(dict(race, driverId='sam')))
+        self.assertNotEqual(_rating_event_key(race), _rating_event_key(dict(race, raceType='Heat')))
+
+    @patch('main._update_track_records')
+    @patch('main._apply_standings_changes')
+    @patch('main._rate_event')
+    @patch('main.firestore.client')
+    def test_trigger_rerates_old_and_new_race(self, mock_firestore_client, mock_rate, *_):
+        """Test moving a result re-rates both races, and unrelated edits none."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        before = {'driverId': 'jon', 'season': '2025', 'raceDate': '2025-06-01', 'trackName': 'Dells',
+                  'raceType': 'Feature', 'finishPosition': 2}
+
+        main.handleRaceResultWritten.__wrapped__(_change_event(before, dict(before, raceType='Heat')))
+        self.assertEqual(mock_rate.call_count, 2)
+
+        mock_rate.reset_mock()
+        main.handleRaceResultWritten.__wrapped__(_change_event(before, dict(before, points=40)))
+        mock_rate.assert_not_called()
+
+    @patch('main.firestore.transactional', lambda fn: fn)
+    def test_rate_event_reads_finishes_in_transaction(self):
+        """Test the race's results are read through the transaction, so retries re-read them."""
+        mock_db = Mock()
+        transaction = mock_db.transaction.return_value
+        race = {'raceDate': '2025-06-01', 'trackName': 'Dells', 'raceType': 'Feature'}
+        query = mock_db.collection.return_value.where.return_value.where.return_value.where.return_value.select.return_value
+        transaction.get.return_value = [
+            _race_doc('a', driverId='jon', finishPosition=1, **race),
+            _race_doc('b', driverId='sam', finishPosition=2, **race),
+        ]
+        mock_db.collection.return_value.document.return_value.get.return_value = _missing_doc('event')
+        transaction.get_all.return_value = []
+
+        self.assertTrue(main._rate_event(mock_db, dict(race, driverId='jon')))
+
+        transaction.get.assert_called_once_with(query)
+        query.stream.assert_not_called()
+        event = [c.args[1] for c in transaction.set.call_args_list if 'participants' in c.args[1]][0]
+        self.assertEqual(sorted(event['participants']), ['jon', 'sam'])
+
+    @patch('main.auth.verify_id_token')
+    @patch('main.firestore.client')
+    def test_rebuild_replays_races_in_order(self, mock_firestore_client, mock_verify_token):
+        """Test the rebuild streams results once and carries ratings forward."""
+        mock_verify_token.return_value = self.admin_token
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        race = {'season': '2025', 'trackName': 'Dells', 'raceType': 'Feature'}
+        mock_db.collection.return_value.order_by.return_value.select.return_value.stream.return_value = [
+            _race_doc('a', driverId='jon', driverName='Jon', finishPosition=1, raceDate='2025-06-01', **race),
+            _race_doc('b', driverId='sam', driverName='Sam', finishPosition=2, raceDate='2025-06-01', **race),
+            _race_doc('c', driverId='jon', driverName='Jon', finishPosition=2, raceDate='2025-06-08', **race),
+            _race_doc('d', driverId='sam', driverName='Sam', finishPosition=1, raceDate='2025-06-08', **race),
+        ]
+        mock_db.collection.return_value.select.return_value.stream.return_value = [_race_doc('old_event')]
+        mock_db.collection.return_value.stream.return_value = [_race_doc('gone')]
+        history = [_race_doc(f'h{i}') for i in range(3)]
+        for doc, parent in zip(history, ('driver_ratings', 'driver_ratings', 'seasons')):
+            doc.reference.parent.parent.parent.id = parent
+        mock_db.collection_group.return_value.select.return_value.stream.return_value = history
+
+        request = MockRequest(method='POST', headers={'Authorization': 'Bearer admin_token'}, json_data={})
+        response = handleRebuildDriverRatings(request)
+
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['resultsScanned'], 4)
+        self.assertEqual(data['eventsRated'], 2)
+        self.assertEqual(data['eventsRemoved'], 1)
+        batch = mock_db.batch.return_value
+        ratings = {c.args[1]['driverId']: c.args[1] for c in batch.set.call_args_list if 'rating' in c.args[1]}
+        self.assertEqual(ratings['jon']['events'], 2)
+        # Sam's win came against a higher-rated Jon, so it outweighs the loss
+        self.assertGreater(ratings['sam']['rating'], main.RATING_DEFAULT)
+        self.assertAlmostEqual(ratings['jon']['rating'] + ratings['sam']['rating'], 2 * main.RATING_DEFAULT)
+        # Both driver histories are cleared up front, then the stale event and rating
+        mock_db.collection_group.assert_called_once_with('history')
+        self.assertEqual(data['historyDeleted'], 2)
+        deleted = [c.args[0] for c in batch.delete.call_args_list]
+        self.assertEqual(deleted[:2], [history[0].reference, history[1].reference])
+        self.assertEqual(batch.delete.call_count, 4)
+
+    @patch('main.firestore.client')
+    def test_get_driver_rating_with_history(self, mock_firestore_client):
+        """Test a driver's rating and history come from the rating documents."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        rating_ref = mock_db.collection.return_value.document.return_value
+        rating_ref.get.return_value = _race_doc('jon', driverId='jon', driverName='Jon', rating=1516.04, events=1)
+        rating_ref.collection.return_value.order_by.return_value.limit.return_value.stream.return_value = [
+            _race_doc('e1', raceDate='2025-06-01', ratingBefore=1500.0, ratingAfter=1516.04, delta=16.04),
+        ]
+
+        response = handleGetDriverRatings(MockRequest(args={'driverId': 'jon'}))
+
+        data = json.loads(response.data)
+        self.assertEqual(data['rating'], 1516.0)
+        self.assertEqual(data['history'][0]['delta'], 16.0)
+        mock_db.collection.return_value.where.assert_not_called()
+
+
+class TestRacePredictions(unittest.TestCase):
+    """Test cases for the precomputed finish-prediction model."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        context = self.app.test_request_context()
+        context.push()
+        self.addCleanup(context.pop)
+        self.admin_token = {'uid': 'admin_user_123', 'role': 'team-member'}
+        main._prediction_model_cache.update(model=None, loadedAt=0.0)
+        self.addCleanup(main._prediction_model_cache.update, model=None, loadedAt=0.0)
+        self.model = {
+            'features': list(main.PREDICTION_FEATURES),
+            'coefficients': [0.0, 0.8, 0.15, 0.05],
+            'samples': 120,
+            'rmse': 0.21,
+        }
+
+    def test_fit_recovers_coefficients(self):
+        """Test the ridge fit recovers a noiseless linear relationship."""
+        rows = [[1.0, a / 30, b / 30, (a + b) % 30 / 30] for a in range(30) for b in range(30)]
+        targets = [0.1 + 0.5 * r[1] + 0.3 * r[2] for r in rows]
+        coefficients, rmse = _fit_prediction_model(rows, targets)
+        self.assertAlmostEqual(coefficients[1], 0.5, places=1)
+        self.assertLess(rmse, 0.02)
+
+    def test_predict_field_orders_drivers(self):
+        """Test form and track history can move a driver ahead of the grid."""
+        features = {
+            'fast': {'driverName': 'Fast', 'recentFinishPcts': [0.0, 0.0], 'tracks': {'dells': {'count': 3, 'sum': 0.0}}},
+            'slow': {'driverName': 'Slow', 'recentFinishPcts': [1.0], 'tracks': {}},
+        }
+        field = [{'driverId': 'slow', 'startPosition': 1}, {'driverId': 'fast', 'startPosition': 2},
+                 {'driverId': 'new', 'startPosition': 3}]
+
+        predictions = _predict_field(self.model, field, features, 'dells')
+
+        self.assertEqual([p['driverId'] for p in predictions], ['slow', 'fast', 'new'])
+        self.assertEqual(predictions[1]['trackRaces'], 3)
+        self.assertEqual(predictions[2]['recentForm'], 0.5)
+        boosted = dict(self.model, coefficients=[0.0, 0.2, 0.8, 0.0])
+        self.assertEqual(_predict_field(boosted, field, features, 'dells')[0]['driverId'], 'fast')
+
+    @patch('main.firestore.client')
+    def test_prediction_reads_model_once(self, mock_firestore_client):
+        """Test the model is cached and the field is one batched read."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        mock_db.collection.return_value.document.return_value.get.return_value = _race_doc('finish', **self.model)
+        mock_db.get_all.return_value = [_race_doc('jon', driverName='Jon', recentFinishPcts=[0.0])]
+        request = MockRequest(args={'trackName': 'Dells', 'driverIds': 'sam,jon'})
+
+        handlePredictRaceFinish(request)
+        response = handlePredictRaceFinish(request)
+
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['predictions'][0]['driverId'], 'sam')
+        self.assertEqual(data['model']['samples'], 120)
+        mock_db.collection.return_value.document.return_value.get.assert_called_once()
+        self.assertEqual(mock_db.get_all.call_count, 2)
+        mock_db.collection.return_value.where.assert_not_called()
+        mock_db.collection.return_value.stream.assert_not_called()
+
+    @patch('main.firestore.client')
+    def test_prediction_requires_trained_model(self, mock_firestore_client):
+        """Test a missing model is reported instead of guessing."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        mock_db.collection.return_value.document.return_value.get.return_value = _missing_doc('finish')
+
+        response = handlePredictRaceFinish(MockRequest(args={'trackName': 'Dells', 'driverIds': 'sam,jon'}))
+
+        self.assertEqual(response.status_code, 404)
+
+    @patch('main.auth.verify_id_token')
+    @patch('main.firestore.client')
+    def test_train_uses_only_earlier_races(self, mock_firestore_client, mock_verify_token):
+        """Test training rows see form from earlier race days and features are stored."""
+        mock_verify_token.return_value = self.admin_token
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        docs = []
+        for week in range(12):
+            date = f'2025-06-{week + 1:02d}'
+            for position, driver in enumerate(['jon', 'sam', 'ava'], start=1):
+                docs.append(_race_doc(f'{date}-{driver}', driverId=driver, driverName=driver.title(),
+                                      raceDate=date, trackName='Dells', raceType='Feature',
+                                      startPosition=4 - position, finishPosition=position))
+        mock_db.collection.return_value.order_by.return_value.select.return_value.stream.return_value = docs
+
+        request = MockRequest(method='POST', headers={'Authorization': 'Bearer admin_token'}, json_data={})
+        with patch('main._fit_prediction_model', wraps=main._fit_prediction_model) as mock_fit:
+            response = handleTrainPredictionModel(request)
+
+        data = json.loads(response.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data['samples'], 36)
+        rows = mock_fit.call_args.args[0]
+        # First race day has no history yet
+        self.assertEqual(rows[0][2:], [0.5, 0.5])
+        self.assertEqual(rows[3][2:], [0.0, 0.0])
+        stored = {c.args[1]['driverId']: c.args[1] for c in mock_db.batch.return_value.set.call_args_list}
+        self.assertEqual(stored['ava']['recentFinishPcts'], [1.0] * main.PREDICTION_FORM_RACES)
+        self.assertEqual(stored['jon']['tracks']['dells']['count'], 12)
+        self.assertIs(main._prediction_model_cache['model']['samples'], 36)
+
+
+class TestChampionshipSimulator(unittest.TestCase):
+    """Test cases for the Monte Carlo championship simulator."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        context = self.app.test_request_context()
+        context.push()
+        self.addCleanup(context.pop)
+        main._points_scheme_cache.update(schemes=None, loadedAt=0.0)
+        self.addCleanup(main._points_scheme_cache.update, schemes=None, loadedAt=0.0)
+        self.standings = _race_doc(
+            '2025',
+            version=12,
+            drivers={
+                'jon': {'driverId': 'jon', 'driverName': 'Jon', 'totalPoints': 200, 'racesEntered': 4},
+                'sam': {'driverId': 'sam', 'driverName': 'Sam', 'totalPoints': 190, 'racesEntered': 4},
+                'ava': {'driverId': 'ava', 'driverName': 'Ava', 'totalPoints': 40, 'racesEntered': 2},
+            },
+        )
+
+    def _db(self, cached=None):
+        mock_db = Mock()
+        self.refs = {}
+        mock_db.collection.return_value.document.side_effect = lambda doc_id: self.refs.setdefault(doc_id, Mock(id=doc_id))
+        cache_id = main._simulation_doc_id('2025', 2, 1000, 3)
+        cache_doc = _race_doc(cache_id, **cached) if cached else _missing_doc(cache_id)
+        mock_db.get_all.return_value = [self.standings, cache_doc]
+        mock_db.collection.return_value.stream.return_value = [_race_doc('asc', **ASC_SCHEME)]
+        history = [('jon', 50), ('jon', 50), ('sam', 60), ('sam', 40), ('ava', 20), ('ava', 20)]
+        mock_db.collection.return_value.where.return_value.select.return_value.stream.return_value = [
+            _race_doc(f'r{i}', driverId=driver, points=points) for i, (driver, points) in enumerate(history)
+        ]
+        return mock_db
+
+    def test_simulation_probabilities(self):
+        """Test a decisive lead wins every run and equal drivers split titles."""
+        tallies = _simulate_championship([500, 0], [[10], [10]], [1.0, 1.0], 3, 2000, 1, seed=1)
+        self.assertEqual(list(tallies['titles']), [2000, 0])
+
+        tallies = _simulate_championship([0, 0], [[0, 20], [0, 20]], [1.0, 1.0], 5, 4000, 2, seed=1)
+        self.assertAlmostEqual(tallies['titles'][0] / 4000, 0.5, delta=0.05)
+        self.assertEqual(sum(tallies['titles']), 4000)
+        self.assertEqual(list(tallies['topN']), [4000, 4000])
+
+    def test_large_runs_use_process_pool(self):
+        """Test large sample counts fan out and match the serial result."""
+        args = ([100, 90, 80], [[10, 30], [20, 25], [0, 50]], [1.0, 0.8, 0.5], 4, 4000, 2)
+        with patch('main.SIM_CHUNK_ELEMENTS', 12000):
+            serial = _simulate_championship(*args, seed=7)
+            with patch('main.SIM_PARALLEL_THRESHOLD', 2000), \
+                    patch('main.os.cpu_count', return_value=4), \
+                    patch('main.ProcessPoolExecutor', wraps=ThreadPoolExecutor) as mock_pool:
+                parallel = _simulate_championship(*args, seed=7)
+        mock_pool.assert_called_once_with(max_workers=4)
+        for key in serial:
+            self.assertEqual(list(serial[key]), list(parallel[key]))
+
+    @patch('main.firestore.client')
+    def test_simulation_cached_per_standings_version(self, mock_firestore_client):
+        """Test a fresh simulation is stored and reused until standings change."""
+        mock_db = self._db()
+        mock_firestore_client.return_value = mock_db
+        request = MockRequest(args={'season': '2025', 'remainingRaces': '2', 'simulations': '1000'})
+
+        response = handleSimulateChampionship(request)
+
+        data = json.loads(response.data)
+        self.assertFalse(data['cached'])
+        drivers = {d['driverId']: d for d in data['drivers']}
+        # A win from the back is 50 + 2 start + 2 gained, from pole 50 + 2 + 3
+        self.assertFalse(drivers['ava']['canStillWin'])
+        self.assertTrue(drivers['sam']['canStillWin'])
+        self.assertEqual(drivers['ava']['titleProbability'], 0.0)
+        self.assertAlmostEqual(drivers['jon']['titleProbability'] + drivers['sam']['titleProbability'], 1.0)
+        self.assertEqual(drivers['sam']['racesSampled'], 2)
+        stored = self.refs[main._simulation_doc_id('2025', 2, 1000, 3)].set.call_args.args[0]
+        self.assertEqual(stored['standingsVersion'], 12)
+        self.assertEqual(stored['result']['drivers'], data['drivers'])
+
+        cached = {'standingsVersion': 12, 'result': {'season': '2025', 'drivers': data['drivers']}}
+        mock_db = self._db(cached=cached)
+        mock_firestore_client.return_value = mock_db
+        response = handleSimulateChampionship(request)
+        self.assertTrue(json.loads(response.data)['cached'])
+        mock_db.collection.return_value.where.assert_not_called()
+
+        # A newer standings version ignores the stored run
+        self.standings.to_dict.side_effect = lambda: {'version': 13, 'drivers': {}}
+        mock_db = self._db(cached=cached)
+        mock_firestore_client.return_value = mock_db
+        response = handleSimulateChampionship(request)
+        self.assertEqual(response.status_code, 404)
+
+    @patch('main._seed_season_standings')
+    @patch('main.firestore.client')
+    def test_simulation_seeds_unbuilt_standings(self, mock_firestore_client, mock_seed):
+        """Test a season without materialized standings is seeded, and 404s only without results."""
+        drivers = self.standings.to_dict()['drivers']
+        self.standings = _missing_doc('2025')
+        mock_db = self._db()
+        mock_firestore_client.return_value = mock_db
+        mock_seed.return_value = drivers
+        request = MockRequest(args={'season': '2025', 'remainingRaces': '2', 'simulations': '1000'})
+
+        response = handleSimulateChampionship(request)
+
+        self.assertEqual(response.status_code, 200)
+        mock_seed.assert_called_once_with(mock_db, '2025')
+        self.assertEqual(json.loads(response.data)['standingsVersion'], 1)
+
+        mock_seed.return_value = {}
+        response = handleSimulateChampionship(request)
+        self.assertEqual(response.status_code, 404)
+
+    def test_simulation_requires_remaining_races(self):
+        """Test remainingRaces is required and bounded."""
+        response = handleSimulateChampionship(MockRequest(args={'season': '2025'}))
+        self.assertEqual(response.status_code, 400)
+        response = handleSimulateChampionship(MockRequest(args={'remainingRaces': '2', 'simulations': '10'}))
+        self.assertEqual(response.status_code, 400)
+
+
+ASC_SCHEME = {
+    'name': 'ASC',
+    'seasons': ['2025'],
+    'raceTypes': {
+        'Feature': {'points': [50, 46, 43], 'otherFinishers': 30, 'bonuses': {'perPositionGained': 1}},
+        '*': {'points': [10, 8, 6]},
+    },
+    'bonuses': {'start': 2, 'pole': 3},
+}
+
+
+class TestPointsSchemes(unittest.TestCase):
+    """Test cases for the points-scheme engine."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        context = self.app.test_request_context()
+        context.push()
+        self.addCleanup(context.pop)
+        self.admin_token = {'uid': 'admin_user_123', 'role': 'team-member'}
+        main._points_scheme_cache.update(schemes=None, loadedAt=0.0)
+        self.addCleanup(main._points_scheme_cache.update, schemes=None, loadedAt=0.0)
+
+    def _post(self, handler, json_data):
+        request = MockRequest(method='POST', headers={'Authorization': 'Bearer admin_token'}, json_data=json_data)
+        return handler(request)
+
+    def test_scheme_points_with_bonuses(self):
+        """Test table points, fallbacks and bonus rules."""
+        self.assertEqual(_scheme_points(ASC_SCHEME, {'raceType': 'Feature', 'finishPosition': 1, 'startPosition': 1}), 55)
+        self.assertEqual(_scheme_points(ASC_SCHEME, {'finishPosition': 2, 'startPosition': 6}), 52)
+        self.assertEqual(_scheme_points(ASC_SCHEME, {'raceType': 'Feature', 'finishPosition': 9}), 32)
+        # Race types without a table use "*"; bonuses still apply
+        self.assertEqual(_scheme_points(ASC_SCHEME, {'raceType': 'Heat', 'finishPosition': 3, 'startPosition': 1}), 11)
+        self.assertEqual(_scheme_points(ASC_SCHEME, {'raceType': 'Heat'}), 2)
+
+    def test_scheme_resolution(self):
+        """Test an explicit scheme wins over the season default."""
+        schemes = {'asc': ASC_SCHEME, 'k1': {'raceTypes': {'*': {'points': [1]}}}}
+        self.assertEqual(_points_scheme_for(schemes, {'season': 2025})[0], 'asc')
+        self.assertEqual(_points_scheme_for(schemes, {'season': '2025', 'pointsScheme': 'k1'})[0], 'k1')
+        self.assertEqual(_points_scheme_for(schemes, {'season': '2024'}), (None, None))
+
+    def test_validate_points_scheme(self):
+        """Test malformed tables and unknown bonus rules are reported."""
+        self.assertEqual(_validate_points_scheme(ASC_SCHEME), [])
+        errors = _validate_points_scheme({'raceTypes': {'Feature': {'points': [50, -1]}}, 'bonuses': {'laps': 1}})
+        self.assertIn('raceTypes.Feature.points must be a non-empty list of non-negative numbers', errors)
+        self.assertIn('bonuses.laps is not a known bonus rule', errors)
+
+    @patch('main._increment_user_counters')
+    @patch('main.auth.verify_id_token')
+    @patch('main.firestore.client')
+    def test_points_computed_at_ingest(self, mock_firestore_client, mock_verify_token, mock_counters):
+        """Test submitted points are replaced by the season's scheme unless overridden."""
+        mock_verify_token.return_value = self.admin_token
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        mock_db.collection.return_value.document.return_value.id = 'race_1'
+        mock_db.collection.return_value.stream.return_value = [_race_doc('asc', **ASC_SCHEME)]
+        race = dict(SAMPLE_RACES[0], raceDate='2025-06-01', points=999)
+
+        self._post(handleAddRaceResult, race)
+        self._post(handleAddRaceResult, dict(race, pointsOverride=True))
+        response = self._post(handleAddRaceResult, dict(race, pointsScheme='nope'))
+
+        written = [c.args[0] for c in mock_db.collection.return_value.document.return_value.set.call_args_list]
+        self.assertEqual((written[0]['points'], written[0]['pointsScheme']), (52, 'asc'))
+        self.assertEqual(written[1]['points'], 999)
+        self.assertNotIn('pointsScheme', written[1])
+        self.assertEqual(response.status_code, 400)
+        # Schemes are loaded once per instance
+        mock_db.collection.return_value.stream.assert_called_once()
+
+    @patch('main.auth.verify_id_token')
+    @patch('main.firestore.client')
+    def test_save_scheme_rejects_claimed_season(self, mock_firestore_client, mock_verify_token):
+        """Test a season can only default to one scheme."""
+        mock_verify_token.return_value = self.admin_token
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        mock_db.collection.return_value.stream.return_value = [_race_doc('asc', **ASC_SCHEME)]
+
+        response = self._post(handlePointsSchemes, dict(ASC_SCHEME, id='k1'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("already use scheme asc", json.loads(response.data)['errors'][0])
+
+        response = self._post(handlePointsSchemes, dict(ASC_SCHEME, id='asc', name='ASC 2025'))
+        self.assertEqual(response.status_code, 200)
+        mock_db.collection.return_value.document.return_value.set.assert_called_once()
+
+    @patch('main.auth.verify_id_token')
+    @patch('main.firestore.client')
+    def test_what_if_writes_nothing(self, mock_firestore_client, mock_verify_token):
+        """Test an inline scheme returns alternate standings without writes."""
+        mock_verify_token.return_value = self.admin_token
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        mock_db.collection.return_value.stream.return_value = []
+        mock_db.collection.return_value.where.return_value.select.return_value.stream.return_value = [
+            _race_doc('r1', driverId='jon', season='2025', raceType='Feature', finishPosition=1, points=40),
+            _race_doc('r2', driverId='sam', season='2025', raceType='Feature', finishPosition=2, points=50),
+            _race_doc('r3', driverId='sam', season='2025', raceType='Feature', finishPosition=1, points=25, pointsOverride=True),
+        ]
+        winner_takes_all = {'raceTypes': {'*': {'points': [100]}}}
+
+        response = self._post(handleRecomputeSeasonPoints, {'season': 2025, 'scheme': winner_takes_all, 'dryRun': True})
+
+        data = json.loads(response.data)
+        self.assertEqual(data['resultsChanged'], 2)
+        self.assertEqual([(d['driverId'], d['totalPoints']) for d in data['standings']], [('jon', 100), ('sam', 25)])
+        mock_db.batch.assert_not_called()
+
+        response = self._post(handleRecomputeSeasonPoints, {'season': 2025, 'scheme': winner_takes_all})
+        self.assertEqual(response.status_code, 400)
+
+    def _recompute_db(self, mock_firestore_client, pending=()):
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        mock_db.collection.return_value.stream.return_value = [_race_doc('asc', **ASC_SCHEME)]
+        mock_db.collection.return_value.document.return_value.id = 'rc1'
+        mock_db.collection.return_value.where.return_value.where.return_value.stream.return_value = list(pending)
+        self.commit_time = datetime(2025, 6, 2, 12, 0)
+        mock_db.batch.return_value.commit.return_value = [Mock(update_time=self.commit_time)]
+        return mock_db
+
+    @patch('main._bump_career_versions')
+    @patch('main._apply_rollup_changes', return_value=True)
+    @patch('main._apply_standings_changes')
+    @patch('main.auth.verify_id_token')
+    @patch('main.firestore.client')
+    def test_recompute_updates_results_and_views_once(self, mock_firestore_client, mock_verify_token,
+                                                      mock_standings, mock_rollups, mock_careers):
+        """Test changed results are tagged and standings and rollups move once."""
+        mock_verify_token.return_value = self.admin_token
+        mock_db = self._recompute_db(mock_firestore_client)
+        jon = {'driverId': 'jon', 'season': '2025', 'trackName': 'Dells', 'raceType': 'Feature',
+               'finishPosition': 1, 'points': 40}
+        unchanged = _race_doc('r2', driverId='sam', season='2025', trackName='Dells', raceType='Heat',
+                              finishPosition=1, points=12, pointsScheme='asc')
+        mock_db.collection.return_value.where.return_value.select.return_value.stream.return_value = [
+            _race_doc('r1', **jon), unchanged,
+        ]
+
+        response = self._post(handleRecomputeSeasonPoints, {'season': '2025'})
+
+        data = json.loads(response.data)
+        self.assertEqual(data['recomputeId'], 'rc1')
+        self.assertEqual(data['changes'], [{'raceId': 'r1', 'driverId': 'jon', 'raceDate': None, 'raceType': 'Feature',
+                                             'finishPosition': 1, 'pointsBefore': 40, 'pointsAfter': 52}])
+        recompute_ref = mock_db.collection.return_value.document.return_value
+        logged = recompute_ref.set.call_args.args[0]
+        self.assertEqual((logged['status'], logged['pointsBefore']), ('pending', {'r1': {'points': 40, 'pointsScheme': None}}))
+        batch = mock_db.batch.return_value
+        batch.commit.assert_called_once()
+        self.assertEqual(batch.update.call_args.args[1], {'points': 52, 'pointsScheme': 'asc', 'pointsRecomputeId': 'rc1'})
+        batch.set.assert_not_called()
+
+        changes = [(jon, dict(jon, points=52, pointsScheme='asc'))]
+        for mock_view in (mock_standings, mock_rollups):
+            mock_view.assert_called_once_with(mock_db, changes, as_of=self.commit_time, event_id='recompute-rc1')
+        mock_careers.assert_called_once_with(mock_db, ['jon'])
+        self.assertEqual(recompute_ref.update.call_args.args[0]['status'], 'applied')
+
+        # The tagged writes do not fan out through the trigger
+        event = _change_event(jon, dict(jon, points=52, pointsScheme='asc', pointsRecomputeId='rc1'))
+        main.handleRaceResultWritten.__wrapped__(event)
+        mock_standings.assert_called_once()
+
+    @patch('main._bump_career_versions')
+    @patch('main._apply_rollup_changes', side_effect=[False, True, True])
+    @patch('main._apply_standings_changes')
+    @patch('main.auth.verify_id_token')
+    @patch('main.firestore.client')
+    def test_retry_resumes_pending_recompute(self, mock_firestore_client, mock_verify_token,
+                                             mock_standings, mock_rollups, mock_careers):
+        """Test a recompute whose views failed is applied by the next request."""
+        mock_verify_token.return_value = self.admin_token
+        mock_db = self._recompute_db(mock_firestore_client)
+        race = {'driverId': 'jon', 'season': '2025', 'raceType': 'Feature', 'finishPosition': 1, 'points': 40}
+        mock_db.collection.return_value.where.return_value.select.return_value.stream.return_value = [
+            _race_doc('r1', **race),
+        ]
+
+        response = self._post(handleRecomputeSeasonPoints, {'season': '2025'})
+        self.assertEqual(response.status_code, 503)
+        recompute_ref = mock_db.collection.return_value.document.return_value
+        recompute_ref.update.assert_called_once_with({'committedAt': self.commit_time})
+
+        # The retry scans an already rescored season and finds nothing to change
+        rescored = dict(race, points=52, pointsScheme='asc', pointsRecomputeId='rc1')
+        pending = _race_doc('rc1', season='2025', status='pending', committedAt=self.commit_time,
+                            pointsBefore={'r1': {'points': 40, 'pointsScheme': None}, 'r9': {'points': 3}})
+        pending.reference.id = 'rc1'
+        mock_db = self._recompute_db(mock_firestore_client, pending=[pending])
+        mock_db.get_all.return_value = [_race_doc('r1', **rescored), _race_doc('r9', points=3)]
+        mock_db.collection.return_value.where.return_value.select.return_value.stream.return_value = [
+            _race_doc('r1', **rescored),
+        ]
+
+        response = self._post(handleRecomputeSeasonPoints, {'season': '2025'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)['resultsChanged'], 0)
+        # Only the result the pending run committed is moved
+        resumed = [(dict(rescored, points=40, pointsScheme=None), rescored)]
+        mock_rollups.assert_called_with(mock_db, resumed, as_of=self.commit_time, event_id='recompute-rc1')
+        pending.reference.update.assert_called_once()
+        mock_db.batch.assert_not_called()
+
+    def test_scheme_without_race_type_keeps_points(self):
+        """Test a scheme with no table for a race type leaves its points alone."""
+        schemes = {'k1': {'seasons': ['2025'], 'raceTypes': {'Feature': {'points': [10]}}}}
+        race = {'season': '2025', 'raceType': 'Heat', 'finishPosition': 1, 'points': 7}
+        self.assertIsNone(_scheme_points(schemes['k1'], race))
+        self.assertIsNone(main._apply_points_scheme(race, schemes))
+        self.assertEqual(race, {'season': '2025', 'raceType': 'Heat', 'finishPosition': 1, 'points': 7})
+
+    @patch('main._rate_event')
+    @patch('main._update_track_records')
+    @patch('main._apply_standings_changes')
+    @patch('main.firestore.client')
+    def test_trigger_points_change_skips_records(self, mock_firestore_client, mock_standings, mock_records, mock_rate):
+        """Test a rescored result moves standings only."""
+        race = {'driverId': 'jon', 'season': '2025', 'finishPosition': 1, 'points': 40}
+
+        main.handleRaceResultWritten.__wrapped__(_change_event(race, dict(race, points=52, pointsScheme='asc')))
+
+        mock_standings.assert_called_once()
+        mock_records.assert_not_called()
+        mock_rate.assert_not_called()
+
+
+class TestDriverCareer(unittest.TestCase):
+    """Test cases for the cached multi-season career summary."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        context = self.app.test_request_context()
+        context.push()
+        self.addCleanup(context.pop)
+        finishes = {'2024': [8, 6, 7, 5], '2025': [4, 3, 2, 1, 2, 3]}
+        self.races = [
+            {'driverName': 'Jon', 'season': season, 'raceDate': f'{season}-06-{i + 1:02d}',
+             'finishPosition': finish, 'startPosition': finish + 2, 'points': 50 - finish}
+            for season, values in finishes.items()
+            for i, finish in enumerate(values)
+        ]
+
+    def _db(self):
+        mock_db = Mock()
+        # Results come back unordered
+        mock_db.collection.return_value.where.return_value.select.return_value.stream.return_value = [
+            _race_doc(f'race{i}', **race) for i, race in reversed(list(enumerate(self.races)))
+        ]
+        return mock_db
+
+    def test_career_table_and_trends(self):
+        """Test the season table, moving average and slopes."""
+        career = _driver_career(self._db(), 'jon')
+
+        self.assertEqual([row['season'] for row in career['seasons']], ['2024', '2025'])
+        self.assertEqual(career['career']['totalRaces'], 10)
+        self.assertEqual(career['career']['seasons'], 2)
+        self.assertEqual(career['seasons'][1]['wins'], 1)
+        self.assertEqual(career['seasons'][0]['pointsPerStart'], 43.5)
+        self.assertEqual(career['seasons'][0]['finishTrend'], -0.8)
+        moving = career['trends']['movingAverageFinish']
+        self.assertIsNone(moving[3]['movingAverage'])
+        self.assertEqual(moving[4]['movingAverage'], 6.0)
+        self.assertEqual(career['seasons'][0]['endOfSeasonForm'], None)
+        self.assertEqual(career['seasons'][1]['endOfSeasonForm'], 2.2)
+        self.assertLess(career['trends']['improvementSlope'], 0)
+        self.assertEqual(career['trends']['seasonOverSeasonSlope'], -4.0)
+
+    def test_career_table_matches_scanned_results(self):
+        """Test season totals are folded from the same results as the trends."""
+        mock_db = self._db()
+
+        career = _driver_career(mock_db, 'jon')
+
+        mock_db.collection.assert_called_once_with('race_results')
+        self.assertEqual(career['seasons'][1]['totalRaces'], 6)
+        self.assertEqual(career['seasons'][1]['avgFinishPosition'], 2.5)
+        self.assertEqual(career['career']['totalPoints'], sum(r['points'] for r in self.races))
+
+    @patch('main.firestore.client')
+    def test_career_cached_until_new_result(self, mock_firestore_client):
+        """Test the summary is stored with its version and served while current."""
+        mock_db = self._db()
+        mock_firestore_client.return_value = mock_db
+        cache_ref = mock_db.collection.return_value.document.return_value
+        cache_ref.get.return_value = _race_doc('jon', version=3)
+
+        response = handleGetDriverCareer(MockRequest(args={'driverId': 'jon'}))
+
+        data = json.loads(response.data)
+        self.assertFalse(data['cached'])
+        stored = cache_ref.set.call_args.args[0]
+        self.assertEqual(stored['summaryVersion'], 3)
+
+        cache_ref.get.return_value = _race_doc('jon', version=3, summary=stored['summary'], summaryVersion=3)
+        mock_db.collection.return_value.where.reset_mock()
+        response = handleGetDriverCareer(MockRequest(args={'driverId': 'jon'}))
+        self.assertTrue(json.loads(response.data)['cached'])
+        mock_db.collection.return_value.where.assert_not_called()
+
+    @patch('main._rate_event')
+    @patch('main._update_track_records')
+    @patch('main._apply_rollup_changes')
+    @patch('main._apply_standings_changes')
+    @patch('main._increment_user_counters')
+    @patch('main.firestore.client')
+    def test_trigger_invalidates_career(self, mock_firestore_client, mock_counters, *_):
+        """Test a result moving between drivers invalidates both careers and moves the race count."""
+        mock_db = Mock()
+        mock_firestore_client.return_value = mock_db
+        race = {'driverId': 'jon', 'season': '2025', 'points': 40}
+
+        event = _change_event(race, dict(race, driverId='sam'))
+        main.handleRaceResultWritten.__wrapped__(event)
+
+        bumped = [c.args[0] for c in mock_db.collection.return_value.document.call_args_list]
+        self.assertEqual(bumped, ['jon', 'sam'])
+        update = mock_db.collection.return_value.document.return_value.set.call_args
+        self.assertEqual(update.args[0]['version'].value, 1)
+        self.assertEqual(update.kwargs, {'merge': True})
+        self.assertEqual(mock_counters.call_args_list, [
+            call(mock_db, 'jon', as_of=event.time, event_id=event.id, view='counters_before', racesEntered=-1),
+            call(mock_db, 'sam', as_of=event.time, event_id=event.id, view='counters_after', racesEntered=1),
+        ])
+
+        # A delete takes the race back off the driver's count; an edit leaves it
+        mock_counters.reset_mock()
+        event = _change_event(race, None)
+        main.handleRaceResultWritten.__wrapped__(event)
+        mock_counters.assert_called_once_with(
+            mock_db, 'jon', as_of=event.time, event_id=event.id, view='counters_before', racesEntered=-1
+        )
+        mock_counters.reset_mock()
+        main.handleRaceResultWritten.__wrapped__(_change_event(race, dict(race, points=45)))
+        mock_counters.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()